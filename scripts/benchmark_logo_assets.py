@@ -0,0 +1,579 @@
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import generate_logo_assets as assets
+import logo_cleaning as cleaning
+import logo_stages as stages
+import logo_tiles as tiles
+
+BENCHMARK_SIZES = (256, 1024, 2048, 4096)
+HISTORY_PATH = assets.CACHE_DIR / "benchmark-history.json"
+REFERENCE_MATTE = (154, 14, 31)
+REFERENCE_CREAM = (238, 226, 196)
+FOREGROUND_GOLD = (218, 175, 62)
+PYRAMID_SIZES = (512, 256, 180, 64, 32, 16)
+PYRAMID_MIN_PSNR = 40.0
+PARITY_CLASSIFIERS = (
+    ("red_contam", cleaning.red_contam_mask, cleaning.is_red_contam),
+    ("bright_red_contam", cleaning.bright_red_contam_mask, cleaning.is_bright_red_contam),
+    ("dark_edge_matte", cleaning.dark_edge_matte_mask, cleaning.is_dark_edge_matte),
+)
+PARITY_LATTICE = np.arange(0, 256, 17, dtype=np.uint8)  # RGB levels every alpha is checked against
+FILL_PARITY_CASES = 60  # random images, each with a red island walled off from every donor by transparency
+FILL_PARITY_TILE = 8  # smaller than the islands' walls, so the tiled fill defers them to its tiled donor search
+
+
+def best_of(runs: int, action: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def classification_scans(canvas: Image.Image, runs: int = 3) -> dict[str, float]:
+    pixels = np.asarray(canvas.convert("RGBA"))
+    flattened = [tuple(pixel) for pixel in pixels.reshape(-1, 4).tolist()]
+    cleaning.classifier_lut()
+
+    def rule_mask() -> np.ndarray:
+        return (pixels[..., 3] > 0) & cleaning.red_family_mask(pixels) & ~cleaning.gold_family_mask(pixels)
+
+    return {
+        "scalarReference": best_of(runs, lambda: sum(1 for pixel in flattened if cleaning.is_red_contam(pixel))),
+        "vectorRules": best_of(runs, lambda: np.count_nonzero(rule_mask())),
+        "vectorLut": best_of(runs, lambda: np.count_nonzero(cleaning.red_contam_mask(pixels))),
+    }
+
+
+def classifier_mismatches(pixels: np.ndarray) -> dict[str, int]:
+    rows = [tuple(pixel) for pixel in pixels.tolist()]
+    return {
+        name: int(np.count_nonzero(mask(pixels) != np.fromiter(map(scalar, rows), dtype=bool, count=len(rows))))
+        for name, mask, scalar in PARITY_CLASSIFIERS
+    }
+
+
+def check_classifier_parity() -> list[str]:
+    """Compare every vector classifier with its scalar reference, bit for bit.
+
+    The whole RGB cube is checked at alpha 255, where every colour rule is live, and every alpha is checked
+    over a 16-level RGB lattice, which covers the alpha thresholds from both sides.
+    """
+    mismatches = {name: 0 for name, _, _ in PARITY_CLASSIFIERS}
+    block = np.empty((1 << 16, 4), dtype=np.uint8)
+    green_blue = np.arange(1 << 16, dtype=np.uint32)
+    block[:, 1], block[:, 2], block[:, 3] = green_blue >> 8, green_blue & 255, 255
+    for red in range(256):
+        block[:, 0] = red
+        for name, count in classifier_mismatches(block).items():
+            mismatches[name] += count
+    grid = np.meshgrid(PARITY_LATTICE, PARITY_LATTICE, PARITY_LATTICE, indexing="ij")
+    lattice = np.stack(grid, axis=-1).reshape(-1, 3)
+    for alpha in range(256):
+        pixels = np.column_stack([lattice, np.full(len(lattice), alpha, dtype=np.uint8)])
+        for name, count in classifier_mismatches(pixels).items():
+            mismatches[name] += count
+    checked = (1 << 24) + 256 * len(lattice)
+    failures = []
+    for name, count in mismatches.items():
+        print(f"parity={name} pixels={checked} mismatches={count}")
+        if count:
+            failures.append(name)
+    return failures
+
+
+def scalar_nearest_non_red_fill(foreground: Image.Image) -> tuple[Image.Image, int, int]:
+    """The historic set-and-deque fill that nearest_non_red_fill(metric="bfs") must reproduce exactly.
+
+    Its fallback visits the red pixels the queue never reached in raster order, the documented order, rather
+    than in the order the interpreter happens to iterate a set of coordinate tuples.
+    """
+    rgba = foreground.convert("RGBA")
+    width, height = rgba.size
+    pixels = rgba.load()
+    red_points: set[tuple[int, int]] = set()
+    queue: deque[tuple[int, int]] = deque()
+    for y in range(height):
+        for x in range(width):
+            pixel = pixels[x, y]
+            if cleaning.is_red_contam(pixel):
+                red_points.add((x, y))
+            elif pixel[3] > 40:
+                queue.append((x, y))
+    red_before = len(red_points)
+    if not red_points:
+        return rgba, 0, 0
+
+    filled_from = {point: pixels[point[0], point[1]] for point in queue}
+    visited = set(queue)
+    while queue and red_points:
+        x, y = queue.popleft()
+        source_pixel = filled_from[(x, y)]
+        for dx, dy in cleaning.FILL_DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if nx < 0 or ny < 0 or nx >= width or ny >= height or (nx, ny) in visited:
+                continue
+            visited.add((nx, ny))
+            if (nx, ny) in red_points:
+                pixels[nx, ny] = source_pixel
+                filled_from[(nx, ny)] = source_pixel
+                red_points.remove((nx, ny))
+                queue.append((nx, ny))
+            elif pixels[nx, ny][3] > 40:
+                filled_from[(nx, ny)] = pixels[nx, ny]
+                queue.append((nx, ny))
+
+    for x, y in sorted(red_points, key=lambda point: (point[1], point[0])):
+        for radius in range(1, max(width, height)):
+            replacement = next(
+                (
+                    pixels[nx, ny]
+                    for ny in range(max(0, y - radius), min(height, y + radius + 1))
+                    for nx in range(max(0, x - radius), min(width, x + radius + 1))
+                    if pixels[nx, ny][3] > 40 and not cleaning.is_red_contam(pixels[nx, ny])
+                ),
+                None,
+            )
+            if replacement is not None:
+                pixels[x, y] = replacement
+                red_points.remove((x, y))
+                break
+    red_after = sum(1 for y in range(height) for x in range(width) if cleaning.is_red_contam(pixels[x, y]))
+    return rgba, red_before, red_after
+
+
+def walled_red_island(seed: int) -> Image.Image:
+    """Random pixels, heavy in red, around a red square that only the fill's square-scan fallback can reach."""
+    rng = np.random.default_rng(seed)
+    height, width = (int(value) for value in rng.integers(20, 90, size=2))
+    pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    pixels[..., 0] = np.maximum(pixels[..., 0], rng.integers(0, 256, (height, width)).astype(np.uint8))
+    size = int(rng.integers(2, 7))
+    y, x = int(rng.integers(2, height - size - 2)), int(rng.integers(2, width - size - 2))
+    pixels[y - 1 : y + size + 1, x - 1 : x + size + 1] = 0
+    pixels[y : y + size, x : x + size] = (200, 20, 20, 255)
+    return Image.fromarray(pixels)
+
+
+def check_fill_parity(cases: int = FILL_PARITY_CASES) -> list[str]:
+    mismatched = tiled_mismatched = 0
+    for seed in range(cases):
+        image = walled_red_island(seed)
+        filled, *stats = cleaning.nearest_non_red_fill(image)
+        expected, *expected_stats = scalar_nearest_non_red_fill(image)
+        if stats != expected_stats or not np.array_equal(np.asarray(filled), np.asarray(expected)):
+            mismatched += 1
+        source = np.asarray(image)
+        tiled = np.empty_like(source)
+        tiled_stats = tiles.tiled_nearest_non_red_fill(source, tiled, FILL_PARITY_TILE)
+        if list(tiled_stats) != expected_stats or not np.array_equal(tiled, np.asarray(expected)):
+            tiled_mismatched += 1
+    print(f"parity=nearest_non_red_fill cases={cases} mismatches={mismatched}")
+    print(f"parity=tiled_nearest_non_red_fill cases={cases} tile={FILL_PARITY_TILE} mismatches={tiled_mismatched}")
+    return ["nearest_non_red_fill"] * bool(mismatched) + ["tiled_nearest_non_red_fill"] * bool(tiled_mismatched)
+
+
+def glyph_coverage(size: int) -> np.ndarray:
+    """Anti-aliased ring-and-stem lettermark standing in for the real reference glyph."""
+    scale = 4
+    canvas = size * scale
+    mask = Image.new("L", (canvas, canvas), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((canvas * 0.14, canvas * 0.18, canvas * 0.86, canvas * 0.9), fill=255)
+    draw.ellipse((canvas * 0.32, canvas * 0.36, canvas * 0.68, canvas * 0.72), fill=0)
+    draw.rectangle((canvas * 0.45, canvas * 0.08, canvas * 0.55, canvas * 0.94), fill=255)
+    return np.asarray(mask.resize((size, size), Image.Resampling.BOX))
+
+
+def defect_count(size: int, density: float, per_256: float) -> int:
+    # Defects live along edges and strokes, so their count scales with the side length, not the area.
+    return int(round(per_256 * density * size / 256))
+
+
+def synthetic_reference(size: int, density: float = 1.0, seed: int = 0) -> Image.Image:
+    """A cream glyph on the red tile matte, with red fringe bleeding into the anti-aliased edge."""
+    rng = np.random.default_rng(seed)
+    coverage = glyph_coverage(size).astype(np.float64) / 255
+    shading = 1 - 0.12 * np.linspace(0, 1, size)[:, None]
+    cream = np.array(REFERENCE_CREAM, dtype=np.float64) * shading[..., None]
+    matte = np.array(REFERENCE_MATTE, dtype=np.float64)
+    pixels = cream * coverage[..., None] + matte * (1 - coverage[..., None])
+    edge = np.flatnonzero((coverage > 0) & (coverage < 1))
+    fringe = rng.choice(edge, size=min(edge.size, defect_count(size, density, 160)), replace=False)
+    pixels.reshape(-1, 3)[fringe] = rng.integers((150, 10, 10), (235, 90, 80), size=(fringe.size, 3))
+    pixels += rng.normal(0, 2.5, pixels.shape)
+    return Image.fromarray(np.clip(np.round(pixels), 0, 255).astype(np.uint8), "RGB")
+
+
+def synthetic_foreground(size: int, density: float = 1.0, seed: int = 0) -> Image.Image:
+    """A gold glyph on transparency carrying every defect class the cleaning stages repair.
+
+    Red fringe and dark edge matte sit on the glyph outline (the matte inside the top band the edge repair
+    scans), alpha scratches cut short transparent runs into opaque strokes, and surface speckles are small
+    off-colour blocks inside the glyph.
+    """
+    rng = np.random.default_rng(seed)
+    coverage = glyph_coverage(size)
+    pixels = np.zeros((size, size, 4), dtype=np.uint8)
+    pixels[..., :3] = FOREGROUND_GOLD
+    pixels[..., 3] = coverage
+    visible = coverage > 0
+    shade = rng.integers(-8, 9, size=(size, size, 3))
+    pixels[..., :3] = np.where(visible[..., None], np.clip(pixels[..., :3] + shade, 0, 255), 0)
+
+    edge = visible & (cleaning.window_counts(cleaning.integral_image(~visible), 1, 1) > 0)
+    edge_ys, edge_xs = np.nonzero(edge)
+    fringe = rng.choice(edge_ys.size, size=min(edge_ys.size, defect_count(size, density, 120)), replace=False)
+    pixels[edge_ys[fringe], edge_xs[fringe]] = np.column_stack(
+        [rng.integers(150, 235, fringe.size), rng.integers(10, 60, fringe.size), rng.integers(10, 50, fringe.size),
+         rng.integers(60, 256, fringe.size)]
+    )
+    top_edge = np.flatnonzero(edge_ys < min(95, size))
+    matte = rng.choice(top_edge, size=min(top_edge.size, defect_count(size, density, 24)), replace=False)
+    pixels[edge_ys[matte], edge_xs[matte]] = np.column_stack(
+        [rng.integers(45, 125, matte.size), rng.integers(0, 25, matte.size), rng.integers(0, 20, matte.size),
+         rng.integers(80, 256, matte.size)]
+    )
+
+    solid_ys, solid_xs = np.nonzero(coverage == 255)
+    for index in rng.choice(solid_ys.size, size=defect_count(size, density, 6), replace=False):
+        y, x = int(solid_ys[index]), int(solid_xs[index])
+        if rng.random() < 0.5:
+            pixels[y, max(0, x - 3) : x + 3, 3] = rng.integers(0, 40)
+        else:
+            pixels[max(0, y - 2) : y + 2, x, 3] = rng.integers(0, 40)
+    speckle_colours = np.array([(255, 255, 255), (30, 20, 10), (90, 60, 20), (250, 240, 200)], dtype=np.uint8)
+    for index in rng.choice(solid_ys.size, size=defect_count(size, density, 30), replace=False):
+        y, x, block = int(solid_ys[index]), int(solid_xs[index]), int(rng.integers(1, 4))
+        pixels[y : y + block, x : x + block, :3] = speckle_colours[rng.integers(speckle_colours.shape[0])]
+    return Image.fromarray(pixels)
+
+
+def end_to_end(reference: Image.Image) -> None:
+    source = cleaning.extract_reference_foreground(reference)
+    foreground = source.crop(cleaning.visible_bounds(source))
+    clean, _, _ = cleaning.nearest_non_red_fill(foreground)
+    clean, _, _ = cleaning.repair_outer_edge_matte(clean)
+    clean, _, _ = cleaning.repair_alpha_scratches(clean)
+    clean, *_ = cleaning.repair_lettermark_surface_outliers(clean)
+    clean = cleaning.clear_transparent_rgb(cleaning.polish_lettermark(clean))
+    canvas = Image.new("RGBA", source.size, (0, 0, 0, 0))
+    canvas.alpha_composite(clean, cleaning.visible_bounds(source)[:2])
+    rich, *_ = assets.compose_rich_favicon(clean)
+    assets.compose_padded_logo(canvas)
+    assets.compose_flat_favicon_source(clean)
+    assets.count_red_pixels(rich, 96)
+    assets.count_flat_foreground_pixels(rich.resize((32, 32), Image.Resampling.LANCZOS))
+
+
+def premultiplied(image: Image.Image) -> np.ndarray:
+    pixels = np.asarray(image.convert("RGBA"), dtype=np.float64)
+    return np.concatenate([pixels[..., :3] * pixels[..., 3:] / 255, pixels[..., 3:]], axis=-1)
+
+
+def pyramid_quality(master: Image.Image, sizes: tuple[int, ...] = PYRAMID_SIZES) -> dict[int, tuple[float, float]]:
+    """PSNR and largest channel delta of each pyramid render against a direct LANCZOS resize of the master."""
+    pyramid = assets.RenderPyramid(master)
+    quality = {}
+    for size in sizes:
+        direct = premultiplied(master.resize((size, size), Image.Resampling.LANCZOS))
+        error = premultiplied(pyramid.render(size)) - direct
+        mean_square = float(np.mean(error**2))
+        psnr = 10 * np.log10(255**2 / mean_square) if mean_square else float("inf")
+        quality[size] = (psnr, float(np.abs(error).max()))
+    return quality
+
+
+def pyramid_masters(density: float, seed: int) -> dict[str, Image.Image]:
+    foreground = synthetic_foreground(1024, density, seed)
+    masters = {
+        "syntheticFlat": assets.compose_flat_favicon_source(foreground),
+        "syntheticPadded": assets.compose_padded_logo(foreground),
+    }
+    committed = (("flatFavicon", assets.TELEBA / "app" / "icon.png"), ("padded", assets.ZESHA / "assets" / "icon.png"))
+    for name, path in committed:
+        if path.exists():
+            masters[name] = Image.open(path).convert("RGBA")
+    return masters
+
+
+def check_pyramid_quality(density: float, seed: int) -> list[str]:
+    failures = []
+    for name, master in pyramid_masters(density, seed).items():
+        for size, (psnr, max_delta) in pyramid_quality(master).items():
+            status = "ok" if psnr >= PYRAMID_MIN_PSNR else "degraded"
+            print(f"pyramid={name} size={size} psnr={psnr:.1f} maxDelta={max_delta:.1f} status={status}")
+            if status == "degraded":
+                failures.append(f"{name}@{size}")
+    return failures
+
+
+def clean_untiled(foreground: Image.Image) -> tuple[np.ndarray, tuple[object, ...]]:
+    filled, *fill = cleaning.nearest_non_red_fill(foreground)
+    matted, *edge = cleaning.repair_outer_edge_matte(filled)
+    scratched, *scratch = cleaning.repair_alpha_scratches(matted)
+    surfaced, *surface = cleaning.repair_lettermark_surface_outliers(scratched)
+    cleaned = cleaning.clear_transparent_rgb(cleaning.polish_lettermark(surfaced))
+    return np.asarray(cleaned), (tuple(fill), tuple(edge), tuple(scratch), tuple(surface))
+
+
+def traced_peak(action: Callable[[], object]) -> tuple[object, int]:
+    tracemalloc.start()
+    try:
+        result = action()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def check_tiled_parity(sizes: list[int], density: float, seed: int, tile: int) -> list[str]:
+    """Run the cleaning chain untiled and tiled on each size, reporting parity and traced peak memory."""
+    failures = []
+    for size in sizes:
+        foreground = synthetic_foreground(size, density, seed)
+        pixels = np.asarray(foreground)
+        (untiled, untiled_stats), untiled_peak = traced_peak(lambda: clean_untiled(foreground))
+        with tempfile.TemporaryDirectory(prefix="logo-tiles-") as scratch:
+            (tiled, *tiled_stats), tiled_peak = traced_peak(
+                lambda: tiles.clean_foreground_tiled(pixels, tile, Path(scratch))
+            )
+            same = np.array_equal(tiled, untiled) and tuple(tiled_stats) == untiled_stats
+            del tiled
+        status = "ok" if same else "mismatch"
+        print(
+            f"tiled={size} tile={tile} parity={status} "
+            f"untiledPeakBytes={untiled_peak} tiledPeakBytes={tiled_peak}"
+        )
+        if not same:
+            failures.append(str(size))
+    return failures
+
+
+CLEANING_STAGE_COUNT = 6  # image stages the copying chain runs, each converting and copying its input
+
+
+def copy_round_trips(image: Image.Image) -> Image.Image:
+    for _ in range(CLEANING_STAGE_COUNT):
+        image = Image.fromarray(np.array(image.convert("RGBA")))
+    return image
+
+
+def check_in_place_chain(sizes: list[int], density: float, seed: int, runs: int) -> list[str]:
+    """Compare the in-place cleaning chain with the per-stage copying one: parity, traced peak memory, and the
+    time the copying chain spends on its per-stage conversions alone."""
+    failures = []
+    for size in sizes:
+        foreground = synthetic_foreground(size, density, seed)
+        (copied, copied_stats), copying_peak = traced_peak(lambda: clean_untiled(foreground))
+        (cleaned, *stats), in_place_peak = traced_peak(lambda: cleaning.clean_foreground(foreground))
+        same = np.array_equal(np.asarray(cleaned), copied) and tuple(stats) == copied_stats
+        copy_seconds = best_of(runs, lambda: copy_round_trips(foreground))
+        status = "ok" if same else "mismatch"
+        print(
+            f"inPlace={size} parity={status} copyingPeakBytes={copying_peak} "
+            f"inPlacePeakBytes={in_place_peak} copySeconds={copy_seconds:.4f}"
+        )
+        if not same:
+            failures.append(str(size))
+    return failures
+
+
+def stage_benchmarks(size: int, density: float, seed: int) -> dict[str, Callable[[], object]]:
+    reference = synthetic_reference(size, density, seed)
+    foreground = synthetic_foreground(size, density, seed)
+    pixels = np.asarray(foreground)
+    tile = assets.dimensional_fill(size)
+    outline = assets.LettermarkPath((size, size), *assets.trace_lettermark(foreground))
+
+    def uncached_end_to_end() -> None:
+        assets.rounded_tile_pixels.cache_clear()
+        end_to_end(reference)
+
+    return {
+        "extract_reference_foreground": lambda: cleaning.extract_reference_foreground(reference),
+        "nearest_non_red_fill": lambda: cleaning.nearest_non_red_fill(foreground),
+        "nearest_non_red_fill[euclidean]": lambda: cleaning.nearest_non_red_fill(foreground, metric="euclidean"),
+        "repair_outer_edge_matte": lambda: cleaning.repair_outer_edge_matte(foreground),
+        "repair_alpha_scratches": lambda: cleaning.repair_alpha_scratches(foreground),
+        "repair_lettermark_surface_outliers": lambda: cleaning.repair_lettermark_surface_outliers(foreground),
+        "collect_lettermark_surface_outliers": lambda: cleaning.collect_lettermark_surface_outliers(foreground),
+        "clean_foreground": lambda: cleaning.clean_foreground(foreground),
+        "clean_foreground[copying]": lambda: clean_untiled(foreground),
+        "dimensional_fill": lambda: assets.dimensional_fill(size),
+        "count_red_pixels": lambda: assets.count_red_pixels(foreground),
+        "count_flat_foreground_pixels": lambda: assets.count_flat_foreground_pixels(foreground),
+        "red_contam_mask": lambda: cleaning.red_contam_mask(pixels),
+        "pyramid_renders": lambda: [
+            assets.RenderPyramid(tile).render(size) for size in PYRAMID_SIZES if size < tile.width
+        ],
+        "direct_renders": lambda: [
+            tile.resize((size, size), Image.Resampling.LANCZOS) for size in PYRAMID_SIZES if size < tile.width
+        ],
+        "trace_lettermark": lambda: assets.trace_lettermark(foreground),
+        "lettermark_renders[vector]": lambda: [
+            outline.render(size, size) for size in PYRAMID_SIZES if size < foreground.width
+        ],
+        "lettermark_renders[lanczos]": lambda: [
+            foreground.resize((size, size), Image.Resampling.LANCZOS)
+            for size in PYRAMID_SIZES
+            if size < foreground.width
+        ],
+        "end_to_end": uncached_end_to_end,
+    }
+
+
+def run_benchmarks(sizes: list[int], density: float, seed: int, runs: int, only: str | None) -> dict[str, float]:
+    # Measure the computation itself: stages and tiles run without caches, so nothing comes from disk.
+    cleaning.classifier_lut()
+    results: dict[str, float] = {}
+    for size in sizes:
+        for name, action in stage_benchmarks(size, density, seed).items():
+            key = f"{name}@{size}"
+            if only is not None and only not in key:
+                continue
+            seconds = best_of(runs, action)
+            results[key] = seconds
+            print(f"benchmark={key} seconds={seconds:.4f} mpixPerSecond={size * size / seconds / 1e6:.2f}")
+    return results
+
+
+def git_revision() -> str:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=assets.SCRIPT_DIR, capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    return f"{commit}+dirty" if git("status", "--porcelain", "--", ".") else commit
+
+
+def load_history(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def same_inputs(entry: dict[str, Any], density: float, seed: int) -> bool:
+    return entry["density"] == density and entry["seed"] == seed
+
+
+def record_run(path: Path, history: list[dict[str, Any]], entry: dict[str, Any]) -> None:
+    # Re-running a revision (say with other --sizes) extends its results instead of replacing them.
+    for previous in history:
+        if previous["revision"] == entry["revision"] and same_inputs(previous, entry["density"], entry["seed"]):
+            entry["results"] = {**previous["results"], **entry["results"]}
+            history.remove(previous)
+            break
+    history = history + [entry]
+    stages.replace_atomically(path, lambda handle: handle.write(json.dumps(history, indent=2).encode() + b"\n"))
+
+
+def compare_runs(baseline: dict[str, Any], results: dict[str, float], threshold: float) -> list[str]:
+    regressions = []
+    for key, seconds in results.items():
+        previous = baseline["results"].get(key)
+        if previous is None:
+            continue
+        ratio = seconds / previous
+        status = "regression" if ratio > threshold else "ok"
+        print(f"compare={key} baseline={baseline['revision']} ratio={ratio:.2f} status={status}")
+        if status == "regression":
+            regressions.append(key)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the logo asset pipeline on synthetic references.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCHMARK_SIZES))
+    parser.add_argument("--density", type=float, default=1.0, help="defect density multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3, help="report the best of this many runs")
+    parser.add_argument("--only", help="run benchmarks whose name@size contains this text")
+    parser.add_argument("--history", type=Path, default=HISTORY_PATH)
+    parser.add_argument("--compare", help="revision to compare against (default: the latest other revision)")
+    parser.add_argument("--threshold", type=float, default=1.15, help="slowdown ratio reported as a regression")
+    parser.add_argument("--no-record", action="store_true", help="do not store this run in the history")
+    parser.add_argument("--classify", action="store_true", help="also time pixel classification on the real reference")
+    parser.add_argument("--tile-size", type=int, help="also check tiled cleaning against untiled at each size")
+    parser.add_argument(
+        "--parity", action="store_true", help="also prove the vector classifiers match the scalar ones bit for bit"
+    )
+    parser.add_argument(
+        "--memory", action="store_true", help="also compare peak memory and copy time of the in-place cleaning chain"
+    )
+    parser.add_argument(
+        "--skip-quality", action="store_true", help="skip the pyramid-versus-direct resize quality check"
+    )
+    args = parser.parse_args(argv)
+    # Only the classifier LUT is read from the command line's cache; every benchmark builds everything else.
+    cleaning.classifier_lut(stages.DiskCaches(assets.CACHE_DIR))
+
+    quality_failures = [] if args.skip_quality else check_pyramid_quality(args.density, args.seed)
+    parity_failures: list[str] = []
+    if args.tile_size is not None:
+        parity_failures = check_tiled_parity(args.sizes, args.density, args.seed, args.tile_size)
+    if args.memory:
+        parity_failures += check_in_place_chain(args.sizes, args.density, args.seed, args.runs)
+    classifier_failures = check_classifier_parity() + check_fill_parity() if args.parity else []
+
+    if args.classify:
+        canvas = cleaning.extract_reference_foreground(Image.open(assets.REFERENCE_SOURCE))
+        pixel_count = canvas.width * canvas.height
+        timings = classification_scans(canvas)
+        baseline = timings["scalarReference"]
+        for name, seconds in timings.items():
+            print(
+                f"classify={name} seconds={seconds:.4f} "
+                f"mpixPerSecond={pixel_count / seconds / 1e6:.1f} speedup={baseline / seconds:.1f}x"
+            )
+
+    results = run_benchmarks(args.sizes, args.density, args.seed, args.runs, args.only)
+    revision = git_revision()
+    history = load_history(args.history)
+    others = [
+        entry for entry in history if entry["revision"] != revision and same_inputs(entry, args.density, args.seed)
+    ]
+    if args.compare is not None:
+        others = [entry for entry in others if entry["revision"].startswith(args.compare)]
+        if not others:
+            raise SystemExit(f"No stored benchmark run for revision {args.compare}")
+    regressions = compare_runs(others[-1], results, args.threshold) if others else []
+    if not args.no_record:
+        entry = {
+            "revision": revision,
+            "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "density": args.density,
+            "seed": args.seed,
+            "runs": args.runs,
+            "results": results,
+        }
+        record_run(args.history, history, entry)
+        print(f"recorded revision={revision} benchmarks={len(results)} history={args.history}")
+    if quality_failures:
+        raise SystemExit(f"Pyramid renders below {PYRAMID_MIN_PSNR:.0f} dB PSNR: {', '.join(quality_failures)}")
+    if classifier_failures:
+        raise SystemExit(f"Vectorized stages differ from the scalar references: {', '.join(classifier_failures)}")
+    if parity_failures:
+        raise SystemExit(
+            f"Tiled or in-place cleaning differs from the copying chain at sizes {', '.join(parity_failures)}"
+        )
+    if regressions:
+        raise SystemExit(f"Benchmark regressions over {args.threshold:.2f}x: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
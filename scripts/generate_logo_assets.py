@@ -1,436 +1,195 @@
 from __future__ import annotations
 
-from collections import deque
+import argparse
+import hashlib
+import json
+import math
+import sys
+import tempfile
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from functools import cached_property, lru_cache, partial
 from pathlib import Path
+from typing import Any, Callable, Iterable, Mapping
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 
-ZESHA = Path(__file__).resolve().parents[1]
+from logo_cleaning import (
+    CANVAS_SIZE,
+    LETTERMARK_GOLD,
+    SURFACE_OUTLIER_CLUSTER_LIMIT,
+    SURFACE_OUTLIER_COUNT_LIMIT,
+    bright_red_contam_mask,
+    classifier_lut,
+    clean_foreground,
+    collect_lettermark_surface_outliers,
+    extract_reference_foreground,
+    finish_lettermark_in_place,
+    format_cluster,
+    hit_bounds,
+    integral_image,
+    label_components,
+    outlier_bounds,
+    red_contam_mask,
+    repair_lettermark_surface_outliers,
+    split_channels,
+    visible_bounds,
+    window_counts,
+)
+from logo_png import encode_ico, encode_png, optimize_png
+from logo_stages import (
+    SCRIPT_DIR,
+    DiskCaches,
+    code_fingerprint,
+    image_digest,
+    open_reference,
+    profile_stage,
+    profiling,
+    profiling_active,
+    replace_atomically,
+    rgba_array,
+    run_stage,
+    source_of,
+)
+from logo_tiles import clean_foreground_tiled, extract_reference_foreground_tiled
+
+ZESHA = SCRIPT_DIR.parent
 TELEBA = ZESHA.parent / "teleba"
 REFERENCE_SOURCE = ZESHA / "assets" / "teleba-logo-thick-reference.png"
-CANVAS_SIZE = 1024
+
+ICON_SIZE = 1024
 
 BRAND_RED = (154, 14, 31, 255)
 BRAND_RED_LIGHT = (210, 38, 58, 255)
 BRAND_RED_DEEP = (48, 2, 8, 255)
 FAVICON_GOLD = (244, 213, 106, 255)
-SURFACE_OUTLIER_COUNT_LIMIT = 32
-SURFACE_OUTLIER_CLUSTER_LIMIT = 4
-
-
-def extract_reference_foreground(reference: Image.Image) -> Image.Image:
-    source = reference.convert("RGBA")
-    if source.size != (CANVAS_SIZE, CANVAS_SIZE):
-        source = source.resize((CANVAS_SIZE, CANVAS_SIZE), Image.Resampling.LANCZOS)
-
-    alpha = Image.new("L", source.size, 0)
-    source_pixels = source.load()
-    alpha_pixels = alpha.load()
-    for y in range(source.height):
-        for x in range(source.width):
-            r, g, b, a = source_pixels[x, y]
-            if a == 0:
-                continue
-            brightness = max(r, g, b)
-            shadow_floor = min(r, g, b)
-            saturation = brightness - shadow_floor
-            if brightness < 112 or saturation > 54 or shadow_floor < 78:
-                continue
-            coverage = 255 if brightness >= 132 and shadow_floor >= 96 else min(255, max(0, round((brightness - 112) * 12.75)))
-            alpha_pixels[x, y] = coverage
-
-    foreground = Image.new("RGBA", source.size, (218, 175, 62, 255))
-    foreground.putalpha(alpha)
-    return clear_transparent_rgb(foreground)
-
-
-def is_red_contam(pixel: tuple[int, int, int, int]) -> bool:
-    r, g, b, a = pixel
-    # Exclude gold/cream family: when the pixel has warm gold character,
-    # it's metallic lettermark, not red matte contamination.
-    is_gold_family = (
-        # Bright gold/cream: high green, proportional blue
-        (g >= 140 and b >= 60 and g >= r * 0.60 and b >= g * 0.45)
-        # Dark gold/brown: low blue, green tracks red
-        or (g >= 55 and b < 60 and g >= r * 0.35 and r <= 200 and r - g <= 100)
-        # Mid gold: moderate green and blue, warm tone
-        or (g >= 100 and b >= 40 and g >= r * 0.55 and r <= 250 and r - g <= 80)
-    )
-    dark_tile_red = r >= 90 and g <= 40 and b <= 40 and r - g >= 55 and r - b >= 55
-    dark_matte = 35 <= r <= 130 and g <= 55 and b <= 45 and r >= g + 25 and r >= b + 25
-    bright_edge_red = r >= 150 and g <= 95 and b <= 100 and r - g >= 75 and r - b >= 75
-    rose_matte = r >= 175 and g <= 140 and b >= 35 and r - g >= 55 and r - b >= 45 and b * 100 >= max(g, 1) * 45
-    salmon_matte = r >= 220 and 100 <= g <= 180 and b >= 90 and r - g >= 55 and r - b >= 35
-    peach_matte = r >= 235 and 170 <= g <= 225 and b >= 140 and r - g >= 25 and r - b >= 35
-    if is_gold_family:
-        return False
-    return a > 0 and (dark_tile_red or dark_matte or bright_edge_red or rose_matte or salmon_matte or peach_matte)
-
-
-def is_bright_red_contam(pixel: tuple[int, int, int, int]) -> bool:
-    r, g, b, a = pixel
-    return a > 96 and r >= 180 and g <= 95 and b <= 100 and r - g >= 110 and r - b >= 100
-
-
-def is_dark_edge_matte(pixel: tuple[int, int, int, int]) -> bool:
-    r, g, b, a = pixel
-    return a > 0 and 35 <= r <= 130 and g <= 55 and b <= 45 and r >= g + 25 and r >= b + 25
-
-
-def visible_bounds(image: Image.Image) -> tuple[int, int, int, int]:
-    bounds = image.getchannel("A").getbbox()
-    if bounds is None:
-        raise ValueError("source has no visible pixels")
-    return bounds
-
-
-def nearest_non_red_fill(foreground: Image.Image) -> tuple[Image.Image, int, int]:
-    rgba = foreground.convert("RGBA")
-    width, height = rgba.size
-    pixels = rgba.load()
-    red_points: set[tuple[int, int]] = set()
-    queue: deque[tuple[int, int]] = deque()
-
-    for y in range(height):
-        for x in range(width):
-            pixel = pixels[x, y]
-            if is_red_contam(pixel):
-                red_points.add((x, y))
-            elif pixel[3] > 40:
-                queue.append((x, y))
-
-    red_before = len(red_points)
-    if not red_points:
-        return rgba, 0, 0
-
-    filled_from: dict[tuple[int, int], tuple[int, int, int, int]] = {
-        point: pixels[point[0], point[1]] for point in queue
-    }
-    visited = set(queue)
-    directions = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1))
-
-    while queue and red_points:
-        x, y = queue.popleft()
-        source_pixel = filled_from[(x, y)]
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-            if nx < 0 or ny < 0 or nx >= width or ny >= height or (nx, ny) in visited:
-                continue
-            visited.add((nx, ny))
-            if (nx, ny) in red_points:
-                pixels[nx, ny] = source_pixel
-                filled_from[(nx, ny)] = source_pixel
-                red_points.remove((nx, ny))
-                queue.append((nx, ny))
-            elif pixels[nx, ny][3] > 40:
-                filled_from[(nx, ny)] = pixels[nx, ny]
-                queue.append((nx, ny))
-
-    if red_points:
-        for x, y in list(red_points):
-            replacement = None
-            for radius in range(1, max(width, height)):
-                for ny in range(max(0, y - radius), min(height, y + radius + 1)):
-                    for nx in range(max(0, x - radius), min(width, x + radius + 1)):
-                        candidate = pixels[nx, ny]
-                        if candidate[3] > 40 and not is_red_contam(candidate):
-                            replacement = candidate
-                            break
-                    if replacement is not None:
-                        break
-                if replacement is not None:
-                    pixels[x, y] = replacement
-                    red_points.remove((x, y))
-                    break
-
-    red_after = sum(1 for y in range(height) for x in range(width) if is_red_contam(pixels[x, y]))
-    return rgba, red_before, red_after
-
-
-def clear_transparent_rgb(image: Image.Image) -> Image.Image:
-    rgba = image.convert("RGBA")
-    pixels = rgba.load()
-    for y in range(rgba.height):
-        for x in range(rgba.width):
-            if pixels[x, y][3] == 0:
-                pixels[x, y] = (0, 0, 0, 0)
-    return rgba
-
-
-def repair_outer_edge_matte(foreground: Image.Image) -> tuple[Image.Image, int, int]:
-    rgba = foreground.convert("RGBA")
-    width, height = rgba.size
-    pixels = rgba.load()
-    selected: set[tuple[int, int]] = set()
-    top_band = min(95, height)
-
-    for y in range(top_band):
-        for x in range(width):
-            if not is_dark_edge_matte(pixels[x, y]):
-                continue
-            touches_transparency = False
-            for ny in range(max(0, y - 2), min(height, y + 3)):
-                for nx in range(max(0, x - 2), min(width, x + 3)):
-                    if pixels[nx, ny][3] == 0:
-                        touches_transparency = True
-                        break
-                if touches_transparency:
-                    break
-            if touches_transparency:
-                selected.add((x, y))
-
-    before = len(selected)
-    if not selected:
-        return rgba, 0, 0
-
-    for x, y in sorted(selected, key=lambda point: point[1]):
-        replacement = None
-        for radius in range(1, 48):
-            for ny in range(max(0, y - radius), min(height, y + radius + 1)):
-                for nx in range(max(0, x - radius), min(width, x + radius + 1)):
-                    if (nx, ny) in selected:
-                        continue
-                    candidate = pixels[nx, ny]
-                    if candidate[3] > 40 and not is_red_contam(candidate) and not is_dark_edge_matte(candidate):
-                        replacement = candidate
-                        break
-                if replacement is not None:
-                    break
-            if replacement is not None:
-                pixels[x, y] = replacement
-                break
-
-    after = 0
-    for y in range(top_band):
-        for x in range(width):
-            if not is_dark_edge_matte(pixels[x, y]):
-                continue
-            for ny in range(max(0, y - 2), min(height, y + 3)):
-                for nx in range(max(0, x - 2), min(width, x + 3)):
-                    if pixels[nx, ny][3] == 0:
-                        after += 1
-                        break
-                else:
-                    continue
-                break
-    return rgba, before, after
-
-
-def repair_alpha_scratches(foreground: Image.Image) -> tuple[Image.Image, int, int]:
-    rgba = foreground.convert("RGBA")
-    width, height = rgba.size
-    pixels = rgba.load()
-
-    def collect() -> set[tuple[int, int]]:
-        selected: set[tuple[int, int]] = set()
-        for y in range(height):
-            for x in range(width):
-                if pixels[x, y][3] > 40:
-                    continue
-                has_left = any(pixels[nx, y][3] > 180 for nx in range(max(0, x - 10), x))
-                has_right = any(pixels[nx, y][3] > 180 for nx in range(x + 1, min(width, x + 11)))
-                has_up = any(pixels[x, ny][3] > 180 for ny in range(max(0, y - 6), y))
-                has_down = any(pixels[x, ny][3] > 180 for ny in range(y + 1, min(height, y + 7)))
-                if (has_left and has_right) or (has_up and has_down):
-                    selected.add((x, y))
-        return selected
-
-    selected = collect()
-    before = len(selected)
-    if not selected:
-        return rgba, 0, 0
-
-    for _ in range(8):
-        changed = 0
-        for x, y in sorted(selected, key=lambda point: point[1]):
-            replacement = None
-            for radius in range(1, 18):
-                for ny in range(max(0, y - radius), min(height, y + radius + 1)):
-                    for nx in range(max(0, x - radius), min(width, x + radius + 1)):
-                        if (nx, ny) in selected:
-                            continue
-                        candidate = pixels[nx, ny]
-                        if candidate[3] > 180 and not is_red_contam(candidate) and not is_dark_edge_matte(candidate):
-                            replacement = candidate
-                            break
-                    if replacement is not None:
-                        break
-                if replacement is not None:
-                    pixels[x, y] = replacement
-                    changed += 1
-                    break
-        if changed == 0:
-            break
-        selected = collect()
-        if not selected:
-            break
-
-    return rgba, before, len(collect())
-
-
-def polish_lettermark(foreground: Image.Image) -> Image.Image:
-    """Apply flat solid gold to the extracted lettermark mask."""
-    rgba = foreground.convert("RGBA")
-    width, height = rgba.size
-    pixels = rgba.load()
-
-    gold = (218, 175, 62, 255)
-
-    for y in range(height):
-        for x in range(width):
-            _, _, _, a = pixels[x, y]
-            if a == 0:
-                continue
-            pixels[x, y] = (gold[0], gold[1], gold[2], a)
-
-    return rgba
-
 
-def luminance(pixel: tuple[int, int, int, int]) -> float:
-    r, g, b, _ = pixel
-    return 0.2126 * r + 0.7152 * g + 0.0722 * b
-
-
-def median_color(pixels: list[tuple[int, int, int, int]]) -> tuple[int, int, int, int]:
-    return sorted(pixels, key=luminance)[len(pixels) // 2]
-
-
-def collect_lettermark_surface_outliers(foreground: Image.Image) -> set[tuple[int, int]]:
-    rgba = foreground.convert("RGBA")
-    width, height = rgba.size
-    pixels = rgba.load()
-    selected: set[tuple[int, int]] = set()
-
-    for y in range(5, height - 5):
-        for x in range(5, width - 5):
-            pixel = pixels[x, y]
-            if pixel[3] < 220:
-                continue
-
-            samples: list[tuple[int, int, int, int]] = []
-            is_interior = True
-            for ny in range(y - 3, y + 4):
-                for nx in range(x - 3, x + 4):
-                    candidate = pixels[nx, ny]
-                    if candidate[3] < 180:
-                        is_interior = False
-                        break
-                    if candidate[3] > 220 and (nx != x or ny != y):
-                        samples.append(candidate)
-                if not is_interior:
-                    break
-            if not is_interior or len(samples) < 35:
-                continue
-
-            median = median_color(samples)
-            color_distance = sum(abs(pixel[index] - median[index]) for index in range(3))
-            if color_distance > 145 and abs(luminance(pixel) - luminance(median)) > 48:
-                selected.add((x, y))
-
-    return selected
-
-
-def outlier_largest_cluster(points: set[tuple[int, int]]) -> int:
-    seen: set[tuple[int, int]] = set()
-    largest = 0
-    for point in points:
-        if point in seen:
-            continue
-        stack = [point]
-        seen.add(point)
-        count = 0
-        while stack:
-            x, y = stack.pop()
-            count += 1
-            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
-                neighbor = (x + dx, y + dy)
-                if neighbor in points and neighbor not in seen:
-                    seen.add(neighbor)
-                    stack.append(neighbor)
-        largest = max(largest, count)
-    return largest
-
-
-def outlier_bounds(points: set[tuple[int, int]]) -> str:
-    if not points:
-        return "none"
-    xs = [point[0] for point in points]
-    ys = [point[1] for point in points]
-    return f"({min(xs)},{min(ys)})-({max(xs)},{max(ys)})"
-
-
-def repair_lettermark_surface_outliers(foreground: Image.Image) -> tuple[Image.Image, int, int, int, str]:
-    rgba = foreground.convert("RGBA")
-    width, height = rgba.size
-    pixels = rgba.load()
-    before = collect_lettermark_surface_outliers(rgba)
-    if not before:
-        return rgba, 0, 0, 0, "none"
-    before_largest = outlier_largest_cluster(before)
-    if len(before) <= SURFACE_OUTLIER_COUNT_LIMIT and before_largest <= SURFACE_OUTLIER_CLUSTER_LIMIT:
-        return rgba, len(before), len(before), before_largest, outlier_bounds(before)
-
-    for _ in range(8):
-        selected = collect_lettermark_surface_outliers(rgba)
-        if not selected:
-            break
-        selected_largest = outlier_largest_cluster(selected)
-        if len(selected) <= SURFACE_OUTLIER_COUNT_LIMIT and selected_largest <= SURFACE_OUTLIER_CLUSTER_LIMIT:
-            break
-        for x, y in sorted(selected, key=lambda point: point[1]):
-            replacement = None
-            for radius in range(4, 28):
-                candidates: list[tuple[int, int, int, int]] = []
-                for ny in range(max(0, y - radius), min(height, y + radius + 1)):
-                    for nx in range(max(0, x - radius), min(width, x + radius + 1)):
-                        if (nx, ny) in selected:
-                            continue
-                        candidate = pixels[nx, ny]
-                        if candidate[3] > 220 and not is_red_contam(candidate) and not is_dark_edge_matte(candidate):
-                            candidates.append(candidate)
-                if candidates:
-                    replacement = median_color(candidates)
-                    break
-            if replacement is not None:
-                pixels[x, y] = replacement
-
-    after = collect_lettermark_surface_outliers(rgba)
-    return rgba, len(before), len(after), outlier_largest_cluster(after), outlier_bounds(after)
-
-
-def blend_color(
-    first: tuple[int, int, int, int],
+CACHE_DIR = SCRIPT_DIR / ".logo_asset_cache"  # where the command line keeps its caches; see DiskCaches
+
+PYRAMID_REDUCING_GAP = 3
+ICO_SIZES = (16, 32, 48)
+PWA_ICON_SIZES = (192, 512)
+PWA_ICON_BUDGETS = {("icon", 192): 24_000, ("maskable", 192): 20_000, ("icon", 512): 84_000, ("maskable", 512): 68_000}
+MASKABLE_SAFE_ZONE = 0.8  # maskable icons keep content inside a centred circle of 80% of the icon width
+LEGIBILITY_MIN_FOREGROUND = {16: 24, 32: 120}
+
+SURFACE_CHECK_CACHE_SIZE = 64  # distinct images whose surface analysis stays memoized
+CONTOUR_LEVEL = 127.5  # alpha the lettermark outline is traced at
+CORNER_REACH = 4  # outline vertices either side of a vertex whose directions decide whether it is a corner
+CORNER_ANGLE = 45.0  # degrees an outline turns across CORNER_REACH vertices at a corner; pixel staircases turn less
+CURVE_SMOOTHING = 8  # binomial passes between corners that dissolve the staircase of hard-edged alpha
+CURVE_TOLERANCE = 0.3  # pixels a fitted curve may stray from the smoothed outline
+VECTOR_FLATNESS = 0.25  # pixels a rendered polygon may stray from the curves, at the supersampled scale
+VECTOR_SUPERSAMPLE = 4  # samples per axis when rasterizing the outline
+TRACE_MAX_ALPHA_ERROR = 2.0  # mean absolute alpha difference allowed between the outline and the cleaned raster
+TRACE_EDGE_BAND = 1  # pixels either side of a raster edge where the outline's sub-pixel placement may differ
+
+
+@dataclass(frozen=True)
+class Palette:
+    red: tuple[int, int, int, int] = BRAND_RED
+    red_light: tuple[int, int, int, int] = BRAND_RED_LIGHT
+    red_deep: tuple[int, int, int, int] = BRAND_RED_DEEP
+    favicon_gold: tuple[int, int, int, int] = FAVICON_GOLD
+
+
+DEFAULT_PALETTE = Palette()
+BRAND_ASSETS = (
+    "adaptive-icon",
+    "padded-logo",
+    "splash-icon",
+    "apple-icon",
+    "favicon",
+    "icon-512",
+    "icon-1024",
+    "favicon-ico",
+    "lettermark-svg",
+    "web-icons",
+)
+ASSET_BUDGETS = {
+    "adaptive-icon": 24_000,
+    "padded-logo": 140_000,
+    "splash-icon": 32_000,
+    "apple-icon": 24_000,
+    "favicon": 36_000,
+    "icon-512": 84_000,
+    "icon-1024": 176_000,
+    "favicon-ico": 8_000,
+    "lettermark-svg": 16_000,
+}
+
+
+@dataclass(frozen=True)
+class BrandOutput:
+    asset: str  # one of BRAND_ASSETS; "web-icons" names a public directory rather than a file
+    path: Path
+    label: str  # how logs and surface checks name this destination
+
+
+@dataclass(frozen=True)
+class Brand:
+    name: str
+    reference: Path
+    palette: Palette
+    outputs: tuple[BrandOutput, ...]
+    budgets: Mapping[str, int] = field(default_factory=dict)  # assets left out stay within Pillow's default encoding
+
+
+def flat_foreground_mask(
+    pixels: np.ndarray, mark: tuple[int, ...] = FAVICON_GOLD, palette: Palette = DEFAULT_PALETTE
+) -> np.ndarray:
+    """Opaque pixels of the lettermark rather than the tile.
+
+    The default palette keeps the fixed gold thresholds LEGIBILITY_MIN_FOREGROUND was calibrated on. Other
+    palettes count pixels nearer the ``mark`` colour than every tile colour, since their gold may be no gold.
+    """
+    if palette == DEFAULT_PALETTE:
+        r, g, b, a = split_channels(pixels)
+        return (a > 120) & (r > 180) & (g > 135) & (b < 140)
+    rgb = pixels[..., :3].astype(np.int32)
+
+    def distance(colour: tuple[int, ...]) -> np.ndarray:
+        return np.square(rgb - np.array(colour[:3], dtype=np.int32)).sum(axis=-1)
+
+    tile = np.minimum.reduce([distance(colour) for colour in (palette.red, palette.red_light, palette.red_deep)])
+    return (pixels[..., 3] > 120) & (distance(mark) < tile)
+
+
+def blend_color_array(
+    first: np.ndarray,
     second: tuple[int, int, int, int],
-    amount: float,
-) -> tuple[int, int, int, int]:
-    amount = max(0.0, min(1.0, amount))
-    return tuple(round(first[index] * (1 - amount) + second[index] * amount) for index in range(4))
+    amount: np.ndarray,
+) -> np.ndarray:
+    amount = np.clip(amount, 0.0, 1.0)[..., None]
+    return np.round(first * (1 - amount) + np.array(second, dtype=np.float64) * amount)
 
 
-def dimensional_fill(size: int) -> Image.Image:
-    fill = Image.new("RGBA", (size, size), BRAND_RED)
-    pixels = fill.load()
+def dimensional_fill(size: int, palette: Palette = DEFAULT_PALETTE) -> Image.Image:
+    coordinates = np.arange(size, dtype=np.float64)
+    x = coordinates[None, :]
+    y = coordinates[:, None]
     # Light source: upper-left center, creating a convex pillow effect
     glow_x = size * 0.38
     glow_y = size * 0.36
     max_distance = ((size - glow_x) ** 2 + (size - glow_y) ** 2) ** 0.5
 
-    for y in range(size):
-        vertical = y / max(size - 1, 1)
-        for x in range(size):
-            horizontal = x / max(size - 1, 1)
-            distance = (((x - glow_x) ** 2 + (y - glow_y) ** 2) ** 0.5) / max_distance
-            # Strong upper-left sheen for premium highlight
-            top_left_sheen = max(0.0, 1.0 - (horizontal * 0.9 + vertical * 1.1)) * 0.38
-            # Pronounced center glow — the "convex surface" look
-            center_glow = max(0.0, 1.0 - distance * 1.05) ** 2.2 * 0.72
-            # Aggressive edge/corner darkening for vignette depth
-            bottom_right_depth = (horizontal * 0.22) + (vertical * 0.28)
-            edge_vignette = max(0.0, distance - 0.42) ** 1.4 * 0.82
-            edge = edge_vignette + bottom_right_depth
-            color = blend_color(BRAND_RED, BRAND_RED_LIGHT, center_glow + top_left_sheen)
-            color = blend_color(color, BRAND_RED_DEEP, edge)
-            pixels[x, y] = color
+    horizontal = x / max(size - 1, 1)
+    vertical = y / max(size - 1, 1)
+    distance = (((x - glow_x) ** 2 + (y - glow_y) ** 2) ** 0.5) / max_distance
+    # Strong upper-left sheen for premium highlight
+    top_left_sheen = np.maximum(0.0, 1.0 - (horizontal * 0.9 + vertical * 1.1)) * 0.38
+    # Pronounced center glow — the "convex surface" look
+    center_glow = np.maximum(0.0, 1.0 - distance * 1.05) ** 2.2 * 0.72
+    # Aggressive edge/corner darkening for vignette depth
+    bottom_right_depth = (horizontal * 0.22) + (vertical * 0.28)
+    edge_vignette = np.maximum(0.0, distance - 0.42) ** 1.4 * 0.82
+    edge = edge_vignette + bottom_right_depth
+    color = blend_color_array(np.array(palette.red, dtype=np.float64), palette.red_light, center_glow + top_left_sheen)
+    color = blend_color_array(color, palette.red_deep, edge)
+    fill = Image.fromarray(color.astype(np.uint8))
 
     # Soft highlight glow overlay (upper-center)
     glow = Image.new("RGBA", (size, size), (0, 0, 0, 0))
@@ -449,13 +208,13 @@ def dimensional_fill(size: int) -> Image.Image:
     return fill
 
 
-def rounded_tile(size: int, inset: int = 0, dimensional: bool = False) -> Image.Image:
+def build_rounded_tile(size: int, inset: int, dimensional: bool, palette: Palette) -> Image.Image:
     tile = Image.new("RGBA", (size, size), (0, 0, 0, 0))
     mask = Image.new("L", (size, size), 0)
     draw = ImageDraw.Draw(mask)
     radius = round((size - inset * 2) * 0.149)
     draw.rounded_rectangle((inset, inset, size - 1 - inset, size - 1 - inset), radius=radius, fill=255)
-    fill = dimensional_fill(size) if dimensional else Image.new("RGBA", (size, size), BRAND_RED)
+    fill = dimensional_fill(size, palette) if dimensional else Image.new("RGBA", (size, size), palette.red)
     tile.paste(fill, (0, 0, size, size), mask)
     if dimensional:
         accent = Image.new("RGBA", (size, size), (0, 0, 0, 0))
@@ -481,173 +240,1405 @@ def rounded_tile(size: int, inset: int = 0, dimensional: bool = False) -> Image.
     return tile
 
 
-def compose_rich_favicon(foreground: Image.Image) -> tuple[Image.Image, Image.Image, int, int, int, str]:
+@lru_cache(maxsize=16)
+def rounded_tile_pixels(
+    size: int, inset: int, dimensional: bool, palette: Palette, caches: DiskCaches | None
+) -> np.ndarray:
+    path = None
+    if caches is not None:
+        code = source_of(dimensional_fill) + source_of(build_rounded_tile)
+        digest = hashlib.sha256(f"{size}:{inset}:{dimensional}:{palette}:{code}".encode()).hexdigest()[:16]
+        path = caches.tiles / f"tile-{size}-{digest}.npy"
+        if path.exists():
+            pixels = np.load(path)
+            pixels.flags.writeable = False
+            return pixels
+    pixels = np.array(build_rounded_tile(size, inset, dimensional, palette))
+    if path is not None:
+        caches.save_array(path, pixels)
+    pixels.flags.writeable = False
+    return pixels
+
+
+def rounded_tile(
+    size: int,
+    inset: int = 0,
+    dimensional: bool = False,
+    palette: Palette = DEFAULT_PALETTE,
+    caches: DiskCaches | None = None,
+) -> Image.Image:
+    return Image.fromarray(rounded_tile_pixels(size, inset, dimensional, palette, caches)).copy()
+
+
+def compose_rich_favicon(
+    foreground: Image.Image,
+    palette: Palette = DEFAULT_PALETTE,
+    caches: DiskCaches | None = None,
+) -> tuple[Image.Image, Image.Image, int, int, int, str]:
     size = 1024
-    master = rounded_tile(size, dimensional=True)
+    master = rounded_tile(size, dimensional=True, palette=palette, caches=caches)
     target_height = 792
     scale = target_height / foreground.height
     target_width = round(foreground.width * scale)
     target_x = round((size - target_width) / 2)
     target_y = 92
     resized = foreground.resize((target_width, target_height), Image.Resampling.LANCZOS)
-    resized, surface_before, surface_after, surface_largest, surface_bounds = repair_lettermark_surface_outliers(resized)
+    resized, *surface = repair_lettermark_surface_outliers(resized)
     master.alpha_composite(resized, (target_x, target_y))
-    return master, resized, surface_before, surface_after, surface_largest, surface_bounds
+    return (master, resized, *surface)
 
 
-def compose_padded_logo(clean_canvas: Image.Image) -> Image.Image:
-    logo = rounded_tile(1024, inset=56, dimensional=True)
+def compose_padded_logo(
+    clean_canvas: Image.Image,
+    palette: Palette = DEFAULT_PALETTE,
+    caches: DiskCaches | None = None,
+) -> Image.Image:
+    logo = rounded_tile(1024, inset=56, dimensional=True, palette=palette, caches=caches)
+    if clean_canvas.size != logo.size:
+        clean_canvas = clean_canvas.resize(logo.size, Image.Resampling.LANCZOS)
     logo.alpha_composite(clean_canvas)
     return logo
 
 
-def compose_flat_favicon_source(foreground: Image.Image) -> Image.Image:
+def compose_flat_favicon_source(
+    foreground: Image.Image,
+    palette: Palette = DEFAULT_PALETTE,
+    caches: DiskCaches | None = None,
+) -> Image.Image:
     size = 1024
-    master = rounded_tile(size, dimensional=True)
+    master = rounded_tile(size, dimensional=True, palette=palette, caches=caches)
     target_height = 792
     scale = target_height / foreground.height
     target_width = round(foreground.width * scale)
     target_x = round((size - target_width) / 2)
     target_y = 92
     alpha = foreground.getchannel("A").resize((target_width, target_height), Image.Resampling.LANCZOS)
-    flat_mark = Image.new("RGBA", (target_width, target_height), FAVICON_GOLD)
+    flat_mark = Image.new("RGBA", (target_width, target_height), palette.favicon_gold)
     flat_mark.putalpha(alpha)
     master.alpha_composite(flat_mark, (target_x, target_y))
     return master
 
 
+def compose_maskable_icon(foreground: Image.Image, palette: Palette = DEFAULT_PALETTE) -> Image.Image:
+    """Full-bleed tile with the lettermark scaled so its bounding box fits the maskable safe-zone circle."""
+    size = 1024
+    master = dimensional_fill(size, palette)
+    scale = MASKABLE_SAFE_ZONE * size / math.hypot(foreground.width, foreground.height)
+    target_width = round(foreground.width * scale)
+    target_height = round(foreground.height * scale)
+    resized = foreground.resize((target_width, target_height), Image.Resampling.LANCZOS)
+    master.alpha_composite(resized, ((size - target_width) // 2, (size - target_height) // 2))
+    return master
+
+
 def count_red_pixels(image: Image.Image, alpha_threshold: int = 0) -> int:
-    return sum(
-        1
-        for pixel in image.convert("RGBA").get_flattened_data()
-        if pixel[3] > alpha_threshold and is_bright_red_contam(pixel)
+    pixels = rgba_array(image)
+    return int(np.count_nonzero((pixels[..., 3] > alpha_threshold) & bright_red_contam_mask(pixels)))
+
+
+def count_flat_foreground_pixels(
+    image: Image.Image, mark: tuple[int, ...] = FAVICON_GOLD, palette: Palette = DEFAULT_PALETTE
+) -> int:
+    return int(np.count_nonzero(flat_foreground_mask(rgba_array(image), mark, palette)))
+
+
+@dataclass(frozen=True)
+class AuditPredicate:
+    name: str
+    mask: Callable[[np.ndarray], np.ndarray]
+    bounds: bool = False  # also report the bounding box of matching pixels
+    histogram: int | None = None  # also report a 256-bin histogram of this channel over matching pixels
+
+
+@dataclass(frozen=True)
+class AuditResult:
+    count: int
+    bounds: str | None = None
+    histogram: tuple[int, ...] | None = None
+
+
+def audit_predicates(palette: Palette = DEFAULT_PALETTE) -> dict[str, AuditPredicate]:
+    """The audit checks, with the lettermark foreground told apart from ``palette``'s tile.
+
+    The flat mark is drawn in the palette's favicon gold; rich and maskable renders keep the polished lettermark.
+    """
+    return {
+        predicate.name: predicate
+        for predicate in (
+            AuditPredicate("red", red_contam_mask, bounds=True),
+            AuditPredicate(
+                "brightRed", lambda pixels: (pixels[..., 3] > 32) & bright_red_contam_mask(pixels), bounds=True
+            ),
+            AuditPredicate("flatForeground", partial(flat_foreground_mask, mark=palette.favicon_gold, palette=palette)),
+            AuditPredicate("richForeground", partial(flat_foreground_mask, mark=LETTERMARK_GOLD, palette=palette)),
+        )
+    }
+
+
+AUDIT_PREDICATES = audit_predicates()
+
+
+def audit_pixels(pixels: np.ndarray, predicates: Iterable[AuditPredicate]) -> dict[str, AuditResult]:
+    """Every predicate's count, bounds and histogram over ``pixels``.
+
+    Each predicate builds its own mask from the shared array; the masks are then stacked, so the counts, the row
+    and column hits behind the bounds, and all histograms each come from one reduction over the stack.
+    """
+    predicates = list(predicates)
+    if not predicates:
+        return {}
+    masks = np.stack([predicate.mask(pixels) for predicate in predicates])
+    counts = np.count_nonzero(masks.reshape(len(predicates), -1), axis=1)
+    row_hits, column_hits = masks.any(axis=2), masks.any(axis=1)
+    histograms: dict[int, tuple[int, ...]] = {}
+    histogram_of = [i for i, predicate in enumerate(predicates) if predicate.histogram is not None]
+    if histogram_of:
+        layer, ys, xs = np.nonzero(masks[histogram_of])
+        channels = np.array([predicates[i].histogram for i in histogram_of])
+        values = pixels[ys, xs, channels[layer]].astype(np.int64)
+        bins = np.bincount(layer * 256 + values, minlength=256 * len(histogram_of)).reshape(-1, 256)
+        histograms = {i: tuple(row.tolist()) for i, row in zip(histogram_of, bins)}
+    return {
+        predicate.name: AuditResult(
+            int(counts[i]),
+            hit_bounds(row_hits[i], column_hits[i]) if predicate.bounds else None,
+            histograms.get(i),
+        )
+        for i, predicate in enumerate(predicates)
+    }
+
+
+def audit_images(
+    requests: Iterable[tuple[Image.Image, str]],
+    predicates: Mapping[str, AuditPredicate] = AUDIT_PREDICATES,
+) -> dict[tuple[int, str], AuditResult]:
+    """Results of the named ``predicates`` per (image, name) request, keyed by (id(image), name).
+
+    Every distinct image is converted once and audited by audit_pixels, so a new check on an image already
+    audited costs one more mask over that image and no extra conversion.
+    """
+    plans: dict[int, tuple[Image.Image, dict[str, AuditPredicate]]] = {}
+    for image, name in requests:
+        plans.setdefault(id(image), (image, {}))[1][name] = predicates[name]
+    return {
+        (key, name): result
+        for key, (image, predicates) in plans.items()
+        for name, result in audit_pixels(rgba_array(image), predicates.values()).items()
+    }
+
+
+def legibility_minimum(width: int, height: int) -> int:
+    """Foreground pixels a small render needs; sizes without an explicit gate scale the 32px one by area."""
+    if width == height and width in LEGIBILITY_MIN_FOREGROUND:
+        return LEGIBILITY_MIN_FOREGROUND[width]
+    return math.ceil(LEGIBILITY_MIN_FOREGROUND[32] * width * height / 32**2)
+
+
+def web_icon_outputs(
+    public: Path,
+    rich_pyramid: RenderPyramid,
+    maskable_pyramid: RenderPyramid,
+) -> list[OutputFile | IconFile | DataFile]:
+    """PWA icon ladder plus the matching web manifest ``icons`` snippet for one public directory."""
+    outputs: list[OutputFile | IconFile | DataFile] = []
+    icons = []
+    for size in PWA_ICON_SIZES:
+        for purpose, name, pyramid in (("any", "icon", rich_pyramid), ("maskable", "maskable", maskable_pyramid)):
+            filename = f"{name}-{size}.png"
+            outputs.append(OutputFile(public / "icons" / filename, pyramid.render(size), PWA_ICON_BUDGETS[name, size]))
+            icons.append(
+                {"src": f"/icons/{filename}", "sizes": f"{size}x{size}", "type": "image/png", "purpose": purpose}
+            )
+    snippet = json.dumps({"icons": icons}, indent=2) + "\n"
+    outputs.append(DataFile(public / "icons" / "manifest-icons.json", snippet.encode()))
+    return outputs
+
+
+class RenderPyramid:
+    """Square size variants of one master image.
+
+    Each size is LANCZOS-resampled from the smallest 2x box-reduced level that is still at least
+    PYRAMID_REDUCING_GAP times larger, the same reduce-then-resample split as Pillow's ``reducing_gap``.
+    Levels and renders are cached, so every variant of a master comes out of one pass.
+    """
+
+    def __init__(self, master: Image.Image) -> None:
+        if master.width != master.height:
+            raise ValueError(f"pyramid master must be square, got {master.size}")
+        self.levels = [master]
+        self.renders: dict[int, Image.Image] = {master.width: master}
+
+    def level_for(self, size: int) -> Image.Image:
+        minimum = size * PYRAMID_REDUCING_GAP
+        while self.levels[-1].width // 2 >= minimum:
+            self.levels.append(self.levels[-1].reduce(2))
+        return next((level for level in reversed(self.levels) if level.width >= minimum), self.levels[0])
+
+    def render(self, size: int) -> Image.Image:
+        if size not in self.renders:
+            self.renders[size] = self.level_for(size).resize((size, size), Image.Resampling.LANCZOS)
+        return self.renders[size]
+
+
+# Marching-squares edge pairs per corner case, with corners tl=1, tr=2, br=4, bl=8 inside and edges top=0,
+# right=1, bottom=2, left=3. The saddles 5 and 10 list their pairs for a centre inside, then outside.
+CONTOUR_SEGMENTS = {
+    1: ((0, 3),), 2: ((0, 1),), 3: ((1, 3),), 4: ((1, 2),), 6: ((0, 2),), 7: ((2, 3),), 8: ((2, 3),),
+    9: ((0, 2),), 11: ((1, 2),), 12: ((1, 3),), 13: ((0, 1),), 14: ((0, 3),),
+}
+CONTOUR_SADDLES = {5: (((0, 1), (2, 3)), ((0, 3), (1, 2))), 10: (((0, 3), (1, 2)), ((0, 1), (2, 3)))}
+
+
+def contour_edge_ids(rows: np.ndarray, columns: np.ndarray, edge: int, width: int) -> np.ndarray:
+    # Even ids are the horizontal sample pairs (i, j)-(i, j+1), odd ids the vertical pairs (i, j)-(i+1, j).
+    if edge == 0:
+        return 2 * (rows * width + columns)
+    if edge == 1:
+        return 2 * (rows * width + columns + 1) + 1
+    if edge == 2:
+        return 2 * ((rows + 1) * width + columns)
+    return 2 * (rows * width + columns) + 1
+
+
+def trace_contours(alpha: np.ndarray, level: float = CONTOUR_LEVEL) -> list[np.ndarray]:
+    """Closed marching-squares outlines of ``alpha > level`` as (x, y) vertices, pixel centres at +0.5.
+
+    Crossings are interpolated linearly between samples, so anti-aliased edges trace at sub-pixel accuracy.
+    """
+    samples = np.pad(alpha.astype(np.float64), 1)
+    height, width = samples.shape
+    inside = samples > level
+    case = inside[:-1, :-1] * 1 + inside[:-1, 1:] * 2 + inside[1:, 1:] * 4 + inside[1:, :-1] * 8
+    rows, columns = np.nonzero((case != 0) & (case != 15))
+    if not rows.size:
+        return []
+    case = case[rows, columns]
+    corner_sum = (
+        samples[rows, columns]
+        + samples[rows, columns + 1]
+        + samples[rows + 1, columns + 1]
+        + samples[rows + 1, columns]
     )
+    centre = corner_sum / 4 > level
+    selections = [(case == kind, pairs) for kind, pairs in CONTOUR_SEGMENTS.items()]
+    for kind, (centre_inside, centre_outside) in CONTOUR_SADDLES.items():
+        selections += [((case == kind) & centre, centre_inside), ((case == kind) & ~centre, centre_outside)]
+    starts, ends = [], []
+    for chosen, pairs in selections:
+        for first, second in pairs:
+            starts.append(contour_edge_ids(rows[chosen], columns[chosen], first, width))
+            ends.append(contour_edge_ids(rows[chosen], columns[chosen], second, width))
+
+    # Every crossing is shared by exactly two segments; walking from one to the other closes each loop.
+    segments = np.stack([np.concatenate(starts), np.concatenate(ends)], axis=1).ravel()
+    order = np.argsort(segments, kind="stable")
+    partner = np.empty_like(order)
+    partner[order[0::2]], partner[order[1::2]] = order[1::2], order[0::2]
+    crossings, vertex = np.unique(segments, return_inverse=True)
+    cell, vertical = np.divmod(crossings, 2)
+    row, column = np.divmod(cell, width)
+    after = np.where(
+        vertical == 1, samples[np.minimum(row + 1, height - 1), column], samples[row, np.minimum(column + 1, width - 1)]
+    )
+    step = (level - samples[row, column]) / (after - samples[row, column])
+    xs = np.where(vertical == 1, column, column + step) - 0.5
+    ys = np.where(vertical == 1, row + step, row) - 0.5
+
+    partner_list, vertex_list = partner.tolist(), vertex.tolist()
+    visited = bytearray(segments.size // 2)
+    contours = []
+    for segment in range(segments.size // 2):
+        if visited[segment]:
+            continue
+        loop = []
+        end = 2 * segment
+        while not visited[end // 2]:
+            visited[end // 2] = 1
+            loop.append(vertex_list[end])
+            end = partner_list[end ^ 1]
+        contours.append(np.stack([xs[loop], ys[loop]], axis=1))
+    return contours
+
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    length = np.hypot(vectors[..., 0], vectors[..., 1])
+    return vectors / np.where(length > 0, length, 1)[..., None]
+
+
+def contour_corners(points: np.ndarray) -> np.ndarray:
+    """Indices where a closed outline turns by more than CORNER_ANGLE, one per corner, in outline order."""
+    incoming = points - np.roll(points, CORNER_REACH, axis=0)
+    outgoing = np.roll(points, -CORNER_REACH, axis=0) - points
+    turn = np.degrees(np.arccos(np.clip((unit_vectors(incoming) * unit_vectors(outgoing)).sum(axis=1), -1, 1)))
+    strongest = np.max([np.roll(turn, shift) for shift in range(-CORNER_REACH, CORNER_REACH + 1)], axis=0)
+    candidates = np.flatnonzero((turn > CORNER_ANGLE) & (turn >= strongest))
+    # A corner whose turn plateaus across several vertices keeps the first of them.
+    return candidates[np.concatenate([[True], np.diff(candidates) > CORNER_REACH])] if candidates.size else candidates
+
+
+def contour_runs(count: int, breaks: np.ndarray) -> list[np.ndarray]:
+    """Vertex indices from each break to the next one around a closed outline of ``count`` vertices, ends included."""
+    return [
+        (start + np.arange(((stop - start) % count or count) + 1)) % count
+        for start, stop in zip(breaks, np.roll(breaks, -1))
+    ]
 
 
-def count_flat_foreground_pixels(image: Image.Image) -> int:
-    return sum(
-        1
-        for r, g, b, a in image.convert("RGBA").get_flattened_data()
-        if a > 120 and r > 180 and g > 135 and b < 140
+def cubic_points(control: np.ndarray, t: np.ndarray) -> np.ndarray:
+    t = t[:, None]
+    s = 1 - t
+    return s**3 * control[0] + 3 * s * s * t * control[1] + 3 * s * t * t * control[2] + t**3 * control[3]
+
+
+def fit_cubic(points: np.ndarray, start_tangent: np.ndarray, end_tangent: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Least-squares cubic from points[0] to points[-1] with the given end tangents, at parameters ``t``."""
+    first, last = points[0], points[-1]
+    basis = np.stack([(1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t**2, t**3], axis=1)
+    along_start, along_end = basis[:, 1:2] * start_tangent, basis[:, 2:3] * end_tangent
+    rest = points - first * (basis[:, 0:1] + basis[:, 1:2]) - last * (basis[:, 2:3] + basis[:, 3:4])
+    gram = np.array([
+        [(along_start * along_start).sum(), (along_start * along_end).sum()],
+        [(along_start * along_end).sum(), (along_end * along_end).sum()],
+    ])
+    chord = math.hypot(*(last - first))
+    reach_start = reach_end = chord / 3
+    if abs(np.linalg.det(gram)) > 1e-12:
+        solved = np.linalg.solve(gram, [(along_start * rest).sum(), (along_end * rest).sum()])
+        if solved.min() > 1e-6 * chord:
+            reach_start, reach_end = solved
+    return np.array([first, first + reach_start * start_tangent, last + reach_end * end_tangent, last])
+
+
+def refit_parameters(control: np.ndarray, points: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """One Newton step moving each parameter towards its point's nearest place on the cubic."""
+    offset = cubic_points(control, t) - points
+    first = 3 * np.diff(control, axis=0)
+    second = 2 * np.diff(first, axis=0)
+    u = t[:, None]
+    velocity = (1 - u) ** 2 * first[0] + 2 * (1 - u) * u * first[1] + u**2 * first[2]
+    acceleration = (1 - u) * second[0] + u * second[1]
+    slope = (velocity * velocity).sum(axis=1) + (offset * acceleration).sum(axis=1)
+    step = (offset * velocity).sum(axis=1) / np.where(slope != 0, slope, np.inf)
+    return np.clip(t - step, 0, 1)
+
+
+def fit_cubics(points: np.ndarray, start_tangent: np.ndarray, end_tangent: np.ndarray) -> list[np.ndarray]:
+    """Cubics through an open run, each within CURVE_TOLERANCE of its points; runs split at their worst point."""
+    cubics: list[tuple[int, np.ndarray]] = []
+    spans = [(0, len(points) - 1, start_tangent, end_tangent)]
+    while spans:
+        start, end, leaving, arriving = spans.pop()
+        run = points[start : end + 1]
+        if end - start < 2:
+            third = (run[-1] - run[0]) / 3
+            cubics.append((start, np.array([run[0], run[0] + third, run[-1] - third, run[-1]])))
+            continue
+        lengths = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(run, axis=0).T))])
+        t = lengths / lengths[-1]
+        for _ in range(4):
+            control = fit_cubic(run, leaving, arriving, t)
+            error = np.hypot(*(cubic_points(control, t) - run).T)
+            if error.max() <= CURVE_TOLERANCE:
+                break
+            t = refit_parameters(control, run, t)
+        if error.max() <= CURVE_TOLERANCE:
+            cubics.append((start, control))
+            continue
+        split = start + 1 + int(np.argmax(error[1:-1]))
+        through = unit_vectors(points[min(end, split + CORNER_REACH)] - points[max(start, split - CORNER_REACH)])
+        spans += [(split, end, through, arriving), (start, split, leaving, -through)]
+    return [control for _, control in sorted(cubics, key=lambda item: item[0])]
+
+
+def fit_contour(points: np.ndarray) -> np.ndarray:
+    """A closed traced outline as cubics: each segment's start and its two control points in turn, shape (3n, 2).
+
+    Hard-edged alpha traces as a staircase of half-pixel steps. Each run between corners is smoothed with its
+    ends pinned, so corners stay sharp, then fitted with cubics whose tangents match across smooth joins.
+    """
+    count = len(points)
+    if count <= 2 * CORNER_REACH:
+        ends = np.roll(points, -1, axis=0)
+        return np.stack([points, points + (ends - points) / 3, points + 2 * (ends - points) / 3], axis=1).reshape(-1, 2)
+    corners = contour_corners(points)
+    smoothed = points.copy()
+    if corners.size:
+        for run in contour_runs(count, corners):
+            for _ in range(CURVE_SMOOTHING):
+                smoothed[run[1:-1]] = (smoothed[run[:-2]] + 2 * smoothed[run[1:-1]] + smoothed[run[2:]]) / 4
+        breaks = corners
+    else:
+        for _ in range(CURVE_SMOOTHING):
+            smoothed = (np.roll(smoothed, 1, axis=0) + 2 * smoothed + np.roll(smoothed, -1, axis=0)) / 4
+        breaks = np.array([0, int(np.argmax(((smoothed - smoothed[0]) ** 2).sum(axis=1)))])
+
+    def tangent(index: int, run: np.ndarray, leaving: bool) -> np.ndarray:
+        if corners.size:
+            # At a corner each side keeps its own direction.
+            if leaving:
+                return unit_vectors(smoothed[run[min(CORNER_REACH, len(run) - 1)]] - smoothed[run[0]])
+            return unit_vectors(smoothed[run[max(0, len(run) - 1 - CORNER_REACH)]] - smoothed[run[-1]])
+        through = unit_vectors(smoothed[(index + CORNER_REACH) % count] - smoothed[(index - CORNER_REACH) % count])
+        return through if leaving else -through
+
+    cubics: list[np.ndarray] = []
+    for run in contour_runs(count, breaks):
+        cubics += fit_cubics(smoothed[run], tangent(int(run[0]), run, True), tangent(int(run[-1]), run, False))
+    return np.concatenate([control[:3] for control in cubics])
+
+
+def flatten_cubics(control: np.ndarray, flatness: float) -> np.ndarray:
+    """Closed polyline within ``flatness`` of a fit_contour outline; Wang's bound picks each segment's step count."""
+    starts, leaving, arriving = control[0::3], control[1::3], control[2::3]
+    ends = np.roll(starts, -1, axis=0)
+    bend = np.maximum(np.hypot(*(starts - 2 * leaving + arriving).T), np.hypot(*(leaving - 2 * arriving + ends).T))
+    steps = np.maximum(1, np.ceil(np.sqrt(0.75 * bend / flatness))).astype(np.int64)
+    segment = np.repeat(np.arange(steps.size), steps)
+    t = ((np.arange(segment.size) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment])[:, None]
+    s = 1 - t
+    return (
+        s**3 * starts[segment]
+        + 3 * s * s * t * leaving[segment]
+        + 3 * s * t * t * arriving[segment]
+        + t**3 * ends[segment]
     )
 
 
-def save_image(image: Image.Image, path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    image.save(path)
-    print(f"wrote {path} size={image.width}x{image.height}")
-
-
-def save_resized(image: Image.Image, path: Path, size: int) -> None:
-    save_image(image.resize((size, size), Image.Resampling.LANCZOS), path)
-
-
-def validate_surface_target(name: str, foreground: Image.Image) -> tuple[int, int, str]:
-    outliers = collect_lettermark_surface_outliers(foreground)
-    largest = outlier_largest_cluster(outliers)
-    bounds = outlier_bounds(outliers)
-    print(f"surfaceTarget={name} outliers={len(outliers)} largestCluster={largest} bbox={bounds}")
-    if len(outliers) > SURFACE_OUTLIER_COUNT_LIMIT or largest > SURFACE_OUTLIER_CLUSTER_LIMIT:
-        raise SystemExit(f"Lettermark surface consistency check failed for {name}")
-    return len(outliers), largest, bounds
-
-
-def main() -> None:
-    source = extract_reference_foreground(Image.open(REFERENCE_SOURCE))
-    bounds = visible_bounds(source)
-    foreground = source.crop(bounds)
-    clean_foreground, red_before, red_after = nearest_non_red_fill(foreground)
-    clean_foreground, edge_matte_before, edge_matte_after = repair_outer_edge_matte(clean_foreground)
-    clean_foreground, alpha_scratch_before, alpha_scratch_after = repair_alpha_scratches(clean_foreground)
-    clean_foreground, surface_before, surface_after, surface_largest, surface_bounds = repair_lettermark_surface_outliers(clean_foreground)
-    clean_foreground = polish_lettermark(clean_foreground)
-    clean_foreground = clear_transparent_rgb(clean_foreground)
-
-    clean_canvas = Image.new("RGBA", source.size, (0, 0, 0, 0))
-    clean_canvas.alpha_composite(clean_foreground, (bounds[0], bounds[1]))
-
-    # Adaptive icon: scale down to fit Android's 66% safe zone
-    adaptive_canvas = Image.new("RGBA", (CANVAS_SIZE, CANVAS_SIZE), (0, 0, 0, 0))
-    adaptive_scale = 0.72  # ~37% of canvas, fits within safe zone
-    adaptive_w = round(clean_foreground.width * adaptive_scale)
-    adaptive_h = round(clean_foreground.height * adaptive_scale)
-    adaptive_foreground = clean_foreground.resize((adaptive_w, adaptive_h), Image.Resampling.LANCZOS)
-    adaptive_x = (CANVAS_SIZE - adaptive_w) // 2
-    adaptive_y = (CANVAS_SIZE - adaptive_h) // 2
-    adaptive_canvas.alpha_composite(adaptive_foreground, (adaptive_x, adaptive_y))
-
-    rich_favicon, resized_foreground, rich_surface_before, rich_surface_after, rich_surface_largest, rich_surface_bounds = compose_rich_favicon(clean_foreground)
-    padded_logo = compose_padded_logo(clean_canvas)
-    flat_favicon_1024 = compose_flat_favicon_source(clean_foreground)
-
-    direct_outputs = [
-        (ZESHA / "assets" / "adaptive-icon.png", adaptive_canvas),
-        (ZESHA / "assets" / "icon.png", padded_logo),
-        (ZESHA / "assets" / "splash-icon.png", clean_canvas),
-        (ZESHA / "public" / "logo-mark.png", padded_logo),
-        (TELEBA / "public" / "logo-mark.png", padded_logo),
-        (TELEBA / "app" / "apple-icon.png", rich_favicon.resize((180, 180), Image.Resampling.LANCZOS)),
-        (TELEBA / "public" / "apple-icon.png", rich_favicon.resize((180, 180), Image.Resampling.LANCZOS)),
-    ]
-    flat_outputs = [
-        (ZESHA / "assets" / "favicon.png", 256),
-        (ZESHA / "public" / "favicon.png", 256),
-        (ZESHA / "public" / "icon.png", 512),
-        (TELEBA / "public" / "icon.png", 512),
-        (TELEBA / "app" / "icon.png", 1024),
-    ]
+def trace_lettermark(foreground: Image.Image) -> tuple[np.ndarray, np.ndarray]:
+    """The alpha outlines of ``foreground`` fitted with cubics.
+
+    Returns all fit_contour rows concatenated, and where each outline starts.
+    """
+    contours = [fit_contour(contour) for contour in trace_contours(rgba_array(foreground)[..., 3])]
+    if not contours:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+    starts = np.cumsum([0] + [len(contour) for contour in contours[:-1]])
+    return np.concatenate(contours), starts
+
+
+def contour_depths(contours: list[np.ndarray]) -> list[int]:
+    """How many other outlines enclose each one; traced outlines never cross, so one vertex decides."""
+    depths = []
+    for index, contour in enumerate(contours):
+        x, y = contour[0]
+        depth = 0
+        for other_index, other in enumerate(contours):
+            if other_index == index:
+                continue
+            x0, y0 = other[:, 0], other[:, 1]
+            x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+            crosses = (y0 > y) != (y1 > y)
+            at = x0 + (y - y0) * (x1 - x0) / np.where(crosses, y1 - y0, 1)
+            depth += int(np.count_nonzero(crosses & (x < at))) % 2
+        depths.append(depth)
+    return depths
+
+
+@dataclass(frozen=True)
+class LettermarkPath:
+    """The traced lettermark outline on its canvas, rendered at any size without resampling the raster master.
+
+    ``points`` holds fit_contour rows: each cubic's start and two control points, the next start ending it.
+    """
+
+    canvas_size: tuple[int, int]
+    points: np.ndarray
+    starts: np.ndarray
+
+    @cached_property
+    def contours(self) -> list[np.ndarray]:
+        return np.split(self.points, self.starts[1:]) if len(self.starts) else []
+
+    @property
+    def segments(self) -> int:
+        return len(self.points) // 3
+
+    @cached_property
+    def depths(self) -> list[int]:
+        return contour_depths([flatten_cubics(contour, VECTOR_FLATNESS) for contour in self.contours])
+
+    @cached_property
+    def drawing_order(self) -> list[tuple[int, np.ndarray]]:
+        # Outlines fill at even nesting depth and cut holes at odd depth, outermost first: the even-odd rule.
+        return sorted(zip(self.depths, self.contours), key=lambda item: item[0])
+
+    def render(self, width: int, height: int) -> Image.Image:
+        """Flat gold lettermark on transparency.
+
+        The flattened curves are drawn at VECTOR_SUPERSAMPLE x and box-reduced to coverage.
+        """
+        scale_x = width * VECTOR_SUPERSAMPLE / self.canvas_size[0]
+        scale_y = height * VECTOR_SUPERSAMPLE / self.canvas_size[1]
+        mask = Image.new("L", (width * VECTOR_SUPERSAMPLE, height * VECTOR_SUPERSAMPLE), 0)
+        draw = ImageDraw.Draw(mask)
+        for depth, contour in self.drawing_order:
+            # Pillow puts integer coordinates on pixel centres; outline coordinates put them on pixel corners.
+            control = np.stack([contour[:, 0] * scale_x - 0.5, contour[:, 1] * scale_y - 0.5], axis=1)
+            vertices = flatten_cubics(control, VECTOR_FLATNESS)
+            draw.polygon([tuple(vertex) for vertex in vertices.tolist()], fill=0 if depth % 2 else 255)
+        pixels = np.zeros((height, width, 4), dtype=np.uint8)
+        pixels[..., 3] = np.asarray(mask.reduce(VECTOR_SUPERSAMPLE))
+        finish_lettermark_in_place(pixels)
+        return Image.fromarray(pixels)
+
+    def svg(self) -> bytes:
+        def number(value: float) -> str:
+            return f"{value:.2f}".rstrip("0").rstrip(".")
+
+        width, height = self.canvas_size
+        def point(vertex: np.ndarray) -> str:
+            return f"{number(vertex[0])} {number(vertex[1])}"
+
+        data = "".join(
+            f"M{point(contour[0])}"
+            + "".join(
+                f"C{point(contour[index + 1])} {point(contour[index + 2])} {point(contour[(index + 3) % len(contour)])}"
+                for index in range(0, len(contour), 3)
+            )
+            + "Z"
+            for contour in self.contours
+        )
+        gold = "#{:02X}{:02X}{:02X}".format(*LETTERMARK_GOLD[:3])
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">\n'
+            f'<path fill="{gold}" fill-rule="evenodd" d="{data}"/>\n'
+            "</svg>\n"
+        ).encode()
 
-    for path, image in direct_outputs:
-        save_image(image, path)
-    for path, size in flat_outputs:
-        save_resized(flat_favicon_1024, path, size)
-
-    source_red_count = sum(1 for pixel in clean_canvas.get_flattened_data() if is_red_contam(pixel))
-    resized_red_count = count_red_pixels(resized_foreground, alpha_threshold=32)
-    flat_16 = flat_favicon_1024.resize((16, 16), Image.Resampling.LANCZOS)
-    flat_32 = flat_favicon_1024.resize((32, 32), Image.Resampling.LANCZOS)
-    flat_16_foreground = count_flat_foreground_pixels(flat_16)
-    flat_32_foreground = count_flat_foreground_pixels(flat_32)
-    apple_180_foreground = resized_foreground.resize(
-        (round(resized_foreground.width * 180 / 1024), round(resized_foreground.height * 180 / 1024)),
-        Image.Resampling.LANCZOS,
+
+@dataclass(frozen=True)
+class OutputFile:
+    path: Path
+    image: Image.Image
+    budget: int | None = None  # maximum encoded bytes; None allows no more than Pillow's default encoding
+
+    @property
+    def render_key(self) -> int:
+        # Composed images and pyramid renders are never mutated afterwards, so identity is a safe dedupe key.
+        return id(self.image)
+
+    @property
+    def pixels(self) -> int:
+        return self.image.width * self.image.height
+
+    @property
+    def summary(self) -> str:
+        return f"size={self.image.width}x{self.image.height}"
+
+    def encode(self, draft: bool = False, caches: DiskCaches | None = None) -> tuple[bytes, int]:
+        if draft:
+            data = encode_png(self.image.convert("RGBA"))
+            return data, len(data)
+        return optimize_png(self.image, caches)
+
+
+@dataclass(frozen=True)
+class IconFile:
+    path: Path
+    frames: tuple[Image.Image, ...]
+    budget: int | None = None
+
+    @property
+    def render_key(self) -> tuple[int, ...]:
+        return tuple(id(frame) for frame in self.frames)
+
+    @property
+    def pixels(self) -> int:
+        return sum(frame.width * frame.height for frame in self.frames)
+
+    @property
+    def summary(self) -> str:
+        return "sizes=" + ",".join(f"{frame.width}x{frame.height}" for frame in self.frames)
+
+    def encode(self, draft: bool = False, caches: DiskCaches | None = None) -> tuple[bytes, int]:
+        return encode_ico(self.frames, caches)
+
+
+@dataclass(frozen=True)
+class DataFile:
+    path: Path
+    data: bytes
+    budget: int | None = None
+
+    @property
+    def render_key(self) -> Path:
+        return self.path
+
+    @property
+    def pixels(self) -> int:
+        return 0
+
+    @property
+    def summary(self) -> str:
+        return f"format={self.path.suffix.lstrip('.')}"
+
+    def encode(self, draft: bool = False, caches: DiskCaches | None = None) -> tuple[bytes, int]:
+        return self.data, len(self.data)
+
+
+def load_output_manifest(caches: DiskCaches | None) -> dict[str, dict[str, Any]]:
+    if caches is None or not caches.manifest.exists():
+        return {}
+    return json.loads(caches.manifest.read_text(encoding="utf-8"))
+
+
+def disk_digest(path: Path, manifest: dict[str, dict[str, Any]]) -> str | None:
+    """SHA-256 of the file at path, trusting the manifest while size and mtime still match it."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    entry = manifest.get(str(path))
+    if entry is not None and entry["size"] == stat.st_size and entry["mtimeNs"] == stat.st_mtime_ns:
+        return entry["sha256"]
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class BudgetExceeded(Exception):
+    """Outputs whose encoding is over their byte budget; nothing was written."""
+
+    def __init__(self, over_budget: list[str]) -> None:
+        super().__init__("Outputs over their byte budget: " + ", ".join(over_budget))
+        self.over_budget = over_budget
+
+
+@dataclass(frozen=True)
+class WrittenOutput:
+    path: Path
+    status: str  # "wrote", "stale" (only with check) or "unchanged"
+    summary: str
+    bytes: int
+    default_bytes: int
+    sha256: str
+
+
+@dataclass(frozen=True)
+class WriteResult:
+    outputs: tuple[WrittenOutput, ...]
+    check: bool = False
+    draft: bool = False
+
+    @property
+    def written(self) -> list[Path]:
+        return [output.path for output in self.outputs if output.status == "wrote"]
+
+    @property
+    def stale(self) -> list[Path]:
+        return [output.path for output in self.outputs if output.status == "stale"]
+
+    @property
+    def changed(self) -> list[Path]:
+        return [output.path for output in self.outputs if output.status != "unchanged"]
+
+    def lines(self) -> list[str]:
+        lines = [
+            f"{output.status} {output.path} {output.summary} bytes={output.bytes} defaultBytes={output.default_bytes}"
+            for output in self.outputs
+        ]
+        total_bytes = sum(output.bytes for output in self.outputs)
+        total_default_bytes = sum(output.default_bytes for output in self.outputs)
+        lines.append(
+            f"outputs {'stale' if self.check else 'drafted' if self.draft else 'written'}={len(self.changed)} "
+            f"unchanged={len(self.outputs) - len(self.changed)} bytes={total_bytes} defaultBytes={total_default_bytes}"
+        )
+        return lines
+
+
+def write_outputs(
+    outputs: list[OutputFile | IconFile | DataFile],
+    caches: DiskCaches | None = None,
+    workers: int | None = None,
+    check: bool = False,
+    draft: bool = False,
+) -> WriteResult:
+    """Encode each distinct image once on a thread pool, then write changed destinations atomically in order.
+
+    With ``check`` nothing is written and changed outputs are reported stale. Outputs over their byte budget, or
+    without one and larger than Pillow's default encoding, raise BudgetExceeded before anything is written.
+    ``draft`` writes Pillow's default PNG encoding without budgets, for a quick preview that a later optimized
+    write replaces. ``caches`` holds the optimized encodings and the manifest that spares rehashing unchanged files.
+    """
+    renders = {output.render_key: output for output in outputs}
+    pixels = sum(output.pixels for output in renders.values())
+    with profile_stage("encode_outputs", pixels, label=f"{len(renders)} renders"):
+        # zlib and Pillow release the GIL while filtering and deflating, so threads scale here.
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            encoded = dict(zip(renders, pool.map(lambda output: output.encode(draft, caches), renders.values())))
+    budgets = {
+        output.path: encoded[output.render_key][1] if output.budget is None else output.budget for output in outputs
+    }
+    over_budget = [
+        f"{output.path} ({len(encoded[output.render_key][0])} > {budgets[output.path]} bytes)"
+        for output in outputs
+        if not draft and len(encoded[output.render_key][0]) > budgets[output.path]
+    ]
+    if over_budget:
+        raise BudgetExceeded(over_budget)
+
+    manifest = load_output_manifest(caches)
+    entries: dict[str, dict[str, Any]] = {}
+    results: list[WrittenOutput] = []
+    for output in outputs:
+        data, default_bytes = encoded[output.render_key]
+        digest = hashlib.sha256(data).hexdigest()
+        if disk_digest(output.path, manifest) == digest:
+            status = "unchanged"
+        elif check:
+            status = "stale"
+        else:
+            with profile_stage("write_output", output.pixels, label=str(output.path)):
+                replace_atomically(output.path, lambda handle: handle.write(data))
+            status = "wrote"
+        results.append(WrittenOutput(output.path, status, output.summary, len(data), default_bytes, digest))
+        if status != "stale":
+            stat = output.path.stat()
+            entries[str(output.path)] = {"sha256": digest, "size": stat.st_size, "mtimeNs": stat.st_mtime_ns}
+
+    if not check and caches is not None:
+        # Re-read so batch workers writing other brands concurrently keep their entries; a lost entry only costs
+        # a rehash.
+        manifest = {**load_output_manifest(caches), **entries}
+        manifest_bytes = (json.dumps(manifest, indent=2, sort_keys=True) + "\n").encode()
+        caches.write(caches.manifest, lambda handle: handle.write(manifest_bytes))
+    return WriteResult(tuple(results), check, draft)
+
+
+@dataclass(frozen=True)
+class SurfaceCheck:
+    target: str
+    outliers: int
+    largest_cluster: int
+    bounds: str
+    clusters: tuple[tuple[int, str], ...]  # size and formatted bounds of the five largest clusters
+
+    @property
+    def passed(self) -> bool:
+        return self.outliers <= SURFACE_OUTLIER_COUNT_LIMIT and self.largest_cluster <= SURFACE_OUTLIER_CLUSTER_LIMIT
+
+
+def validate_surface_target(name: str, foreground: Image.Image) -> SurfaceCheck:
+    with profile_stage("validate_surface_target", foreground.width * foreground.height, label=name):
+        outliers = collect_lettermark_surface_outliers(foreground)
+    clusters = label_components(outliers)
+    largest = np.argsort(-clusters.sizes, kind="stable")[:5].tolist()
+    return SurfaceCheck(
+        name,
+        int(np.count_nonzero(outliers)),
+        clusters.largest,
+        outlier_bounds(outliers),
+        tuple(
+            (int(clusters.sizes[index]), format_cluster(clusters.bounds[index], clusters.centroids[index]))
+            for index in largest
+        ),
     )
 
-    print(f"sourceBounds=({bounds[0]},{bounds[1]})-({bounds[2] - 1},{bounds[3] - 1})")
-    print(f"foregroundRedBefore={red_before} foregroundRedAfter={red_after}")
-    print(f"edgeDarkMatteBefore={edge_matte_before} edgeDarkMatteAfter={edge_matte_after}")
-    print(f"alphaScratchBefore={alpha_scratch_before} alphaScratchAfter={alpha_scratch_after}")
-    print(
-        "lettermarkSurfaceOutliersBefore="
-        f"{surface_before} lettermarkSurfaceOutliersAfter={surface_after} "
-        f"largestCluster={surface_largest} bbox={surface_bounds}"
+
+class SurfaceCheckCache:
+    """Surface analyses keyed by pixel content, so each distinct image is scanned once however many targets name it.
+
+    An image object seen before is not re-hashed: composed images are never mutated, so a live identity keeps
+    its digest.
+    """
+
+    def __init__(self) -> None:
+        self.digests: dict[int, tuple[weakref.ref[Image.Image], str]] = {}
+        self.checks: dict[str, SurfaceCheck] = {}
+
+    def digest(self, image: Image.Image) -> str:
+        entry = self.digests.get(id(image))
+        if entry is not None and entry[0]() is image:
+            return entry[1]
+        digest = image_digest(image)
+        self.digests[id(image)] = (weakref.ref(image, lambda _, key=id(image): self.digests.pop(key, None)), digest)
+        return digest
+
+    def validate(self, targets: list[tuple[str, Image.Image]]) -> list[SurfaceCheck]:
+        """One SurfaceCheck per (name, image) target; distinct uncached images are analyzed concurrently."""
+        digests = [self.digest(image) for _, image in targets]
+        pending: dict[str, tuple[str, Image.Image]] = {}
+        for target, digest in zip(targets, digests):
+            if digest not in self.checks:
+                pending.setdefault(digest, target)
+        if not profiling_active() and len(pending) > 1:
+            # The outlier scan is numpy work that mostly releases the GIL.
+            with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                checks = list(pool.map(lambda target: validate_surface_target(*target), pending.values()))
+        else:
+            checks = [validate_surface_target(*target) for target in pending.values()]
+        self.checks.update(zip(pending, checks))
+        results = [replace(self.checks[digest], target=name) for (name, _), digest in zip(targets, digests)]
+        while len(self.checks) > SURFACE_CHECK_CACHE_SIZE:
+            del self.checks[next(iter(self.checks))]
+        return results
+
+
+SURFACE_CHECKS = SurfaceCheckCache()
+
+
+@dataclass(frozen=True)
+class CleanReference:
+    """Palette-independent extraction and cleaning result that every brand on one reference shares."""
+
+    canvas_size: tuple[int, int]
+    bounds: tuple[int, int, int, int]
+    foreground: Image.Image
+    red: tuple[int, int]
+    edge_matte: tuple[int, int]
+    alpha_scratch: tuple[int, int]
+    surface: tuple[int, int, int, str]
+
+    def canvas(self) -> Image.Image:
+        canvas = Image.new("RGBA", self.canvas_size, (0, 0, 0, 0))
+        canvas.alpha_composite(self.foreground, (self.bounds[0], self.bounds[1]))
+        return canvas
+
+
+@dataclass(frozen=True)
+class AssetConfig:
+    palette: Palette = DEFAULT_PALETTE
+    tile_size: int | None = None  # clean over disk-backed tiles of this size, in a temporary directory
+    canvas_size: int = CANVAS_SIZE  # working resolution the reference master is resampled to
+    cache_dir: Path | None = None  # keep the disk caches here (see DiskCaches); by default nothing is cached on disk
+    cache_read_only: bool = False  # read the disk caches without adding to them
+
+    @property
+    def caches(self) -> DiskCaches | None:
+        return None if self.cache_dir is None else DiskCaches(self.cache_dir, self.cache_read_only)
+
+
+def clean_reference(reference: Path | Image.Image, config: AssetConfig = AssetConfig()) -> CleanReference:
+    """Extract and clean a reference master at ``config.canvas_size``; the palette is not used."""
+    image = open_reference(reference) if isinstance(reference, Path) else reference
+    caches = config.caches
+    classifier_lut(caches)
+    if config.tile_size is None:
+        source = run_stage(extract_reference_foreground, image, caches=caches, canvas_size=config.canvas_size)
+        bounds = visible_bounds(source)
+        cleaned, *statistics = run_stage(clean_foreground, source.crop(bounds), caches=caches)
+        # Statistics read back from the disk cache are lists.
+        return CleanReference(source.size, bounds, cleaned, *(tuple(values) for values in statistics))
+
+    with tempfile.TemporaryDirectory(prefix="logo-tiles-") as scratch:
+        source_pixels, bounds = extract_reference_foreground_tiled(
+            image, config.tile_size, Path(scratch), config.canvas_size
+        )
+        canvas_size = (source_pixels.shape[1], source_pixels.shape[0])
+        foreground_pixels = source_pixels[bounds[1] : bounds[3], bounds[0] : bounds[2]]
+        cleaned, red, edge_matte, alpha_scratch, surface = clean_foreground_tiled(
+            foreground_pixels, config.tile_size, Path(scratch)
+        )
+        cleaned_foreground = Image.fromarray(np.array(cleaned))
+        # Memmaps must be closed before the scratch directory can be removed on Windows.
+        del source_pixels, foreground_pixels, cleaned
+    return CleanReference(canvas_size, bounds, cleaned_foreground, red, edge_matte, alpha_scratch, surface)
+
+
+@dataclass(frozen=True)
+class LegibilityCheck:
+    target: str
+    foreground_pixels: int
+    minimum: int
+
+
+@dataclass(frozen=True)
+class TraceCheck:
+    contours: int
+    segments: int
+    alpha_error: float  # mean absolute alpha difference between the outline rendered at canvas size and the raster
+    stray_pixels: int  # pixels beyond TRACE_EDGE_BAND of a raster edge whose rendered coverage flips
+
+
+@dataclass(frozen=True)
+class AssetMetrics:
+    """The counts a build logs and gates on."""
+
+    source_bounds: tuple[int, int, int, int]
+    red: tuple[int, int]
+    edge_matte: tuple[int, int]
+    alpha_scratch: tuple[int, int]
+    surface: tuple[int, int, int, str]
+    rich_surface: tuple[int, int, int, str]
+    surface_targets: tuple[SurfaceCheck, ...]
+    source_red: AuditResult
+    resized_red: AuditResult
+    flat_16_foreground: int
+    flat_32_foreground: int
+    legibility: tuple[LegibilityCheck, ...]
+    trace: TraceCheck | None = None  # only when a lettermark SVG is among the outputs
+
+    @property
+    def failures(self) -> list[str]:
+        """Gate violations, most specific first; empty when every check passes."""
+        failures = [
+            f"Lettermark surface consistency check failed for {check.target}"
+            for check in self.surface_targets
+            if not check.passed
+        ]
+        contaminated = self.source_red.count > 0 or self.resized_red.count > 0
+        if self.red[1] > 0 or self.edge_matte[1] > 0 or self.alpha_scratch[1] > 0 or contaminated:
+            failures.append("Contamination check failed after generation")
+        if self.surface[1] > SURFACE_OUTLIER_COUNT_LIMIT or self.surface[2] > SURFACE_OUTLIER_CLUSTER_LIMIT:
+            failures.append("Lettermark surface consistency check failed after generation")
+        if self.rich_surface[1] > SURFACE_OUTLIER_COUNT_LIMIT or self.rich_surface[2] > SURFACE_OUTLIER_CLUSTER_LIMIT:
+            failures.append("Rich lettermark surface consistency check failed after generation")
+        if self.flat_16_foreground < legibility_minimum(16, 16) or self.flat_32_foreground < legibility_minimum(32, 32):
+            failures.append("Flat favicon foreground is too small at browser-tab sizes")
+        illegible = [check.target for check in self.legibility if check.foreground_pixels < check.minimum]
+        if illegible:
+            failures.append(f"Web icon foreground is too small for {', '.join(illegible)}")
+        if self.trace is not None and (self.trace.alpha_error > TRACE_MAX_ALPHA_ERROR or self.trace.stray_pixels > 0):
+            failures.append(
+                "Traced lettermark outline strays from the cleaned raster "
+                f"(mean alpha error {self.trace.alpha_error:.2f}, {self.trace.stray_pixels} pixels off the edge band)"
+            )
+        return failures
+
+    def lines(self) -> list[str]:
+        left, top, right, bottom = self.source_bounds
+        lines = [
+            f"sourceBounds=({left},{top})-({right - 1},{bottom - 1})",
+            f"foregroundRedBefore={self.red[0]} foregroundRedAfter={self.red[1]}",
+            f"edgeDarkMatteBefore={self.edge_matte[0]} edgeDarkMatteAfter={self.edge_matte[1]}",
+            f"alphaScratchBefore={self.alpha_scratch[0]} alphaScratchAfter={self.alpha_scratch[1]}",
+            f"lettermarkSurfaceOutliersBefore={self.surface[0]} lettermarkSurfaceOutliersAfter={self.surface[1]} "
+            f"largestCluster={self.surface[2]} bbox={self.surface[3]}",
+            f"richLettermarkSurfaceOutliersBefore={self.rich_surface[0]} "
+            f"richLettermarkSurfaceOutliersAfter={self.rich_surface[1]} "
+            f"largestCluster={self.rich_surface[2]} bbox={self.rich_surface[3]}",
+        ]
+        for check in self.surface_targets:
+            lines.append(
+                f"surfaceTarget={check.target} outliers={check.outliers} largestCluster={check.largest_cluster} "
+                f"bbox={check.bounds}"
+            )
+            lines += [f"surfaceCluster target={check.target} size={size} {cluster}" for size, cluster in check.clusters]
+        lines += [
+            f"adaptiveSourceContamination={self.source_red.count}"
+            + (f" bbox={self.source_red.bounds}" if self.source_red.count else ""),
+            f"resizedForegroundRed={self.resized_red.count}"
+            + (f" bbox={self.resized_red.bounds}" if self.resized_red.count else ""),
+            f"flat16ForegroundPixels={self.flat_16_foreground}",
+            f"flat32ForegroundPixels={self.flat_32_foreground}",
+        ]
+        lines += [
+            f"legibility={check.target} foregroundPixels={check.foreground_pixels} minimum={check.minimum}"
+            for check in self.legibility
+        ]
+        if self.trace is not None:
+            lines.append(
+                f"lettermarkTrace contours={self.trace.contours} segments={self.trace.segments} "
+                f"meanAlphaError={self.trace.alpha_error:.2f} strayPixels={self.trace.stray_pixels}"
+            )
+        return lines
+
+
+class AssetBundle:
+    """Every asset one cleaned reference yields under one palette.
+
+    Intermediates, renders and encodings are computed on first access and kept, so callers pay only for
+    what they ask for. ``write`` and ``validate`` are the optional sinks; nothing else prints, and nothing else
+    writes to disk except ``caches``. Failed byte budgets raise BudgetExceeded.
+    """
+
+    def __init__(
+        self, cleaned: CleanReference, palette: Palette = DEFAULT_PALETTE, caches: DiskCaches | None = None
+    ) -> None:
+        self.cleaned = cleaned
+        self.palette = palette
+        self.caches = caches
+        self.encodings: dict[str, bytes] = {}
+        classifier_lut(caches)
+
+    @cached_property
+    def clean_canvas(self) -> Image.Image:
+        return self.cleaned.canvas()
+
+    @cached_property
+    def splash_canvas(self) -> Image.Image:
+        if self.cleaned.canvas_size == (ICON_SIZE, ICON_SIZE):
+            return self.clean_canvas
+        return self.clean_canvas.resize((ICON_SIZE, ICON_SIZE), Image.Resampling.LANCZOS)
+
+    @cached_property
+    def adaptive_canvas(self) -> Image.Image:
+        # Scale down to fit Android's 66% safe zone
+        foreground = self.cleaned.foreground
+        canvas = Image.new("RGBA", (ICON_SIZE, ICON_SIZE), (0, 0, 0, 0))
+        scale = 0.72 * ICON_SIZE / self.cleaned.canvas_size[0]  # ~37% of canvas, fits within safe zone
+        width = round(foreground.width * scale)
+        height = round(foreground.height * scale)
+        resized = foreground.resize((width, height), Image.Resampling.LANCZOS)
+        canvas.alpha_composite(resized, ((ICON_SIZE - width) // 2, (ICON_SIZE - height) // 2))
+        return canvas
+
+    @cached_property
+    def rich_favicon_stage(self) -> tuple[Image.Image, Image.Image, int, int, int, str]:
+        return run_stage(compose_rich_favicon, self.cleaned.foreground, caches=self.caches, palette=self.palette)
+
+    @property
+    def rich_favicon(self) -> Image.Image:
+        return self.rich_favicon_stage[0]
+
+    @property
+    def resized_foreground(self) -> Image.Image:
+        return self.rich_favicon_stage[1]
+
+    @cached_property
+    def padded_logo(self) -> Image.Image:
+        return run_stage(compose_padded_logo, self.clean_canvas, caches=self.caches, palette=self.palette)
+
+    @cached_property
+    def flat_favicon_source(self) -> Image.Image:
+        return run_stage(compose_flat_favicon_source, self.cleaned.foreground, caches=self.caches, palette=self.palette)
+
+    @cached_property
+    def maskable_icon(self) -> Image.Image:
+        return run_stage(compose_maskable_icon, self.cleaned.foreground, caches=self.caches, palette=self.palette)
+
+    @cached_property
+    def rich_pyramid(self) -> RenderPyramid:
+        return RenderPyramid(self.rich_favicon)
+
+    @cached_property
+    def flat_pyramid(self) -> RenderPyramid:
+        return RenderPyramid(self.flat_favicon_source)
+
+    @cached_property
+    def maskable_pyramid(self) -> RenderPyramid:
+        return RenderPyramid(self.maskable_icon)
+
+    @cached_property
+    def ico_frames(self) -> tuple[Image.Image, ...]:
+        return tuple(self.flat_pyramid.render(size) for size in ICO_SIZES)
+
+    @cached_property
+    def lettermark_path(self) -> LettermarkPath:
+        points, starts = run_stage(trace_lettermark, self.cleaned.foreground, caches=self.caches)
+        return LettermarkPath(self.cleaned.canvas_size, points + self.cleaned.bounds[:2], starts)
+
+    def lettermark(self, size: int) -> Image.Image:
+        """The clean canvas rendered from the traced outline at ``size``, in time proportional to its own pixels."""
+        return self.lettermark_path.render(size, size)
+
+    @cached_property
+    def apple_180_foreground(self) -> Image.Image:
+        resized = self.resized_foreground
+        size = (round(resized.width * 180 / 1024), round(resized.height * 180 / 1024))
+        return resized.resize(size, Image.Resampling.LANCZOS)
+
+    def image(self, asset: str) -> Image.Image:
+        """The render behind a single-PNG asset."""
+        renders = {
+            "adaptive-icon": lambda: self.adaptive_canvas,
+            "padded-logo": lambda: self.padded_logo,
+            "splash-icon": lambda: self.splash_canvas,
+            "apple-icon": lambda: self.rich_pyramid.render(180),
+            "favicon": lambda: self.flat_pyramid.render(256),
+            "icon-512": lambda: self.flat_pyramid.render(512),
+            "icon-1024": lambda: self.flat_pyramid.render(1024),
+        }
+        if asset not in renders:
+            raise ValueError(f"{asset!r} is not a single-PNG asset; expected one of {', '.join(renders)}")
+        return renders[asset]()
+
+    def encoded(self, asset: str) -> bytes:
+        """Final file bytes of a PNG asset, of "favicon-ico" or of "lettermark-svg"."""
+        if asset not in self.encodings:
+            if asset == "favicon-ico":
+                self.encodings[asset] = encode_ico(self.ico_frames, self.caches)[0]
+            elif asset == "lettermark-svg":
+                self.encodings[asset] = self.lettermark_path.svg()
+            else:
+                self.encodings[asset] = optimize_png(self.image(asset), self.caches)[0]
+        return self.encodings[asset]
+
+    def files(
+        self, outputs: Iterable[BrandOutput], budgets: Mapping[str, int] | None = None
+    ) -> list[OutputFile | IconFile | DataFile]:
+        """Output files for ``outputs``; ``budgets`` caps encoded bytes per asset (see Brand.budgets)."""
+        budgets = budgets or {}
+        files: list[OutputFile | IconFile | DataFile] = []
+        web_files: list[OutputFile | IconFile | DataFile] = []
+        for output in outputs:
+            if output.asset == "favicon-ico":
+                files.append(IconFile(output.path, self.ico_frames, budget=budgets.get(output.asset)))
+            elif output.asset == "lettermark-svg":
+                files.append(DataFile(output.path, self.encoded(output.asset), budget=budgets.get(output.asset)))
+            elif output.asset == "web-icons":
+                web_files += web_icon_outputs(output.path, self.rich_pyramid, self.maskable_pyramid)
+            else:
+                files.append(OutputFile(output.path, self.image(output.asset), budget=budgets.get(output.asset)))
+        return files + web_files
+
+    def write(
+        self, outputs: Iterable[BrandOutput], check: bool = False, budgets: Mapping[str, int] | None = None
+    ) -> WriteResult:
+        """Write sink: see write_outputs, which also enforces the byte budgets."""
+        return write_outputs(self.files(outputs, budgets), self.caches, check=check)
+
+    def validate(self, outputs: Iterable[BrandOutput] | None = None) -> AssetMetrics:
+        """Validation sink: surface and legibility checks for the assets ``outputs`` name (default: all of them).
+
+        Surface checks are named by each output's label, or by asset name when ``outputs`` is omitted.
+        """
+        if outputs is None:
+            targets = [(asset, asset) for asset in BRAND_ASSETS]
+        else:
+            targets = [(output.asset, output.label) for output in outputs]
+        assets = {asset for asset, _ in targets}
+        surface_images = {
+            "adaptive-icon": lambda: self.cleaned.foreground,
+            "splash-icon": lambda: self.cleaned.foreground,
+            "padded-logo": lambda: self.cleaned.foreground,
+            "apple-icon": lambda: self.apple_180_foreground,
+        }
+        surface_targets = tuple(
+            SURFACE_CHECKS.validate(
+                [
+                    (label, image())
+                    for surface_asset, image in surface_images.items()
+                    for asset, label in targets
+                    if asset == surface_asset
+                ]
+            )
+        )
+        legibility: list[tuple[str, Image.Image, str]] = []
+        if "favicon-ico" in assets:
+            legibility += [(f"favicon.ico@{frame.width}", frame, "flatForeground") for frame in self.ico_frames]
+        if "web-icons" in assets:
+            for size in PWA_ICON_SIZES:
+                legibility += [
+                    (f"icon-{size}", self.rich_pyramid.render(size), "richForeground"),
+                    (f"maskable-{size}", self.maskable_pyramid.render(size), "richForeground"),
+                ]
+        trace = None
+        if "lettermark-svg" in assets:
+            path = self.lettermark_path
+            width, height = path.canvas_size
+            rendered = rgba_array(path.render(width, height))[..., 3].astype(np.int16)
+            raster = rgba_array(self.clean_canvas)[..., 3]
+            difference = np.abs(rendered - raster)
+            # Smoothing moves the outline off the pixel staircase by under a pixel, so coverage may flip only
+            # in pixels that sit within TRACE_EDGE_BAND of both sides of a raster edge.
+            inside = raster > 127
+            near_inside = window_counts(integral_image(inside), TRACE_EDGE_BAND, TRACE_EDGE_BAND) > 0
+            near_outside = window_counts(integral_image(~inside), TRACE_EDGE_BAND, TRACE_EDGE_BAND) > 0
+            stray = int(np.count_nonzero((difference > 127) & ~(near_inside & near_outside)))
+            trace = TraceCheck(len(path.contours), path.segments, float(difference.mean()), stray)
+        flat_16, flat_32 = self.flat_pyramid.render(16), self.flat_pyramid.render(32)
+        # The 16 and 32px renders are also favicon.ico frames, so they are audited once for both checks.
+        audits = audit_images(
+            [
+                (self.clean_canvas, "red"),
+                (self.resized_foreground, "brightRed"),
+                (flat_16, "flatForeground"),
+                (flat_32, "flatForeground"),
+            ]
+            + [(image, predicate) for _, image, predicate in legibility],
+            audit_predicates(self.palette),
+        )
+        return AssetMetrics(
+            source_bounds=self.cleaned.bounds,
+            red=self.cleaned.red,
+            edge_matte=self.cleaned.edge_matte,
+            alpha_scratch=self.cleaned.alpha_scratch,
+            surface=self.cleaned.surface,
+            rich_surface=self.rich_favicon_stage[2:],
+            surface_targets=surface_targets,
+            source_red=audits[id(self.clean_canvas), "red"],
+            resized_red=audits[id(self.resized_foreground), "brightRed"],
+            flat_16_foreground=audits[id(flat_16), "flatForeground"].count,
+            flat_32_foreground=audits[id(flat_32), "flatForeground"].count,
+            legibility=tuple(
+                LegibilityCheck(name, audits[id(image), predicate].count, legibility_minimum(image.width, image.height))
+                for name, image, predicate in legibility
+            ),
+            trace=trace,
+        )
+
+
+def build_assets(reference: Path | Image.Image, config: AssetConfig = AssetConfig()) -> AssetBundle:
+    """Clean a reference master and return its lazily rendered assets; nothing is printed.
+
+    Nothing is written either, unless ``config.cache_dir`` turns the disk caches on. Tiled cleaning keeps its
+    tiles in a temporary directory that is removed before this returns.
+    """
+    return AssetBundle(clean_reference(reference, config), config.palette, config.caches)
+
+
+def default_brand(web_icons: bool = False) -> Brand:
+    """The Zesha and Teleba targets this script has always written."""
+
+    def output(asset: str, root: Path, prefix: str, relative: str) -> BrandOutput:
+        return BrandOutput(asset, root / relative, prefix + relative)
+
+    outputs = [
+        output("adaptive-icon", ZESHA, "", "assets/adaptive-icon.png"),
+        output("padded-logo", ZESHA, "", "assets/icon.png"),
+        output("splash-icon", ZESHA, "", "assets/splash-icon.png"),
+        output("padded-logo", ZESHA, "", "public/logo-mark.png"),
+        output("padded-logo", TELEBA, "teleba/", "public/logo-mark.png"),
+        output("apple-icon", TELEBA, "teleba/", "app/apple-icon.png"),
+        output("apple-icon", TELEBA, "teleba/", "public/apple-icon.png"),
+        output("favicon", ZESHA, "", "assets/favicon.png"),
+        output("favicon", ZESHA, "", "public/favicon.png"),
+        output("icon-512", ZESHA, "", "public/icon.png"),
+        output("icon-512", TELEBA, "teleba/", "public/icon.png"),
+        output("icon-1024", TELEBA, "teleba/", "app/icon.png"),
+        output("lettermark-svg", ZESHA, "", "assets/teleba-logo-source.svg"),
+    ]
+    if web_icons:
+        outputs += [
+            output("favicon-ico", ZESHA, "", "public/favicon.ico"),
+            output("favicon-ico", TELEBA, "teleba/", "app/favicon.ico"),
+            output("web-icons", ZESHA, "", "public"),
+            output("web-icons", TELEBA, "teleba/", "public"),
+        ]
+    return Brand("default", REFERENCE_SOURCE, DEFAULT_PALETTE, tuple(outputs), ASSET_BUDGETS)
+
+
+def build_record(brand: Brand, config: AssetConfig) -> Path | None:
+    """Where the log and output digests of a successful build of ``brand`` under ``config`` are kept.
+
+    The name hashes the reference bytes, the code behind cleaning and generation, the brand and the settings that
+    change pixels, so a change to any of them looks for a different record.
+    """
+    caches = config.caches
+    if caches is None:
+        return None
+    key = hashlib.sha256(brand.reference.read_bytes())
+    for function in (clean_reference, generate_brand):
+        key.update(code_fingerprint(function).encode())
+    key.update(repr((brand, config.tile_size, config.canvas_size)).encode())
+    return caches.builds / f"{brand.name}-{key.hexdigest()[:24]}.json"
+
+
+def replay_build(record: Path, caches: DiskCaches, check: bool = False) -> bool:
+    """Print a recorded build's log if every output it wrote is still on disk unchanged; False if it must run."""
+    try:
+        stored = json.loads(record.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return False
+    manifest = load_output_manifest(caches)
+    if any(disk_digest(Path(entry["path"]), manifest) != entry["sha256"] for entry in stored["outputs"]):
+        return False
+    outputs = tuple(
+        WrittenOutput(**{**entry, "path": Path(entry["path"]), "status": "unchanged"}) for entry in stored["outputs"]
     )
-    print(
-        "richLettermarkSurfaceOutliersBefore="
-        f"{rich_surface_before} richLettermarkSurfaceOutliersAfter={rich_surface_after} "
-        f"largestCluster={rich_surface_largest} bbox={rich_surface_bounds}"
+    for line in WriteResult(outputs, check).lines() + stored["lines"]:
+        print(line)
+    return True
+
+
+def generate_brand(
+    brand: Brand,
+    cleaned: CleanReference,
+    check: bool = False,
+    caches: DiskCaches | None = None,
+    record: Path | None = None,
+) -> None:
+    """Write and validate every output of ``brand``, then keep its log in ``record`` for replay_build."""
+    bundle = AssetBundle(cleaned, brand.palette, caches)
+    files = bundle.files(brand.outputs, brand.budgets)
+    # Every output render exists once files() returns, so validation can read the bundle while the encoders run.
+    # The profiler's stage stack is single-threaded, so profiled runs validate afterwards.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        validation = pool.submit(bundle.validate, brand.outputs) if not profiling_active() else None
+        try:
+            written = write_outputs(files, caches, check=check)
+        except BudgetExceeded as failure:
+            raise SystemExit(str(failure)) from None
+        metrics = validation.result() if validation is not None else bundle.validate(brand.outputs)
+    for line in written.lines() + metrics.lines():
+        print(line)
+    failures = metrics.failures
+    if failures:
+        raise SystemExit(failures[0])
+    if written.stale:
+        raise SystemExit(f"{len(written.stale)} generated output(s) are out of date; rerun without --check")
+    if record is not None and caches is not None:
+        document = {
+            "outputs": [{**asdict(output), "path": str(output.path)} for output in written.outputs],
+            "lines": metrics.lines(),
+        }
+        caches.write(record, lambda handle: handle.write((json.dumps(document, indent=2) + "\n").encode()))
+
+
+def generate_assets(check: bool = False, web_icons: bool = False, config: AssetConfig = AssetConfig()) -> None:
+    """The default brand, skipping the whole pipeline when its last build still matches the files on disk."""
+    brand = default_brand(web_icons)
+    # Profiled runs always build, so the report has stages to show.
+    record = build_record(brand, config) if not profiling_active() else None
+    if record is not None and replay_build(record, config.caches, check):
+        return
+    generate_brand(brand, clean_reference(brand.reference, config), check, config.caches, record)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Regenerate the Zesha and Teleba logo assets.")
+    parser.add_argument("--check", action="store_true", help="exit non-zero if any output would change; writes nothing")
+    parser.add_argument("--web-icons", action="store_true", help="also export favicon.ico and the PWA icon set")
+    parser.add_argument("--tile-size", type=int, help="run the cleaning stages over disk-backed tiles of this size")
+    parser.add_argument(
+        "--canvas-size", type=int, default=CANVAS_SIZE, help="working resolution for the reference master"
+    )
+    parser.add_argument(
+        "--watch", action="store_true", help="stay resident and rebuild when the reference or config changes"
+    )
+    parser.add_argument("--batch", type=Path, help="JSON config of brands (reference, palette, outputs) to generate")
+    parser.add_argument("--jobs", type=int, help="worker processes for --batch (default: one per core)")
+    parser.add_argument("--report", type=Path, help="write the consolidated --batch report as JSON")
+    parser.add_argument("--profile", type=Path, help="write per-stage timing, throughput and memory as JSON")
+    parser.add_argument("--cprofile-dir", type=Path, help="also dump a cProfile .prof file per top-level stage")
+    args = parser.parse_args(argv)
+    if args.tile_size is not None and args.tile_size < 1:
+        parser.error("--tile-size must be positive")
+    if args.canvas_size < 1:
+        parser.error("--canvas-size must be positive")
+    if args.batch is None and (args.jobs is not None or args.report is not None):
+        parser.error("--jobs and --report need --batch")
+    profiled = args.profile is not None or args.cprofile_dir is not None
+    if args.batch is not None and (args.web_icons or profiled):
+        parser.error("--batch takes its assets from the config and cannot be combined with --web-icons or profiling")
+    if args.watch and (args.check or args.jobs is not None or args.report is not None or profiled):
+        parser.error(
+            "--watch rebuilds in one process and cannot be combined with --check, --jobs, --report or profiling"
+        )
+    config = AssetConfig(
+        tile_size=args.tile_size, canvas_size=args.canvas_size, cache_dir=CACHE_DIR, cache_read_only=args.check
     )
-    validate_surface_target("assets/adaptive-icon.png", clean_foreground)
-    validate_surface_target("assets/splash-icon.png", clean_foreground)
-    validate_surface_target("assets/icon.png", clean_foreground)
-    validate_surface_target("public/logo-mark.png", clean_foreground)
-    validate_surface_target("teleba/public/logo-mark.png", clean_foreground)
-    validate_surface_target("teleba/app/apple-icon.png", apple_180_foreground)
-    validate_surface_target("teleba/public/apple-icon.png", apple_180_foreground)
-    print(f"adaptiveSourceContamination={source_red_count}")
-    print(f"resizedForegroundRed={resized_red_count}")
-    print(f"flat16ForegroundPixels={flat_16_foreground}")
-    print(f"flat32ForegroundPixels={flat_32_foreground}")
-
-    if red_after > 0 or edge_matte_after > 0 or alpha_scratch_after > 0 or source_red_count > 0 or resized_red_count > 0:
-        raise SystemExit("Contamination check failed after generation")
-    if surface_after > SURFACE_OUTLIER_COUNT_LIMIT or surface_largest > SURFACE_OUTLIER_CLUSTER_LIMIT:
-        raise SystemExit("Lettermark surface consistency check failed after generation")
-    if rich_surface_after > SURFACE_OUTLIER_COUNT_LIMIT or rich_surface_largest > SURFACE_OUTLIER_CLUSTER_LIMIT:
-        raise SystemExit("Rich lettermark surface consistency check failed after generation")
-    if flat_16_foreground < 24 or flat_32_foreground < 120:
-        raise SystemExit("Flat favicon foreground is too small at browser-tab sizes")
+    if args.watch:
+        from logo_watch import watch
+
+        watch(args.batch, args.web_icons, config)
+        return
+    if args.batch is not None:
+        from logo_batch import load_batch_config, report_batch, run_batch
+
+        start = time.perf_counter()
+        brands = load_batch_config(args.batch)
+        results = run_batch(brands, args.check, config, args.jobs)
+        references = len({brand.reference for brand in brands})
+        report_batch(results, references, time.perf_counter() - start, args.report)
+        return
+    if not profiled:
+        generate_assets(args.check, args.web_icons, config)
+        return
+
+    with profiling(args.cprofile_dir) as profiler:
+        try:
+            generate_assets(args.check, args.web_icons, config)
+        finally:
+            report = profiler.report()
+            if args.profile is not None:
+                args.profile.parent.mkdir(parents=True, exist_ok=True)
+                args.profile.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+                print(f"wrote {args.profile} stages={len(report['stages'])}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # The batch and watch drivers import this module by name; let them share the running copy.
+    sys.modules.setdefault("generate_logo_assets", sys.modules[__name__])
+    main()
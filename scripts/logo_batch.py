@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import io
+import json
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from generate_logo_assets import (
+    ASSET_BUDGETS,
+    BRAND_ASSETS,
+    REFERENCE_SOURCE,
+    AssetConfig,
+    Brand,
+    BrandOutput,
+    CleanReference,
+    Palette,
+    clean_reference,
+    generate_brand,
+)
+from logo_stages import DiskCaches, replace_atomically
+
+
+@dataclass
+class BrandResult:
+    name: str
+    error: str | None
+    seconds: float
+    log: list[str]
+
+
+def parse_color(value: Any) -> tuple[int, int, int, int]:
+    """A "#rrggbb"/"#rrggbbaa" string or a 3- or 4-item list as an opaque-by-default RGBA tuple."""
+    if isinstance(value, str) and value.startswith("#") and len(value) in (7, 9):
+        value = [int(value[index : index + 2], 16) for index in range(1, len(value), 2)]
+    if (
+        not isinstance(value, list)
+        or len(value) not in (3, 4)
+        or not all(isinstance(part, int) and 0 <= part <= 255 for part in value)
+    ):
+        raise ValueError(f"invalid colour {value!r}; expected #rrggbb, #rrggbbaa or 3-4 channel values 0-255")
+    return tuple(value) + (255,) * (4 - len(value))  # type: ignore[return-value]
+
+
+def load_batch_config(path: Path) -> list[Brand]:
+    """Brands from a JSON batch config; reference and output paths are relative to the config file.
+
+    ``{"brands": [{"name": ..., "reference": "master.png", "palette": {"red": "#9a0e1f", ...},
+    "outputs": {"padded-logo": ["web/logo.png"], "web-icons": ["web/public"], ...},
+    "budgets": {"favicon": 40000, ...}}]}``. The reference defaults to REFERENCE_SOURCE and omitted palette
+    colours keep their defaults. ASSET_BUDGETS fit the default reference only, so a brand's assets are
+    budgeted only where its entry says so.
+    """
+    config = json.loads(path.read_text(encoding="utf-8"))
+    base = path.resolve().parent
+    palette_fields = set(Palette.__dataclass_fields__)
+    brands: list[Brand] = []
+    for entry in config["brands"]:
+        name = entry["name"]
+        colours = entry.get("palette", {})
+        unknown = sorted(set(colours) - palette_fields)
+        if unknown:
+            raise ValueError(
+                f"brand {name}: unknown palette colour(s) {', '.join(unknown)}; "
+                f"expected {', '.join(sorted(palette_fields))}"
+            )
+        palette = Palette(**{key: parse_color(value) for key, value in colours.items()})
+        outputs: list[BrandOutput] = []
+        for asset, destinations in entry["outputs"].items():
+            if asset not in BRAND_ASSETS:
+                raise ValueError(f"brand {name}: unknown asset {asset!r}; expected one of {', '.join(BRAND_ASSETS)}")
+            for destination in [destinations] if isinstance(destinations, str) else destinations:
+                outputs.append(BrandOutput(asset, base / destination, destination))
+        budgets = entry.get("budgets", {})
+        for asset, budget in budgets.items():
+            if asset not in ASSET_BUDGETS:
+                raise ValueError(
+                    f"brand {name}: no byte budget applies to {asset!r}; expected one of {', '.join(ASSET_BUDGETS)}"
+                )
+            if not isinstance(budget, int) or isinstance(budget, bool) or budget <= 0:
+                raise ValueError(f"brand {name}: invalid {asset} budget {budget!r}; expected a positive byte count")
+        reference = base / entry["reference"] if "reference" in entry else REFERENCE_SOURCE
+        brands.append(Brand(name, reference, palette, tuple(outputs), budgets))
+
+    names = [brand.name for brand in brands]
+    repeated_names = sorted({name for name in names if names.count(name) > 1})
+    if repeated_names:
+        raise ValueError(f"brand names must be unique: {', '.join(repeated_names)}")
+    every_output = [output for brand in brands for output in brand.outputs]
+    written = [output.path.resolve() for output in every_output if output.asset != "web-icons"]
+    written += [output.path.resolve() / "icons" for output in every_output if output.asset == "web-icons"]
+    repeated_paths = sorted({str(path) for path in written if written.count(path) > 1})
+    if repeated_paths:
+        raise ValueError(f"outputs written by more than one brand entry: {', '.join(repeated_paths)}")
+    return brands
+
+
+def run_brand(brand: Brand, cleaned: CleanReference, check: bool, caches: DiskCaches | None) -> BrandResult:
+    """generate_brand with its log captured and its failure recorded instead of raised."""
+    start = time.perf_counter()
+    log = io.StringIO()
+    error = None
+    try:
+        with redirect_stdout(log):
+            generate_brand(brand, cleaned, check, caches)
+    except SystemExit as failure:
+        error = str(failure.code)
+    except Exception as failure:  # one broken brand must not hide the others' results
+        error = f"{type(failure).__name__}: {failure}"
+    return BrandResult(brand.name, error, time.perf_counter() - start, log.getvalue().splitlines())
+
+
+def run_batch(
+    brands: list[Brand],
+    check: bool = False,
+    config: AssetConfig = AssetConfig(),
+    workers: int | None = None,
+) -> list[BrandResult]:
+    """Clean each distinct reference once, then fan the brands that share it out across a process pool.
+
+    Each brand's own palette applies; ``config`` supplies the tiling, canvas size and caches.
+    """
+    references = list(dict.fromkeys(brand.reference for brand in brands))
+    with ProcessPoolExecutor(workers) as pool:
+        cleaning = {reference: pool.submit(clean_reference, reference, config) for reference in references}
+        pending: dict[str, Future[BrandResult] | BrandResult] = {}
+        for reference, future in cleaning.items():
+            try:
+                cleaned = future.result()
+            except Exception as failure:
+                error = f"cleaning {reference} failed: {type(failure).__name__}: {failure}"
+                for brand in brands:
+                    if brand.reference == reference:
+                        pending[brand.name] = BrandResult(brand.name, error, 0.0, [])
+                continue
+            for brand in brands:
+                if brand.reference == reference:
+                    pending[brand.name] = pool.submit(run_brand, brand, cleaned, check, config.caches)
+        results = (pending[brand.name] for brand in brands)
+        return [result if isinstance(result, BrandResult) else result.result() for result in results]
+
+
+def print_brand_results(results: list[BrandResult]) -> None:
+    for result in results:
+        status = "failed" if result.error else "ok"
+        print(f"brand={result.name} status={status} seconds={result.seconds:.2f}")
+        for line in result.log:
+            print(f"  {line}")
+        if result.error:
+            print(f"  error={result.error}")
+
+
+def report_batch(results: list[BrandResult], references: int, seconds: float, report: Path | None) -> None:
+    print_brand_results(results)
+    failed = [result.name for result in results if result.error]
+    print(
+        f"batch brands={len(results)} ok={len(results) - len(failed)} failed={len(failed)} "
+        f"references={references} seconds={seconds:.2f}"
+    )
+    if report is not None:
+        document = {"seconds": seconds, "references": references, "brands": [asdict(result) for result in results]}
+        replace_atomically(report, lambda handle: handle.write((json.dumps(document, indent=2) + "\n").encode()))
+        print(f"wrote {report} brands={len(results)}")
+    if failed:
+        raise SystemExit(f"{len(failed)} of {len(results)} brand(s) failed: {', '.join(failed)}")
@@ -0,0 +1,848 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+from PIL import Image
+
+from logo_stages import DiskCaches, note_stage, profile_stage, rgba_array, source_of
+
+CANVAS_SIZE = 1024
+
+LETTERMARK_GOLD = (218, 175, 62, 255)
+SURFACE_OUTLIER_COUNT_LIMIT = 32
+SURFACE_OUTLIER_CLUSTER_LIMIT = 4
+
+SCRATCH_REACH_X = 10
+SCRATCH_REACH_Y = 6
+SURFACE_WINDOW_RADIUS = 3
+EDGE_MATTE_TOP_BAND = 95
+EDGE_MATTE_SEARCH_RADIUS = 47
+SCRATCH_SEARCH_RADIUS = 17
+SURFACE_SEARCH_RADIUS = 27
+REPAIR_MAX_PASSES = 8
+
+
+def writable_rgba(image: Image.Image) -> np.ndarray:
+    """A writable RGBA copy of ``image`` for the ``*_in_place`` stages, without convert()'s extra copy."""
+    return np.array(image if image.mode == "RGBA" else image.convert("RGBA"))
+
+
+def split_channels(pixels: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Widen to int32 so channel differences and products match the scalar int arithmetic.
+    r, g, b, a = (pixels[..., index].astype(np.int32) for index in range(4))
+    return r, g, b, a
+
+
+def reference_coverage(pixels: np.ndarray) -> np.ndarray:
+    r, g, b, a = split_channels(pixels)
+    brightness = np.maximum(np.maximum(r, g), b)
+    shadow_floor = np.minimum(np.minimum(r, g), b)
+    saturation = brightness - shadow_floor
+    visible = (a != 0) & (brightness >= 112) & (saturation <= 54) & (shadow_floor >= 78)
+    ramp = np.clip(np.round((brightness - 112) * 12.75), 0, 255)
+    coverage = np.where((brightness >= 132) & (shadow_floor >= 96), 255, ramp)
+    return np.where(visible, coverage, 0).astype(np.uint8)
+
+
+def extract_reference_foreground(reference: Image.Image, canvas_size: int = CANVAS_SIZE) -> Image.Image:
+    source = reference.convert("RGBA")
+    if source.size != (canvas_size, canvas_size):
+        source = source.resize((canvas_size, canvas_size), Image.Resampling.LANCZOS)
+
+    return Image.fromarray(reference_foreground_pixels(np.asarray(source)))
+
+
+def reference_foreground_pixels(pixels: np.ndarray) -> np.ndarray:
+    """Solid gold carrying the reference coverage as alpha, with fully transparent pixels cleared."""
+    coverage = reference_coverage(pixels)
+    foreground = np.zeros(coverage.shape + (4,), dtype=np.uint8)
+    foreground[coverage > 0] = (218, 175, 62, 0)
+    foreground[..., 3] = coverage
+    return foreground
+
+
+def is_red_contam(pixel: tuple[int, int, int, int]) -> bool:
+    r, g, b, a = pixel
+    # Exclude gold/cream family: when the pixel has warm gold character,
+    # it's metallic lettermark, not red matte contamination.
+    is_gold_family = (
+        # Bright gold/cream: high green, proportional blue
+        (g >= 140 and b >= 60 and g >= r * 0.60 and b >= g * 0.45)
+        # Dark gold/brown: low blue, green tracks red
+        or (g >= 55 and b < 60 and g >= r * 0.35 and r <= 200 and r - g <= 100)
+        # Mid gold: moderate green and blue, warm tone
+        or (g >= 100 and b >= 40 and g >= r * 0.55 and r <= 250 and r - g <= 80)
+    )
+    dark_tile_red = r >= 90 and g <= 40 and b <= 40 and r - g >= 55 and r - b >= 55
+    dark_matte = 35 <= r <= 130 and g <= 55 and b <= 45 and r >= g + 25 and r >= b + 25
+    bright_edge_red = r >= 150 and g <= 95 and b <= 100 and r - g >= 75 and r - b >= 75
+    rose_matte = r >= 175 and g <= 140 and b >= 35 and r - g >= 55 and r - b >= 45 and b * 100 >= max(g, 1) * 45
+    salmon_matte = r >= 220 and 100 <= g <= 180 and b >= 90 and r - g >= 55 and r - b >= 35
+    peach_matte = r >= 235 and 170 <= g <= 225 and b >= 140 and r - g >= 25 and r - b >= 35
+    if is_gold_family:
+        return False
+    return a > 0 and (dark_tile_red or dark_matte or bright_edge_red or rose_matte or salmon_matte or peach_matte)
+
+
+def is_bright_red_contam(pixel: tuple[int, int, int, int]) -> bool:
+    r, g, b, a = pixel
+    return a > 96 and r >= 180 and g <= 95 and b <= 100 and r - g >= 110 and r - b >= 100
+
+
+def is_dark_edge_matte(pixel: tuple[int, int, int, int]) -> bool:
+    r, g, b, a = pixel
+    return a > 0 and 35 <= r <= 130 and g <= 55 and b <= 45 and r >= g + 25 and r >= b + 25
+
+
+def gold_family_mask(pixels: np.ndarray) -> np.ndarray:
+    r, g, b, _ = split_channels(pixels)
+    return (
+        ((g >= 140) & (b >= 60) & (g >= r * 0.60) & (b >= g * 0.45))
+        | ((g >= 55) & (b < 60) & (g >= r * 0.35) & (r <= 200) & (r - g <= 100))
+        | ((g >= 100) & (b >= 40) & (g >= r * 0.55) & (r <= 250) & (r - g <= 80))
+    )
+
+
+def red_family_mask(pixels: np.ndarray) -> np.ndarray:
+    r, g, b, _ = split_channels(pixels)
+    dark_tile_red = (r >= 90) & (g <= 40) & (b <= 40) & (r - g >= 55) & (r - b >= 55)
+    dark_matte = (r >= 35) & (r <= 130) & (g <= 55) & (b <= 45) & (r >= g + 25) & (r >= b + 25)
+    bright_edge_red = (r >= 150) & (g <= 95) & (b <= 100) & (r - g >= 75) & (r - b >= 75)
+    rose_matte = (
+        (r >= 175) & (g <= 140) & (b >= 35) & (r - g >= 55) & (r - b >= 45) & (b * 100 >= np.maximum(g, 1) * 45)
+    )
+    salmon_matte = (r >= 220) & (g >= 100) & (g <= 180) & (b >= 90) & (r - g >= 55) & (r - b >= 35)
+    peach_matte = (r >= 235) & (g >= 170) & (g <= 225) & (b >= 140) & (r - g >= 25) & (r - b >= 35)
+    return dark_tile_red | dark_matte | bright_edge_red | rose_matte | salmon_matte | peach_matte
+
+
+def build_classifier_lut() -> np.ndarray:
+    table = np.zeros(1 << 24, dtype=bool)
+    green_blue = np.arange(1 << 16, dtype=np.uint32)
+    block = np.empty((1 << 16, 4), dtype=np.uint8)
+    block[:, 1] = green_blue >> 8
+    block[:, 2] = green_blue & 255
+    block[:, 3] = 255
+    for red in range(256):
+        block[:, 0] = red
+        table[red << 16 : (red + 1) << 16] = red_family_mask(block) & ~gold_family_mask(block)
+    return np.packbits(table, bitorder="little")
+
+
+@lru_cache(maxsize=1)
+def classifier_rules_digest() -> str:
+    rules = "".join(source_of(rule) for rule in (gold_family_mask, red_family_mask, build_classifier_lut))
+    return hashlib.sha256(rules.encode()).hexdigest()[:16]
+
+
+CLASSIFIER_LUTS: dict[str, np.ndarray] = {}  # built or loaded once per process, by rules digest
+
+
+def classifier_lut(caches: DiskCaches | None = None) -> np.ndarray:
+    """Red-contamination bitset over packed 24-bit RGB; alpha is checked by the callers.
+
+    The first call in a process builds the table, or loads it from ``caches``; later calls reuse it.
+    """
+    digest = classifier_rules_digest()
+    if digest not in CLASSIFIER_LUTS:
+        path = None if caches is None else caches.directory / f"classifier-lut-{digest}.npy"
+        if path is not None and path.exists():
+            CLASSIFIER_LUTS[digest] = np.load(path)
+        else:
+            CLASSIFIER_LUTS[digest] = build_classifier_lut()
+            if path is not None:
+                caches.save_array(path, CLASSIFIER_LUTS[digest])
+    return CLASSIFIER_LUTS[digest]
+
+
+def lut_lookup(pixels: np.ndarray) -> np.ndarray:
+    index = (
+        (pixels[..., 0].astype(np.uint32) << 16) | (pixels[..., 1].astype(np.uint32) << 8) | pixels[..., 2]
+    )
+    return ((classifier_lut()[index >> 3] >> (index & 7)) & 1).astype(bool)
+
+
+def red_contam_mask(pixels: np.ndarray) -> np.ndarray:
+    return (pixels[..., 3] > 0) & lut_lookup(pixels)
+
+
+def bright_red_contam_mask(pixels: np.ndarray) -> np.ndarray:
+    r, g, b, a = split_channels(pixels)
+    return (a > 96) & (r >= 180) & (g <= 95) & (b <= 100) & (r - g >= 110) & (r - b >= 100)
+
+
+def dark_edge_matte_mask(pixels: np.ndarray) -> np.ndarray:
+    r, g, b, a = split_channels(pixels)
+    return (a > 0) & (r >= 35) & (r <= 130) & (g <= 55) & (b <= 45) & (r >= g + 25) & (r >= b + 25)
+
+
+def visible_bounds(image: Image.Image) -> tuple[int, int, int, int]:
+    bounds = image.getchannel("A").getbbox()
+    if bounds is None:
+        raise ValueError("source has no visible pixels")
+    return bounds
+
+
+FILL_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1))
+
+
+def nearest_source_indices(sources: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Exact Euclidean feature transform: the (y, x) of the nearest True pixel."""
+    height, width = sources.shape
+    rows = np.arange(height)[:, None]
+    far = 2 * (height + width)
+    above = np.maximum.accumulate(np.where(sources, rows, -far), axis=0)
+    below = np.minimum.accumulate(np.where(sources, rows, far)[::-1], axis=0)[::-1]
+    column_row = np.where(rows - above <= below - rows, above, below)
+    column_cost = np.where(sources.any(axis=0), (rows - column_row).astype(np.float64) ** 2, np.inf)
+
+    # Lower envelope of the per-column parabolas, advanced one column at a time for every row at once.
+    all_rows = np.arange(height)
+    apex = np.zeros((height, width), dtype=np.int64)
+    bounds = np.empty((height, width + 1), dtype=np.float64)
+    depth = np.full(height, -1, dtype=np.int64)
+    for q in np.flatnonzero(np.isfinite(column_cost[0])).tolist():
+        cost = column_cost[:, q]
+        if depth[0] < 0:
+            depth[:] = 0
+            apex[:, 0] = q
+            bounds[:, 0] = -np.inf
+            bounds[:, 1] = np.inf
+            continue
+        while True:
+            previous = apex[all_rows, depth]
+            crossing = ((cost + q * q) - (column_cost[all_rows, previous] + previous * previous)) / (2 * (q - previous))
+            popped = crossing <= bounds[all_rows, depth]
+            if not popped.any():
+                break
+            depth -= popped
+        depth += 1
+        apex[all_rows, depth] = q
+        bounds[all_rows, depth] = crossing
+        bounds[all_rows, depth + 1] = np.inf
+
+    nearest_x = np.empty((height, width), dtype=np.int64)
+    depth[:] = 0
+    for q in range(width):
+        while True:
+            advance = bounds[all_rows, depth + 1] < q
+            if not advance.any():
+                break
+            depth += advance
+        nearest_x[:, q] = apex[all_rows, depth]
+    nearest_y = np.take_along_axis(column_row, nearest_x, axis=1)
+    return nearest_y, nearest_x
+
+
+def bfs_source_origins(red: np.ndarray, sources: np.ndarray, levels: np.ndarray | None = None) -> np.ndarray:
+    """Level-synchronous 8-connected fill through red pixels with the scalar queue's claim order.
+
+    Returns, per flat pixel, the flat index of the source whose colour it receives, or -1. When given,
+    ``levels`` receives each claimed pixel's breadth-first distance from its source.
+    """
+    height, width = red.shape
+    origin = np.full(height * width, -1, dtype=np.int64)
+    unclaimed = red.ravel().copy()
+    frontier = np.flatnonzero(sources)
+    origin[frontier] = frontier
+    level = 0
+    while frontier.size and unclaimed.any():
+        level += 1
+        frontier_y, frontier_x = np.divmod(frontier, width)
+        rank = np.arange(frontier.size, dtype=np.int64) * len(FILL_DIRECTIONS)
+        children: list[np.ndarray] = []
+        parents: list[np.ndarray] = []
+        priorities: list[np.ndarray] = []
+        for order, (dx, dy) in enumerate(FILL_DIRECTIONS):
+            ny, nx = frontier_y + dy, frontier_x + dx
+            inside = np.flatnonzero((nx >= 0) & (ny >= 0) & (nx < width) & (ny < height))
+            child = ny[inside] * width + nx[inside]
+            claimable = unclaimed[child]
+            children.append(child[claimable])
+            parents.append(frontier[inside[claimable]])
+            priorities.append(rank[inside[claimable]] + order)
+        priority = np.concatenate(priorities)
+        claim_order = np.argsort(priority)
+        child = np.concatenate(children)[claim_order]
+        parent = np.concatenate(parents)[claim_order]
+        # First claim wins, and the next level keeps claim order like the scalar deque did.
+        _, first = np.unique(child, return_index=True)
+        first.sort()
+        frontier = child[first]
+        origin[frontier] = origin[parent[first]]
+        unclaimed[frontier] = False
+        if levels is not None:
+            levels[frontier] = level
+    note_stage(passes=level)
+    return origin
+
+
+def nearest_non_red_fill(foreground: Image.Image, metric: str = "bfs") -> tuple[Image.Image, int, int]:
+    pixels = writable_rgba(foreground)
+    return (Image.fromarray(pixels), *nearest_non_red_fill_in_place(pixels, metric))
+
+
+def nearest_non_red_fill_in_place(pixels: np.ndarray, metric: str = "bfs") -> tuple[int, int]:
+    """Replace red contamination with the colour of the nearest non-red pixel.
+
+    ``metric="bfs"`` reproduces the historic 8-connected breadth-first fill, including its tie-breaking
+    and its square-scan fallback for red pixels unreachable through other red pixels, which it visits in
+    raster order. ``metric="euclidean"`` copies from the Euclidean-nearest source in one feature-transform pass.
+    """
+    if metric not in ("bfs", "euclidean"):
+        raise ValueError(f"unknown fill metric: {metric}")
+    height, width = pixels.shape[:2]
+    red = red_contam_mask(pixels)
+    red_before = int(np.count_nonzero(red))
+    note_stage(passes=0)
+    if not red_before:
+        return 0, 0
+
+    sources = ~red & (pixels[..., 3] > 40)
+    flat = pixels.reshape(-1, 4)
+    targets = np.flatnonzero(red)
+    if metric == "euclidean":
+        note_stage(passes=1)
+        if sources.any():
+            nearest_y, nearest_x = nearest_source_indices(sources)
+            flat[targets] = pixels[nearest_y.ravel()[targets], nearest_x.ravel()[targets]]
+    else:
+        origin = bfs_source_origins(red, sources)
+        reached = origin[targets] >= 0
+        flat[targets[reached]] = flat[origin[targets[reached]]]
+        if not reached.all():
+            leftover_y, leftover_x = np.divmod(targets[~reached], width)
+            donors = (pixels[..., 3] > 40) & ~red_contam_mask(pixels)
+            donor_y, donor_x, radius = DonorIndex(donors).nearest(leftover_y, leftover_x, max(width, height) - 1)
+            fill_unreached(pixels, leftover_y, leftover_x, donor_y, donor_x, radius)
+
+    # Only the targets changed, and everything else was already clean.
+    red_after = int(np.count_nonzero(red_contam_mask(flat[targets])))
+    return red_before, red_after
+
+
+def fill_unreached(
+    pixels: np.ndarray,
+    leftover_y: np.ndarray,
+    leftover_x: np.ndarray,
+    donor_y: np.ndarray,
+    donor_x: np.ndarray,
+    radius: np.ndarray,
+) -> None:
+    """The historic square-scan fallback over raster-ordered leftovers: each copies the first raster-order donor on
+    its smallest square ring, given by DonorIndex.nearest over the filled image, and becomes a donor for the
+    leftovers after it."""
+    width = pixels.shape[1]
+    filled_y = np.empty(leftover_y.size, dtype=np.int64)
+    filled_x = np.empty(leftover_x.size, dtype=np.int64)
+    filled = 0
+    for index in range(leftover_y.size):
+        y, x = int(leftover_y[index]), int(leftover_x[index])
+        nearest = int(radius[index]) if radius[index] > 0 else None
+        key = int(donor_y[index]) * width + int(donor_x[index])
+        if filled:
+            distance = np.maximum(np.abs(filled_y[:filled] - y), np.abs(filled_x[:filled] - x))
+            closest = int(distance.min())
+            if nearest is None or closest <= nearest:
+                ring = distance == closest
+                ring_key = int((filled_y[:filled][ring] * width + filled_x[:filled][ring]).min())
+                key = ring_key if nearest is None or closest < nearest else min(key, ring_key)
+                nearest = closest
+        if nearest is None:
+            continue
+        pixels[y, x] = pixels[key // width, key % width]
+        filled_y[filled], filled_x[filled] = y, x
+        filled += 1
+
+
+def clear_transparent_rgb(image: Image.Image) -> Image.Image:
+    pixels = writable_rgba(image)
+    pixels[pixels[..., 3] == 0] = 0
+    return Image.fromarray(pixels)
+
+
+def integral_image(mask: np.ndarray) -> np.ndarray:
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int64), axis=1, out=table[1:, 1:])
+    return table
+
+
+def window_counts(table: np.ndarray, radius_y: int, radius_x: int) -> np.ndarray:
+    """Per-pixel count of set pixels in the clipped (2 * radius + 1) window of an integral image."""
+    height, width = table.shape[0] - 1, table.shape[1] - 1
+    rows = np.arange(height)
+    columns = np.arange(width)
+    top = np.clip(rows - radius_y, 0, height)[:, None]
+    bottom = np.clip(rows + radius_y + 1, 0, height)[:, None]
+    left = np.clip(columns - radius_x, 0, width)[None, :]
+    right = np.clip(columns + radius_x + 1, 0, width)[None, :]
+    return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+
+def run_distance(mask: np.ndarray, axis: int, forward: bool) -> np.ndarray:
+    """Distance along ``axis`` to the nearest set pixel strictly after (forward) or before each pixel."""
+    lines = mask if axis == 1 else mask.T
+    count, length = lines.shape
+    far = 2 * length + 1
+    positions = np.arange(length)
+    if forward:
+        nearest = np.minimum.accumulate(np.where(lines, positions, far)[:, ::-1], axis=1)[:, ::-1]
+        nearest = np.concatenate((nearest[:, 1:], np.full((count, 1), far)), axis=1)
+        distance = nearest - positions
+    else:
+        nearest = np.maximum.accumulate(np.where(lines, positions, -far), axis=1)
+        nearest = np.concatenate((np.full((count, 1), -far), nearest[:, :-1]), axis=1)
+        distance = positions - nearest
+    return distance if axis == 1 else distance.T
+
+
+def outer_edge_matte_mask(pixels: np.ndarray, top_band: int) -> np.ndarray:
+    touches_transparency = window_counts(integral_image(pixels[..., 3] == 0), 2, 2) > 0
+    selected = dark_edge_matte_mask(pixels) & touches_transparency
+    selected[top_band:] = False
+    return selected
+
+
+def alpha_scratch_mask(alpha: np.ndarray) -> np.ndarray:
+    opaque = alpha > 180
+    horizontal = (run_distance(opaque, 1, forward=False) <= SCRATCH_REACH_X) & (
+        run_distance(opaque, 1, forward=True) <= SCRATCH_REACH_X
+    )
+    vertical = (run_distance(opaque, 0, forward=False) <= SCRATCH_REACH_Y) & (
+        run_distance(opaque, 0, forward=True) <= SCRATCH_REACH_Y
+    )
+    return (alpha <= 40) & (horizontal | vertical)
+
+
+def alpha_scratch_points(alpha: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """alpha_scratch_mask evaluated only at the given coordinates."""
+    height, width = alpha.shape
+    opaque = alpha > 180
+
+    def reaches(dx: int, dy: int, steps: int) -> np.ndarray:
+        hit = np.zeros(ys.shape, dtype=bool)
+        for step in range(1, steps + 1):
+            nx, ny = xs + dx * step, ys + dy * step
+            inside = (nx >= 0) & (ny >= 0) & (nx < width) & (ny < height)
+            hit[inside] |= opaque[ny[inside], nx[inside]]
+        return hit
+
+    horizontal = reaches(-1, 0, SCRATCH_REACH_X) & reaches(1, 0, SCRATCH_REACH_X)
+    vertical = reaches(0, -1, SCRATCH_REACH_Y) & reaches(0, 1, SCRATCH_REACH_Y)
+    return (alpha[ys, xs] <= 40) & (horizontal | vertical)
+
+
+def cross_offsets(reach_x: int, reach_y: int) -> list[tuple[int, int]]:
+    return [(dx, 0) for dx in range(-reach_x, reach_x + 1)] + [(0, dy) for dy in range(-reach_y, reach_y + 1) if dy]
+
+
+def box_offsets(radius: int) -> list[tuple[int, int]]:
+    return [(dx, dy) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)]
+
+
+def ring_offsets(radius: int) -> tuple[np.ndarray, np.ndarray]:
+    """(dy, dx) of the square ring at Chebyshev distance ``radius``, in raster order."""
+    side = np.arange(-radius, radius + 1)
+    middle = np.arange(-radius + 1, radius)
+    dy = np.concatenate((np.full(side.size, -radius), np.repeat(middle, 2), np.full(side.size, radius)))
+    dx = np.concatenate((side, np.tile([-radius, radius], middle.size), side))
+    return dy, dx
+
+
+def reach_box(ys: np.ndarray, xs: np.ndarray, reach: int, height: int, width: int) -> tuple[slice, slice]:
+    """Rows and columns within ``reach`` of any of the (non-empty) points, clipped to the image."""
+    return (
+        slice(max(0, int(ys.min()) - reach), min(height, int(ys.max()) + reach + 1)),
+        slice(max(0, int(xs.min()) - reach), min(width, int(xs.max()) + reach + 1)),
+    )
+
+
+class DonorIndex:
+    """Replacement-donor queries over a fixed donor mask, answering the repair stages' expanding-square scans.
+
+    The smallest clipped square holding a donor comes from a binary search on an integral image, so each query
+    reads only the one ring the scan would have stopped at instead of every square up to it. ``donors`` may be
+    a reach_box crop of the image at ``origin``; queries take and return image coordinates.
+    """
+
+    def __init__(self, donors: np.ndarray, origin: tuple[int, int] = (0, 0)) -> None:
+        self.donors = donors
+        self.height, self.width = donors.shape
+        self.top, self.left = origin
+        self.table = integral_image(donors)
+
+    def counts(self, ys: np.ndarray, xs: np.ndarray, radius: np.ndarray | int) -> np.ndarray:
+        ys, xs = ys - self.top, xs - self.left
+        top, bottom = np.clip(ys - radius, 0, self.height), np.clip(ys + radius + 1, 0, self.height)
+        left, right = np.clip(xs - radius, 0, self.width), np.clip(xs + radius + 1, 0, self.width)
+        table = self.table
+        return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+    def radius(self, ys: np.ndarray, xs: np.ndarray, smallest: int, largest: int) -> np.ndarray:
+        """Per point, the smallest radius in [smallest, largest] whose clipped square holds a donor, or -1."""
+        low = np.full(ys.shape, smallest, dtype=np.int64)
+        high = np.full(ys.shape, max(smallest, largest), dtype=np.int64)
+        while True:
+            searching = low < high
+            if not searching.any():
+                break
+            middle = (low + high) // 2
+            hit = self.counts(ys, xs, middle) > 0
+            high = np.where(searching & hit, middle, high)
+            low = np.where(searching & ~hit, middle + 1, low)
+        return np.where((low <= largest) & (self.counts(ys, xs, low) > 0), low, -1)
+
+    def nearest(self, ys: np.ndarray, xs: np.ndarray, largest: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """First raster-order donor on the smallest square ring (radius 1 to ``largest``) around each point.
+
+        Returns the donor ys, xs and the ring radius; where the radius is -1 no donor is in reach.
+        """
+        radius = self.radius(ys, xs, 1, largest)
+        donor_y, donor_x = ys - self.top, xs - self.left
+        for reach in np.unique(radius[radius > 0]).tolist():
+            group = np.flatnonzero(radius == reach)
+            dy, dx = ring_offsets(reach)
+            ring_y, ring_x = donor_y[group, None] + dy, donor_x[group, None] + dx
+            inside = (ring_y >= 0) & (ring_y < self.height) & (ring_x >= 0) & (ring_x < self.width)
+            hit = inside & self.donors[np.clip(ring_y, 0, self.height - 1), np.clip(ring_x, 0, self.width - 1)]
+            first = hit.argmax(axis=1)
+            rows = np.arange(group.size)
+            donor_y[group], donor_x[group] = ring_y[rows, first], ring_x[rows, first]
+        return donor_y + self.top, donor_x + self.left, radius
+
+
+def replacement_donors(pixels: np.ndarray, alpha_above: int) -> np.ndarray:
+    """Pixels a repair may copy from: more opaque than ``alpha_above`` and neither red contamination nor dark matte."""
+    return (pixels[..., 3] > alpha_above) & ~red_contam_mask(pixels) & ~dark_edge_matte_mask(pixels)
+
+
+def influence_points(
+    changed: Iterable[tuple[int, int]],
+    offsets: list[tuple[int, int]],
+    width: int,
+    height: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Raster-ordered (ys, xs) whose classification can depend on a changed pixel."""
+    points = np.array(list(changed), dtype=np.int64).reshape(-1, 2)
+    shifts = np.array(offsets, dtype=np.int64)
+    xs = (points[:, None, 0] + shifts[None, :, 0]).ravel()
+    ys = (points[:, None, 1] + shifts[None, :, 1]).ravel()
+    inside = (xs >= 0) & (ys >= 0) & (xs < width) & (ys < height)
+    return np.divmod(np.unique(ys[inside] * width + xs[inside]), width)
+
+
+def repair_outer_edge_matte(
+    foreground: Image.Image, top_band: int = EDGE_MATTE_TOP_BAND
+) -> tuple[Image.Image, int, int]:
+    pixels = writable_rgba(foreground)
+    return (Image.fromarray(pixels), *repair_outer_edge_matte_in_place(pixels, top_band))
+
+
+def repair_outer_edge_matte_in_place(pixels: np.ndarray, top_band: int = EDGE_MATTE_TOP_BAND) -> tuple[int, int]:
+    top_band = min(max(top_band, 0), pixels.shape[0])
+    selected = outer_edge_matte_mask(pixels, top_band)
+
+    before = int(np.count_nonzero(selected))
+    note_stage(passes=int(before > 0))
+    if not before:
+        return 0, 0
+
+    # Donors skip every selected pixel, so replacements never feed each other and land in one step.
+    ys, xs = np.nonzero(selected)
+    box = reach_box(ys, xs, EDGE_MATTE_SEARCH_RADIUS, *selected.shape)
+    donors = replacement_donors(pixels[box], 40) & ~selected[box]
+    donor_index = DonorIndex(donors, (box[0].start, box[1].start))
+    donor_y, donor_x, radius = donor_index.nearest(ys, xs, EDGE_MATTE_SEARCH_RADIUS)
+    found = radius > 0
+    pixels[ys[found], xs[found]] = pixels[donor_y[found], donor_x[found]]
+
+    return before, int(np.count_nonzero(outer_edge_matte_mask(pixels, top_band)))
+
+
+def repair_alpha_scratches(foreground: Image.Image) -> tuple[Image.Image, int, int]:
+    pixels = writable_rgba(foreground)
+    return (Image.fromarray(pixels), *repair_alpha_scratches_in_place(pixels))
+
+
+def repair_alpha_scratches_in_place(pixels: np.ndarray) -> tuple[int, int]:
+    height, width = pixels.shape[:2]
+    alpha = pixels[..., 3]
+    selected = alpha_scratch_mask(alpha)
+    before = int(np.count_nonzero(selected))
+    if not before:
+        return 0, 0
+
+    influence = cross_offsets(SCRATCH_REACH_X, SCRATCH_REACH_Y)
+    for passes in range(1, REPAIR_MAX_PASSES + 1):
+        note_stage(passes=passes)
+        ys, xs = np.nonzero(selected)
+        box = reach_box(ys, xs, SCRATCH_SEARCH_RADIUS, height, width)
+        donors = replacement_donors(pixels[box], 180) & ~selected[box]
+        donor_index = DonorIndex(donors, (box[0].start, box[1].start))
+        donor_y, donor_x, radius = donor_index.nearest(ys, xs, SCRATCH_SEARCH_RADIUS)
+        found = radius > 0
+        if not found.any():
+            break
+        ys, xs = ys[found], xs[found]
+        pixels[ys, xs] = pixels[donor_y[found], donor_x[found]]
+        # Only pixels whose scan window holds a changed pixel can change classification.
+        check_y, check_x = influence_points(zip(xs.tolist(), ys.tolist()), influence, width, height)
+        selected[check_y, check_x] = alpha_scratch_points(alpha, check_y, check_x)
+        if not selected.any():
+            break
+
+    return before, int(np.count_nonzero(selected))
+
+
+def polish_lettermark(foreground: Image.Image) -> Image.Image:
+    """Apply flat solid gold to the extracted lettermark mask."""
+    rgba = foreground.convert("RGBA")
+    width, height = rgba.size
+    pixels = rgba.load()
+
+    for y in range(height):
+        for x in range(width):
+            _, _, _, a = pixels[x, y]
+            if a == 0:
+                continue
+            pixels[x, y] = (LETTERMARK_GOLD[0], LETTERMARK_GOLD[1], LETTERMARK_GOLD[2], a)
+
+    return rgba
+
+
+def finish_lettermark_in_place(pixels: np.ndarray) -> None:
+    """polish_lettermark followed by clear_transparent_rgb in one pass over the colour channels."""
+    visible = pixels[..., 3:] != 0
+    np.multiply(visible, np.array(LETTERMARK_GOLD[:3], dtype=np.uint8), out=pixels[..., :3])
+
+
+def luminance(pixel: tuple[int, int, int, int]) -> float:
+    r, g, b, _ = pixel
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def luminance_array(pixels: np.ndarray) -> np.ndarray:
+    # Same operation order as luminance() so ties and near-ties sort identically.
+    return 0.2126 * pixels[..., 0] + 0.7152 * pixels[..., 1] + 0.0722 * pixels[..., 2]
+
+
+def surface_outlier_points(pixels: np.ndarray, ys: np.ndarray, xs: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """7x7 masked luminance-median outlier test at coordinates at least 5px inside the border."""
+    offsets = [(dx, dy) for dx, dy in box_offsets(SURFACE_WINDOW_RADIUS) if dx or dy]
+    window_x = np.array([dx for dx, _ in offsets])
+    window_y = np.array([dy for _, dy in offsets])
+    outliers = np.zeros(ys.shape, dtype=bool)
+    for start in range(0, ys.size, chunk):
+        cy, cx = ys[start : start + chunk], xs[start : start + chunk]
+        center = pixels[cy, cx].astype(np.int64)
+        window = pixels[cy[:, None] + window_y, cx[:, None] + window_x].astype(np.int64)
+        interior = (center[:, 3] >= 220) & (window[..., 3] >= 180).all(axis=1)
+        is_sample = window[..., 3] > 220
+        keep = np.flatnonzero(interior & (is_sample.sum(axis=1) >= 35))
+        if not keep.size:
+            continue
+        center, window, is_sample = center[keep], window[keep], is_sample[keep]
+        keys = np.where(is_sample, luminance_array(window), np.inf)
+        order = np.argsort(keys, axis=1, kind="stable")
+        middle = order[np.arange(keep.size), is_sample.sum(axis=1) // 2]
+        median = window[np.arange(keep.size), middle]
+        color_distance = np.abs(center[:, :3] - median[:, :3]).sum(axis=1)
+        luminance_gap = np.abs(luminance_array(center) - luminance_array(median))
+        outliers[start + keep] = (color_distance > 145) & (luminance_gap > 48)
+    return outliers
+
+
+def surface_outlier_mask(pixels: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    height, width = pixels.shape[:2]
+    alpha = pixels[..., 3]
+    radius = SURFACE_WINDOW_RADIUS
+    candidates = alpha >= 220
+    candidates &= window_counts(integral_image(alpha < 180), radius, radius) == 0
+    candidates &= window_counts(integral_image(alpha > 220), radius, radius) - (alpha > 220) >= 35
+    candidates[:5] = False
+    candidates[height - 5 :] = False
+    candidates[:, :5] = False
+    candidates[:, width - 5 :] = False
+    selected = np.zeros((height, width), dtype=bool)
+    ys, xs = np.nonzero(candidates)
+    selected[ys, xs] = surface_outlier_points(pixels, ys, xs, chunk)
+    return selected
+
+
+def collect_lettermark_surface_outliers(foreground: Image.Image) -> np.ndarray:
+    return surface_outlier_mask(rgba_array(foreground))
+
+
+@dataclass(frozen=True)
+class ComponentStats:
+    sizes: np.ndarray
+    bounds: np.ndarray  # (x0, y0, x1, y1) per component, inclusive
+    centroids: np.ndarray  # (x, y) per component
+
+    @property
+    def largest(self) -> int:
+        return int(self.sizes.max()) if self.sizes.size else 0
+
+
+def label_components(mask: np.ndarray, connectivity: int = 4) -> ComponentStats:
+    """Run-length connected components of a boolean mask, in raster order of each component's first run."""
+    if connectivity not in (4, 8):
+        raise ValueError(f"connectivity must be 4 or 8, not {connectivity}")
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    run_ends = np.nonzero(edges == -1)[1]
+    if not run_rows.size:
+        return ComponentStats(np.zeros(0, np.int64), np.zeros((0, 4), np.int64), np.zeros((0, 2), np.float64))
+
+    # Runs in the next row that touch run i form a contiguous slice of the raster-ordered run list.
+    stride = width + 2
+    reach = 1 if connectivity == 8 else 0
+    next_row = (run_rows + 1) * stride
+    first = np.searchsorted(run_rows * stride + run_ends, next_row + run_starts - reach, side="right")
+    stop = np.searchsorted(run_rows * stride + run_starts, next_row + run_ends + reach, side="left")
+    counts = np.maximum(stop - first, 0)
+    upper = np.repeat(np.arange(run_rows.size), counts)
+    lower = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    parent = np.arange(run_rows.size)
+    while upper.size:
+        left, right = parent[upper], parent[lower]
+        if np.array_equal(left, right):
+            break
+        np.minimum.at(parent, np.maximum(left, right), np.minimum(left, right))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    _, component = np.unique(parent, return_inverse=True)
+    count = int(component.max()) + 1
+    lengths = run_ends - run_starts
+    sizes = np.bincount(component, weights=lengths, minlength=count).astype(np.int64)
+    bounds = np.empty((count, 4), dtype=np.int64)
+    bounds[:, :2] = np.iinfo(np.int64).max
+    bounds[:, 2:] = -1
+    np.minimum.at(bounds[:, 0], component, run_starts)
+    np.minimum.at(bounds[:, 1], component, run_rows)
+    np.maximum.at(bounds[:, 2], component, run_ends - 1)
+    np.maximum.at(bounds[:, 3], component, run_rows)
+    sum_x = np.bincount(component, weights=lengths * (run_starts + run_ends - 1) / 2, minlength=count)
+    sum_y = np.bincount(component, weights=lengths * run_rows, minlength=count)
+    centroids = np.stack((sum_x / sizes, sum_y / sizes), axis=1)
+    return ComponentStats(sizes, bounds, centroids)
+
+
+def outlier_largest_cluster(outliers: np.ndarray) -> int:
+    return label_components(outliers).largest
+
+
+def outlier_bounds(outliers: np.ndarray) -> str:
+    return hit_bounds(outliers.any(axis=1), outliers.any(axis=0))
+
+
+def hit_bounds(row_hits: np.ndarray, column_hits: np.ndarray) -> str:
+    rows = np.flatnonzero(row_hits)
+    if not rows.size:
+        return "none"
+    columns = np.flatnonzero(column_hits)
+    return f"({columns[0]},{rows[0]})-({columns[-1]},{rows[-1]})"
+
+
+def format_cluster(bounds: np.ndarray, centroid: np.ndarray) -> str:
+    x0, y0, x1, y1 = bounds.tolist()
+    return f"bbox=({x0},{y0})-({x1},{y1}) centroid=({centroid[0]:.1f},{centroid[1]:.1f})"
+
+
+def surface_replacements(
+    pixels: np.ndarray,
+    ys: np.ndarray,
+    xs: np.ndarray,
+    selected: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Per outlier, the luminance median of the unselected opaque gold pixels in the smallest square (radius 4 to
+    SURFACE_SEARCH_RADIUS) holding any, ties kept in raster order; returns the colours and which were found."""
+    box = reach_box(ys, xs, SURFACE_SEARCH_RADIUS, *selected.shape)
+    top, left = box[0].start, box[1].start
+    donors = replacement_donors(pixels[box], 220) & ~selected[box]
+    radius = DonorIndex(donors, (top, left)).radius(ys, xs, 4, SURFACE_SEARCH_RADIUS)
+    colours = np.zeros((ys.size, 4), dtype=np.uint8)
+    for index in np.flatnonzero(radius > 0).tolist():
+        y, x, reach = int(ys[index]) - top, int(xs[index]) - left, int(radius[index])
+        window_top, window_left = max(0, y - reach), max(0, x - reach)
+        donor_y, donor_x = np.nonzero(donors[window_top : y + reach + 1, window_left : x + reach + 1])
+        candidates = pixels[box][donor_y + window_top, donor_x + window_left]
+        colours[index] = candidates[np.argsort(luminance_array(candidates), kind="stable")[len(candidates) // 2]]
+    return colours, radius > 0
+
+
+def repair_lettermark_surface_outliers(foreground: Image.Image) -> tuple[Image.Image, int, int, int, str]:
+    pixels = writable_rgba(foreground)
+    return (Image.fromarray(pixels), *repair_lettermark_surface_outliers_in_place(pixels))
+
+
+def repair_lettermark_surface_outliers_in_place(pixels: np.ndarray) -> tuple[int, int, int, str]:
+    height, width = pixels.shape[:2]
+    outliers = surface_outlier_mask(pixels)
+    before = int(np.count_nonzero(outliers))
+    note_stage(passes=0)
+    if not before:
+        return 0, 0, 0, "none"
+    before_largest = outlier_largest_cluster(outliers)
+    if before <= SURFACE_OUTLIER_COUNT_LIMIT and before_largest <= SURFACE_OUTLIER_CLUSTER_LIMIT:
+        return before, before, before_largest, outlier_bounds(outliers)
+
+    influence = box_offsets(SURFACE_WINDOW_RADIUS)
+    for passes in range(1, REPAIR_MAX_PASSES + 1):
+        selected_count = int(np.count_nonzero(outliers))
+        if not selected_count:
+            break
+        if (
+            selected_count <= SURFACE_OUTLIER_COUNT_LIMIT
+            and outlier_largest_cluster(outliers) <= SURFACE_OUTLIER_CLUSTER_LIMIT
+        ):
+            break
+        note_stage(passes=passes)
+        ys, xs = np.nonzero(outliers)
+        colours, found = surface_replacements(pixels, ys, xs, outliers)
+        if not found.any():
+            break
+        ys, xs = ys[found], xs[found]
+        pixels[ys, xs] = colours[found]
+        check_y, check_x = influence_points(zip(xs.tolist(), ys.tolist()), influence, width, height)
+        inside = (check_x >= 5) & (check_y >= 5) & (check_x < width - 5) & (check_y < height - 5)
+        outliers[check_y, check_x] = False
+        outliers[check_y[inside], check_x[inside]] = surface_outlier_points(pixels, check_y[inside], check_x[inside])
+
+    after = int(np.count_nonzero(outliers))
+    return before, after, outlier_largest_cluster(outliers), outlier_bounds(outliers)
+
+
+def clean_foreground(
+    foreground: Image.Image,
+) -> tuple[Image.Image, tuple[int, int], tuple[int, int], tuple[int, int], tuple[int, int, int, str]]:
+    """The cleaning chain from nearest_non_red_fill to clear_transparent_rgb on one writable RGBA buffer.
+
+    Every stage mutates the buffer in place, so the chain copies the foreground once and the returned image
+    shares memory with it. Returns the fill, edge matte, scratch and surface statistics like the tiled chain.
+    """
+    pixels = writable_rgba(foreground)
+    height, width = pixels.shape[:2]
+    with profile_stage("nearest_non_red_fill", height * width):
+        fill = nearest_non_red_fill_in_place(pixels)
+    with profile_stage("repair_outer_edge_matte", height * width):
+        edge_matte = repair_outer_edge_matte_in_place(pixels)
+    with profile_stage("repair_alpha_scratches", height * width):
+        alpha_scratch = repair_alpha_scratches_in_place(pixels)
+    with profile_stage("repair_lettermark_surface_outliers", height * width):
+        surface = repair_lettermark_surface_outliers_in_place(pixels)
+    with profile_stage("polish_lettermark", height * width):
+        finish_lettermark_in_place(pixels)
+    return Image.fromarray(pixels), fill, edge_matte, alpha_scratch, surface
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from logo_stages import DiskCaches, code_fingerprint, image_digest, rgba_array
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_ZLIB_TRIALS = (
+    (9, zlib.Z_DEFAULT_STRATEGY),
+    (9, zlib.Z_FILTERED),
+    (9, zlib.Z_RLE),
+    (6, zlib.Z_DEFAULT_STRATEGY),
+)
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def png_filtered_rows(raw: np.ndarray, bpp: int) -> np.ndarray:
+    """Scanlines under each of the five PNG filters, shape (5, rows, stride)."""
+    raw = raw.astype(np.int16)
+    left = np.zeros_like(raw)
+    left[:, bpp:] = raw[:, :-bpp]
+    up = np.zeros_like(raw)
+    up[1:] = raw[:-1]
+    upper_left = np.zeros_like(raw)
+    upper_left[1:, bpp:] = raw[:-1, :-bpp]
+    estimate = left + up - upper_left
+    distance_left, distance_up, distance_corner = (np.abs(estimate - base) for base in (left, up, upper_left))
+    paeth = np.where(
+        (distance_left <= distance_up) & (distance_left <= distance_corner),
+        left,
+        np.where(distance_up <= distance_corner, up, upper_left),
+    )
+    predictions = (0, left, up, (left + up) >> 1, paeth)
+    return np.stack([(raw - prediction) & 0xFF for prediction in predictions]).astype(np.uint8)
+
+
+def png_scanlines(filtered: np.ndarray, choice: int | None) -> bytes:
+    """Filter-type-prefixed scanlines; ``choice=None`` picks each row's minimum-sum-of-absolute-differences filter."""
+    rows = filtered.shape[1]
+    if choice is None:
+        cost = np.abs(filtered.view(np.int8).astype(np.int32)).sum(axis=2)
+        types = np.argmin(cost, axis=0)
+    else:
+        types = np.full(rows, choice)
+    lines = filtered[types, np.arange(rows)]
+    return np.concatenate([types.astype(np.uint8)[:, None], lines], axis=1).tobytes()
+
+
+def png_raw_images(pixels: np.ndarray) -> list[tuple[int, int, np.ndarray, int, bytes]]:
+    """Lossless (colour type, bit depth, scanline bytes, bytes per pixel, PLTE+tRNS chunks) encodings of RGBA pixels."""
+    height, width = pixels.shape[:2]
+    candidates = [(6, 8, pixels.reshape(height, width * 4), 4, b"")]
+    if (pixels[..., 3] == 255).all():
+        candidates.append((2, 8, pixels[..., :3].reshape(height, width * 3), 3, b""))
+    packed = pixels.reshape(-1, 4).view(np.uint32).ravel()
+    colours, indices = np.unique(packed, return_inverse=True)
+    if colours.size <= 256:
+        palette = colours.view(np.uint8).reshape(-1, 4)
+        # Translucent entries first so tRNS can stop at the last one.
+        order = np.argsort(palette[:, 3] == 255, kind="stable")
+        palette = palette[order]
+        indices = np.argsort(order)[indices].reshape(height, width).astype(np.uint8)
+        depth = next(bits for bits in (1, 2, 4, 8) if colours.size <= 1 << bits)
+        per_byte = 8 // depth
+        padded = np.zeros((height, -(-width // per_byte) * per_byte), dtype=np.uint8)
+        padded[:, :width] = indices
+        groups = padded.reshape(height, -1, per_byte).astype(np.uint16)
+        shifts = np.arange(per_byte - 1, -1, -1, dtype=np.uint16) * depth
+        scanlines = (groups << shifts).sum(axis=2).astype(np.uint8)
+        translucent = int(np.count_nonzero(palette[:, 3] != 255))
+        chunks = png_chunk(b"PLTE", palette[:, :3].tobytes())
+        if translucent:
+            chunks += png_chunk(b"tRNS", palette[:translucent, 3].tobytes())
+        candidates.append((3, depth, scanlines, 1, chunks))
+    return candidates
+
+
+def png_trials(pixels: np.ndarray) -> list[bytes]:
+    """Encodings over filter choices, zlib levels and strategies, carrying only critical chunks."""
+    height, width = pixels.shape[:2]
+    trials = []
+    for colour_type, depth, raw, bpp, palette_chunks in png_raw_images(pixels):
+        header = png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, depth, colour_type, 0, 0, 0))
+        filtered = png_filtered_rows(raw, bpp)
+        choices: list[int | None] = [None, 0, 1, 2, 3, 4]
+        # A fast pass ranks the filter choices; the slow level and strategy search runs on the best two.
+        screened = sorted(choices, key=lambda choice: len(zlib.compress(png_scanlines(filtered, choice), 1)))[:2]
+        for choice in screened:
+            scanlines = png_scanlines(filtered, choice)
+            for level, strategy in PNG_ZLIB_TRIALS:
+                compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+                data = compressor.compress(scanlines) + compressor.flush()
+                chunks = palette_chunks + png_chunk(b"IDAT", data) + png_chunk(b"IEND", b"")
+                trials.append(PNG_SIGNATURE + header + chunks)
+    return trials
+
+
+def decodes_to(data: bytes, pixels: np.ndarray) -> bool:
+    with Image.open(io.BytesIO(data)) as decoded:
+        return np.array_equal(np.asarray(decoded.convert("RGBA")), pixels)
+
+
+def png_cache_path(image: Image.Image, caches: DiskCaches | None) -> Path | None:
+    if caches is None:
+        return None
+    key = hashlib.sha256(code_fingerprint(optimize_png).encode() + image_digest(image).encode())
+    return caches.png / f"{key.hexdigest()[:24]}.png"
+
+
+def png_cached(image: Image.Image, caches: DiskCaches | None) -> bool:
+    path = png_cache_path(image, caches)
+    return path is not None and path.is_file()
+
+
+def optimize_png(image: Image.Image, caches: DiskCaches | None = None) -> tuple[bytes, int]:
+    """Smallest pixel-exact PNG for the image, and the size of Pillow's default encoding for comparison."""
+    pixels = np.ascontiguousarray(rgba_array(image))
+    path = png_cache_path(image, caches)
+    if path is not None:
+        if path.exists():
+            stored = path.read_bytes()
+            return stored[8:], struct.unpack(">Q", stored[:8])[0]
+
+    baseline = encode_png(image.convert("RGBA"))
+    for data in sorted([baseline, *png_trials(pixels)], key=len):
+        if decodes_to(data, pixels):
+            break
+    else:
+        raise ValueError("no PNG encoding round-trips the image exactly")
+    if path is not None:
+        caches.write(path, lambda handle: handle.write(struct.pack(">Q", len(baseline)) + data))
+    return data, len(baseline)
+
+
+def encode_ico(frames: tuple[Image.Image, ...], caches: DiskCaches | None = None) -> tuple[bytes, int]:
+    """ICO container holding each frame as its optimized PNG, and its size with Pillow's default frame encodings."""
+    optimized = [optimize_png(frame, caches) for frame in frames]
+    images = [data for data, _ in optimized]
+    header = struct.pack("<HHH", 0, 1, len(frames))
+    offset = len(header) + 16 * len(frames)
+    entries = b""
+    for frame, data in zip(frames, images):
+        # Width and height 0 mean 256 in the directory entry.
+        entries += struct.pack("<BBBBHHII", frame.width % 256, frame.height % 256, 0, 0, 1, 32, len(data), offset)
+        offset += len(data)
+    data = header + entries + b"".join(images)
+    return data, len(data) - sum(map(len, images)) + sum(default_bytes for _, default_bytes in optimized)
@@ -0,0 +1,462 @@
+from __future__ import annotations
+
+import ast
+import cProfile
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+import zlib
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field, fields, is_dataclass
+from functools import cached_property, lru_cache, partial
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, ContextManager, Iterable, Iterator
+
+import numpy as np
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module; peak RSS is reported as null there.
+    resource = None
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+
+def replace_atomically(path: Path, write: Callable[[BinaryIO], object]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with temporary.open("wb") as handle:
+            write(handle)
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+@dataclass(frozen=True)
+class DiskCaches:
+    """Where the classifier LUT, rounded tiles, stage results, optimized PNGs, build records and the output
+    manifest are kept.
+
+    Functions that can cache take one of these, or None to cache nothing on disk (the default for library
+    callers). ``read_only`` caches are read but never written, as --check needs.
+    """
+
+    directory: Path
+    read_only: bool = False
+
+    @property
+    def tiles(self) -> Path:
+        return self.directory / "tiles"
+
+    @property
+    def stages(self) -> Path:
+        return self.directory / "stages"
+
+    @property
+    def png(self) -> Path:
+        return self.directory / "png"
+
+    @property
+    def builds(self) -> Path:
+        return self.directory / "builds"
+
+    @property
+    def manifest(self) -> Path:
+        return self.directory / "output-manifest.json"
+
+    def write(self, path: Path, write: Callable[[BinaryIO], object]) -> None:
+        """replace_atomically for cache entries: an unwritable cache only costs the recomputation next time."""
+        if self.read_only:
+            return
+        try:
+            replace_atomically(path, write)
+        except OSError:
+            pass
+
+    def save_array(self, path: Path, array: np.ndarray) -> None:
+        self.write(path, lambda handle: np.save(handle, array))
+
+
+@dataclass
+class StageRecord:
+    stage: str
+    label: str | None
+    pixels: int
+    seconds: float = 0.0
+    pixelsPerSecond: float = 0.0
+    allocatedBytes: int = 0
+    peakAllocatedBytes: int = 0
+    peakRssBytes: int | None = None
+    passes: int | None = None
+    cached: bool = False
+    cprofile: str | None = None
+    traced_peak: int = field(default=0, repr=False)
+
+
+def peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageProfiler:
+    """Collects per-stage wall time, throughput, allocation and pass counts for --profile."""
+
+    def __init__(self, cprofile_dir: Path | None = None) -> None:
+        self.records: list[StageRecord] = []
+        self.active: list[StageRecord] = []
+        self.cprofile_dir = cprofile_dir
+        self.started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, pixels: int, label: str | None = None) -> Iterator[StageRecord]:
+        record = StageRecord(stage=name, label=label, pixels=pixels)
+        profile = cProfile.Profile() if self.cprofile_dir is not None and not self.active else None
+        self.records.append(record)
+        self.active.append(record)
+        start_allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            record.seconds = time.perf_counter() - started
+            allocated, peak = tracemalloc.get_traced_memory()
+            record.traced_peak = max(record.traced_peak, peak)
+            record.allocatedBytes = allocated - start_allocated
+            record.peakAllocatedBytes = max(0, record.traced_peak - start_allocated)
+            record.pixelsPerSecond = pixels / record.seconds if record.seconds > 0 else 0.0
+            record.peakRssBytes = peak_rss_bytes()
+            self.active.pop()
+            if self.active:
+                # reset_peak() above hid this stage's peak from the enclosing stage.
+                self.active[-1].traced_peak = max(self.active[-1].traced_peak, record.traced_peak)
+            if profile is not None and self.cprofile_dir is not None:
+                self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+                path = self.cprofile_dir / f"{len(self.records):02d}-{name}.prof"
+                profile.dump_stats(path)
+                record.cprofile = str(path)
+
+    def note(self, **fields: Any) -> None:
+        if self.active:
+            for key, value in fields.items():
+                setattr(self.active[-1], key, value)
+
+    def report(self) -> dict[str, Any]:
+        stages = [
+            {key: value for key, value in asdict(record).items() if key != "traced_peak"} for record in self.records
+        ]
+        return {
+            "totalSeconds": time.perf_counter() - self.started,
+            "peakRssBytes": peak_rss_bytes(),
+            "stages": stages,
+        }
+
+
+PROFILER: StageProfiler | None = None
+
+
+@contextmanager
+def profiling(cprofile_dir: Path | None = None) -> Iterator[StageProfiler]:
+    """Profile every stage run inside the block."""
+    global PROFILER
+    PROFILER = StageProfiler(cprofile_dir)
+    try:
+        yield PROFILER
+    finally:
+        PROFILER = None
+        tracemalloc.stop()
+
+
+def profiling_active() -> bool:
+    return PROFILER is not None
+
+
+def profile_stage(name: str, pixels: int, label: str | None = None) -> ContextManager[Any]:
+    return nullcontext() if PROFILER is None else PROFILER.stage(name, pixels, label)
+
+
+def note_stage(**fields: Any) -> None:
+    if PROFILER is not None:
+        PROFILER.note(**fields)
+
+
+def rgba_array(image: Image.Image) -> np.ndarray:
+    return np.asarray(image if image.mode == "RGBA" else image.convert("RGBA"))
+
+
+def image_digest(image: Image.Image) -> str:
+    digest = hashlib.sha256(f"{image.mode}:{image.size}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+# Module globals that switch how a run caches, profiles or reports, never what a stage computes.
+FINGERPRINT_IGNORED = frozenset(
+    {
+        "PROFILER",
+        "MEMORY_STAGE_CACHE",
+        "CLASSIFIER_LUTS",
+        "SURFACE_CHECKS",
+    }
+)
+
+
+def library_versions() -> str:
+    # Resampling, rounding and deflate output can change between releases of the libraries under the stages.
+    return (
+        f"python={sys.version_info[0]}.{sys.version_info[1]} numpy={np.__version__} "
+        f"pillow={Image.__version__} zlib={zlib.ZLIB_RUNTIME_VERSION}"
+    )
+
+
+def script_module(name: str) -> types.ModuleType | None:
+    """The loaded module called name when it is one of the scripts next to this file."""
+    module = sys.modules.get(name)
+    path = getattr(module, "__file__", None)
+    return module if path is not None and Path(path).resolve().parent == SCRIPT_DIR else None
+
+
+@lru_cache(maxsize=None)
+def module_sources(name: str) -> dict[str, str]:
+    """Source of every top-level function and class in a script module, decorators included, from one parse.
+
+    inspect.getsource re-parses the whole file for each class it is asked about.
+    """
+    text = Path(sys.modules[name].__file__).read_text(encoding="utf-8")
+    lines = text.splitlines(keepends=True)
+    sources = {}
+    for node in ast.parse(text).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            sources[node.name] = "".join(lines[start - 1 : node.end_lineno])
+    return sources
+
+
+def source_of(target: Any) -> str:
+    name = getattr(target, "__module__", None)
+    if script_module(name) is not None and target.__qualname__ in module_sources(name):
+        return module_sources(name)[target.__qualname__]
+    return inspect.getsource(target)
+
+
+@lru_cache(maxsize=None)
+def code_fingerprint(function: Callable[..., Any]) -> str:
+    """Hash of a function's source plus every module-level function, class and constant it reaches.
+
+    Class methods, properties and constants holding code are followed too, and the library versions are
+    part of the hash.
+    """
+    parts: list[str] = [library_versions()]
+    seen: set[int] = set()
+
+    def names_in(code: types.CodeType) -> Iterable[str]:
+        yield from code.co_names
+        for constant in code.co_consts:
+            if isinstance(constant, types.CodeType):
+                yield from names_in(constant)
+
+    def code_of(target: Any) -> Iterator[types.CodeType]:
+        if inspect.isfunction(target):
+            yield target.__code__
+            return
+        for member in vars(target).values():
+            if isinstance(member, (staticmethod, classmethod)):
+                member = member.__func__
+            elif isinstance(member, cached_property):
+                member = member.func
+            if isinstance(member, property):
+                accessors = (member.fget, member.fset, member.fdel)
+                yield from (accessor.__code__ for accessor in accessors if accessor is not None)
+            elif inspect.isfunction(member):
+                yield member.__code__
+
+    def describe(value: Any) -> str | None:
+        """Stable text for a constant, visiting the module's own code it holds; None when it is not a constant."""
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return repr(value)
+        if inspect.isfunction(inspect.unwrap(value)) or inspect.isclass(value):
+            if script_module(value.__module__) is not None:
+                visit(value)
+            return f"{value.__module__}.{value.__qualname__}"
+        if isinstance(value, partial):
+            return f"partial({describe(value.func)},{describe(value.args)},{describe(value.keywords)})"
+        if isinstance(value, (tuple, list)):
+            return "(" + ",".join(describe(item) or type(item).__qualname__ for item in value) + ")"
+        if isinstance(value, (set, frozenset)):
+            return "{" + ",".join(sorted(describe(item) or type(item).__qualname__ for item in value)) + "}"
+        if isinstance(value, dict):
+            items = (f"{describe(key)}:{describe(item) or type(item).__qualname__}" for key, item in value.items())
+            return "{" + ",".join(items) + "}"
+        if isinstance(value, np.ndarray):
+            return f"array({value.dtype},{value.shape},{hashlib.sha256(value.tobytes()).hexdigest()})"
+        if is_dataclass(value):
+            fields_text = ",".join(f"{item.name}={describe(getattr(value, item.name))}" for item in fields(value))
+            return f"{type(value).__qualname__}({fields_text})"
+        return None
+
+    def visit(target: Any) -> None:
+        target = inspect.unwrap(target)
+        if id(target) in seen:
+            return
+        seen.add(id(target))
+        parts.append(source_of(target))
+        if inspect.isfunction(target):
+            parts.append(f"defaults={describe(target.__defaults__)} {describe(target.__kwdefaults__)}")
+        if inspect.isclass(target):
+            for base in target.__bases__:
+                if script_module(base.__module__) is not None:
+                    visit(base)
+        module = vars(script_module(target.__module__))
+        for code in code_of(target):
+            for name in sorted(set(names_in(code))):
+                if name in module and name not in FINGERPRINT_IGNORED:
+                    text = describe(module[name])
+                    if text is not None:
+                        parts.append(f"{name}={text}")
+
+    visit(function)
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class MemoryStageCache:
+    """In-process stage results for --watch; entries one rebuild does not touch are dropped after it."""
+
+    def __init__(self) -> None:
+        self.entries: dict[str, Any] = {}
+        self.used: set[str] = set()
+
+    def get(self, name: str) -> tuple[bool, Any]:
+        if name not in self.entries:
+            return False, None
+        self.used.add(name)
+        return True, self.entries[name]
+
+    def put(self, name: str, value: Any) -> None:
+        self.entries[name] = value
+        self.used.add(name)
+
+    def prune(self) -> None:
+        self.entries = {name: self.entries[name] for name in self.used}
+        self.used = set()
+
+
+MEMORY_STAGE_CACHE: MemoryStageCache | None = None
+
+
+@contextmanager
+def stages_in_memory() -> Iterator[MemoryStageCache]:
+    """Keep stage results and decoded references in this process for the duration of the block."""
+    global MEMORY_STAGE_CACHE
+    MEMORY_STAGE_CACHE = MemoryStageCache()
+    try:
+        yield MEMORY_STAGE_CACHE
+    finally:
+        MEMORY_STAGE_CACHE = None
+
+
+def open_reference(path: Path) -> Image.Image:
+    """Decode a reference master, reusing the decoded pixels across watch rebuilds while the file is unchanged."""
+    if MEMORY_STAGE_CACHE is None:
+        return Image.open(path)
+    stat = path.stat()
+    name = f"reference-{path}-{stat.st_size}-{stat.st_mtime_ns}"
+    found, image = MEMORY_STAGE_CACHE.get(name)
+    if not found:
+        image = Image.open(path)
+        image.load()
+        MEMORY_STAGE_CACHE.put(name, image)
+    return image
+
+
+def run_stage(
+    function: Callable[..., Any],
+    *images: Image.Image,
+    caches: DiskCaches | None = None,
+    **params: Any,
+) -> Any:
+    """Call a pipeline stage, reusing a stored result when its code, input pixels and parameters are unchanged.
+
+    Results are stored under ``caches``, which is also passed on to stages that take a ``caches`` parameter of
+    their own; it says where to cache, not what to compute, so it is not part of the key.
+    """
+    with profile_stage(function.__name__, sum(image.width * image.height for image in images)):
+        return run_cached_stage(function, *images, caches=caches, **params)
+
+
+def run_cached_stage(
+    function: Callable[..., Any],
+    *images: Image.Image,
+    caches: DiskCaches | None = None,
+    **params: Any,
+) -> Any:
+    call = partial(function, *images, **params)
+    if "caches" in inspect.signature(function).parameters:
+        call = partial(call, caches=caches)
+    if caches is None and MEMORY_STAGE_CACHE is None:
+        return call()
+    key = hashlib.sha256(code_fingerprint(function).encode())
+    for image in images:
+        key.update(image_digest(image).encode())
+    key.update(repr(sorted(params.items())).encode())
+    name = f"{function.__name__}-{key.hexdigest()[:24]}"
+    if MEMORY_STAGE_CACHE is None:
+        return run_disk_cached_stage(name, call, caches)
+    found, result = MEMORY_STAGE_CACHE.get(name)
+    if found:
+        note_stage(cached=True)
+        return result
+    result = run_disk_cached_stage(name, call, caches)
+    MEMORY_STAGE_CACHE.put(name, result)
+    return result
+
+
+def run_disk_cached_stage(name: str, call: Callable[[], Any], caches: DiskCaches | None) -> Any:
+    if caches is None:
+        return call()
+    path = caches.stages / f"{name}.npz"
+    if path.exists():
+        with np.load(path) as stored:
+            layout = json.loads(str(stored["layout"]))
+            values = [
+                (
+                    Image.fromarray(stored[f"image{index}"])
+                    if item == "image"
+                    else stored[f"array{index}"] if item == "array" else item["value"]
+                )
+                for index, item in enumerate(layout["items"])
+            ]
+        note_stage(cached=True)
+        return tuple(values) if layout["tuple"] else values[0]
+
+    result = call()
+    values = result if isinstance(result, tuple) else (result,)
+    arrays: dict[str, np.ndarray] = {}
+    items: list[Any] = []
+    for index, value in enumerate(values):
+        if isinstance(value, Image.Image):
+            arrays[f"image{index}"] = np.asarray(value.convert("RGBA"))
+            items.append("image")
+        elif isinstance(value, np.ndarray):
+            arrays[f"array{index}"] = value
+            items.append("array")
+        else:
+            items.append({"value": value})
+    layout = {"tuple": isinstance(result, tuple), "items": items}
+    caches.write(path, lambda handle: np.savez(handle, layout=np.array(json.dumps(layout)), **arrays))
+    return result
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+from PIL import Image
+
+from logo_cleaning import (
+    CANVAS_SIZE,
+    EDGE_MATTE_SEARCH_RADIUS,
+    EDGE_MATTE_TOP_BAND,
+    REPAIR_MAX_PASSES,
+    SCRATCH_REACH_X,
+    SCRATCH_REACH_Y,
+    SCRATCH_SEARCH_RADIUS,
+    SURFACE_OUTLIER_CLUSTER_LIMIT,
+    SURFACE_OUTLIER_COUNT_LIMIT,
+    SURFACE_SEARCH_RADIUS,
+    SURFACE_WINDOW_RADIUS,
+    DonorIndex,
+    alpha_scratch_mask,
+    bfs_source_origins,
+    box_offsets,
+    fill_unreached,
+    finish_lettermark_in_place,
+    influence_points,
+    outer_edge_matte_mask,
+    red_contam_mask,
+    reference_foreground_pixels,
+    repair_alpha_scratches_in_place,
+    repair_outer_edge_matte_in_place,
+    surface_outlier_mask,
+    surface_outlier_points,
+    surface_replacements,
+)
+from logo_stages import note_stage, profile_stage
+
+FILL_TILE_HALO = 32  # starting halo for the fill; doubled until every core pixel's breadth-first ball fits
+EDGE_MATTE_TILE_HALO = 2 + EDGE_MATTE_SEARCH_RADIUS
+SCRATCH_TILE_HALO = REPAIR_MAX_PASSES * (max(SCRATCH_REACH_X, SCRATCH_REACH_Y) + SCRATCH_SEARCH_RADIUS)
+SURFACE_DETECT_TILE_HALO = 5  # the 7x7 window plus the 5px border the outlier test never evaluates
+SURFACE_REPAIR_TILE_HALO = SURFACE_SEARCH_RADIUS
+TILED_POINT_CHUNK = 4096  # outlier tests per batch; each holds a 48-neighbour int64 window
+
+
+def tile_boxes(height: int, width: int, tile: int) -> Iterator[tuple[int, int, int, int]]:
+    for y0 in range(0, height, tile):
+        for x0 in range(0, width, tile):
+            yield y0, x0, min(y0 + tile, height), min(x0 + tile, width)
+
+
+def halo_box(box: tuple[int, int, int, int], halo: int, height: int, width: int) -> tuple[int, int, int, int]:
+    y0, x0, y1, x1 = box
+    return max(0, y0 - halo), max(0, x0 - halo), min(height, y1 + halo), min(width, x1 + halo)
+
+
+def map_tiles(
+    source: np.ndarray,
+    target: np.ndarray,
+    tile: int,
+    halo: int,
+    transform: Callable[[np.ndarray, int], object],
+) -> None:
+    """Run the in-place transform(window, window_top) on a copy of each haloed tile and write back its core.
+
+    Source and target must be different buffers."""
+    height, width = source.shape[:2]
+    for box in tile_boxes(height, width, tile):
+        y0, x0, y1, x1 = box
+        wy0, wx0, wy1, wx1 = halo_box(box, halo, height, width)
+        window = np.array(source[wy0:wy1, wx0:wx1])
+        transform(window, wy0)
+        target[y0:y1, x0:x1] = window[y0 - wy0 : y1 - wy0, x0 - wx0 : x1 - wx0]
+
+
+def count_tiles(source: np.ndarray, tile: int, halo: int, mask: Callable[[np.ndarray, int], np.ndarray]) -> int:
+    height, width = source.shape[:2]
+    total = 0
+    for box in tile_boxes(height, width, tile):
+        y0, x0, y1, x1 = box
+        wy0, wx0, wy1, wx1 = halo_box(box, halo, height, width)
+        selected = mask(np.array(source[wy0:wy1, wx0:wx1]), wy0)
+        total += int(np.count_nonzero(selected[y0 - wy0 : y1 - wy0, x0 - wx0 : x1 - wx0]))
+    return total
+
+
+def tile_points(
+    source: np.ndarray,
+    tile: int,
+    halo: int,
+    mask: Callable[[np.ndarray], np.ndarray],
+) -> tuple[np.ndarray, np.ndarray]:
+    """Raster-ordered (ys, xs) of a mask evaluated tile by tile."""
+    height, width = source.shape[:2]
+    keys = []
+    for box in tile_boxes(height, width, tile):
+        y0, x0, y1, x1 = box
+        wy0, wx0, wy1, wx1 = halo_box(box, halo, height, width)
+        ys, xs = np.nonzero(mask(np.array(source[wy0:wy1, wx0:wx1]))[y0 - wy0 : y1 - wy0, x0 - wx0 : x1 - wx0])
+        keys.append((ys + y0) * width + xs + x0)
+    return np.divmod(np.sort(np.concatenate(keys)), width)
+
+
+def point_cluster_sizes(ys: np.ndarray, xs: np.ndarray, width: int) -> np.ndarray:
+    """4-connected component sizes of a sparse point set, without a canvas-sized mask."""
+    keys = ys.astype(np.int64) * width + xs
+    order = np.argsort(keys)
+    keys = keys[order]
+    pairs = []
+    for step, valid in ((1, xs[order] < width - 1), (width, np.ones(keys.size, dtype=bool))):
+        index = np.minimum(np.searchsorted(keys, keys + step), keys.size - 1)
+        linked = np.flatnonzero(valid & (keys[index] == keys + step))
+        pairs.append((linked, index[linked]))
+    upper = np.concatenate([upper for upper, _ in pairs])
+    lower = np.concatenate([lower for _, lower in pairs])
+    parent = np.arange(keys.size)
+    while upper.size:
+        left, right = parent[upper], parent[lower]
+        if np.array_equal(left, right):
+            break
+        np.minimum.at(parent, np.maximum(left, right), np.minimum(left, right))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return np.unique(parent, return_counts=True)[1]
+
+
+def point_bounds(ys: np.ndarray, xs: np.ndarray) -> str:
+    if not ys.size:
+        return "none"
+    return f"({xs.min()},{ys.min()})-({xs.max()},{ys.max()})"
+
+
+def window_reach(
+    ys: np.ndarray, xs: np.ndarray, window: tuple[int, int, int, int], height: int, width: int
+) -> np.ndarray:
+    """Per window-relative point, the Chebyshev distance that stays inside the window or ends at the image edge."""
+    wy0, wx0, wy1, wx1 = window
+    unbounded = np.full(ys.shape, np.iinfo(np.int64).max)
+    return np.minimum.reduce([
+        ys if wy0 > 0 else unbounded,
+        (wy1 - wy0 - 1 - ys) if wy1 < height else unbounded,
+        xs if wx0 > 0 else unbounded,
+        (wx1 - wx0 - 1 - xs) if wx1 < width else unbounded,
+    ])
+
+
+def tiled_nearest_non_red_fill(source: np.ndarray, target: np.ndarray, tile: int) -> tuple[int, int]:
+    """Breadth-first fill per tile, then the scalar fallback for red pixels no source reaches, with tiled donor queries.
+
+    A core pixel filled at breadth-first distance d depends only on pixels within Chebyshev distance d, so each
+    tile's halo grows until every core pixel's ball fits inside its window or the window reaches the image edge.
+    A red pixel is unreachable once its red component closes inside the window. Working memory is one window
+    plus arrays sized by the red pixel count, except where a red component or a donor gap spans the canvas.
+    """
+    height, width = source.shape[:2]
+    targets: list[np.ndarray] = []
+    unreached: list[np.ndarray] = []
+    for box in tile_boxes(height, width, tile):
+        y0, x0, y1, x1 = box
+        core = np.array(source[y0:y1, x0:x1])
+        target_y, target_x = np.nonzero(red_contam_mask(core))
+        halo = FILL_TILE_HALO
+        closed = np.zeros(target_y.size, dtype=bool)
+        while target_y.size:
+            wy0, wx0, wy1, wx1 = window = halo_box(box, halo, height, width)
+            pixels = np.array(source[wy0:wy1, wx0:wx1])
+            red = red_contam_mask(pixels)
+            levels = np.zeros(red.size, dtype=np.int64)
+            origin = bfs_source_origins(red, ~red & (pixels[..., 3] > 40), levels)
+            ty, tx = target_y + (y0 - wy0), target_x + (x0 - wx0)
+            flat = ty * (wx1 - wx0) + tx
+            reached = origin[flat] >= 0
+            closed[:] = False
+            if not reached.all():
+                # Red reaching a window edge inside the image may yet meet a source beyond it.
+                edges = np.zeros(red.shape, dtype=bool)
+                edges[0, :], edges[-1, :], edges[:, 0], edges[:, -1] = wy0 > 0, wy1 < height, wx0 > 0, wx1 < width
+                closed = ~reached & (bfs_source_origins(red, red & edges)[flat] < 0)
+            if (closed | (reached & (levels[flat] <= window_reach(ty, tx, window, height, width)))).all():
+                rows = pixels.reshape(-1, 4)
+                rows[flat[reached]] = rows[origin[flat[reached]]]
+                core = pixels[y0 - wy0 : y1 - wy0, x0 - wx0 : x1 - wx0]
+                break
+            halo *= 2
+        target[y0:y1, x0:x1] = core
+        keys = (target_y + y0) * width + target_x + x0
+        targets.append(keys)
+        unreached.append(keys[closed])
+
+    red_before = int(sum(keys.size for keys in targets))
+    leftovers = np.sort(np.concatenate(unreached))
+    if leftovers.size:
+        leftover_y, leftover_x = np.divmod(leftovers, width)
+        donor_y, donor_x, radius = tiled_donor_nearest(target, leftover_y, leftover_x, tile)
+        fill_unreached(target, leftover_y, leftover_x, donor_y, donor_x, radius)
+    red_after = count_tiles(target, tile, 0, lambda window, _: red_contam_mask(window))
+    return red_before, red_after
+
+
+def tiled_donor_nearest(
+    pixels: np.ndarray, ys: np.ndarray, xs: np.ndarray, tile: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """DonorIndex.nearest over the fill's donor mask, one haloed tile window at a time.
+
+    Each tile's halo doubles until every point's ring lies inside the window or is clipped by the image edge.
+    """
+    height, width = pixels.shape[:2]
+    donor_y, donor_x = ys.copy(), xs.copy()
+    radius = np.full(ys.shape, -1, dtype=np.int64)
+    for box in tile_boxes(height, width, tile):
+        y0, x0, y1, x1 = box
+        group = np.flatnonzero((ys >= y0) & (ys < y1) & (xs >= x0) & (xs < x1))
+        halo = FILL_TILE_HALO
+        while group.size:
+            wy0, wx0, wy1, wx1 = window = halo_box(box, halo, height, width)
+            crop = np.array(pixels[wy0:wy1, wx0:wx1])
+            donors = (crop[..., 3] > 40) & ~red_contam_mask(crop)
+            donor_index = DonorIndex(donors, (wy0, wx0))
+            found_y, found_x, found = donor_index.nearest(ys[group], xs[group], max(width, height) - 1)
+            reach = window_reach(ys[group] - wy0, xs[group] - wx0, window, height, width)
+            if window == (0, 0, height, width) or ((found > 0) & (found <= reach)).all():
+                donor_y[group], donor_x[group], radius[group] = found_y, found_x, found
+                break
+            halo *= 2
+    return donor_y, donor_x, radius
+
+
+def tiled_repair_lettermark_surface_outliers(pixels: np.ndarray, tile: int) -> tuple[int, int, int, str]:
+    """Surface repair in place on ``pixels``, one tiled sweep per pass so the pass limits stay global."""
+    height, width = pixels.shape[:2]
+    ys, xs = tile_points(
+        pixels, tile, SURFACE_DETECT_TILE_HALO, lambda window: surface_outlier_mask(window, TILED_POINT_CHUNK)
+    )
+    before = int(ys.size)
+    note_stage(passes=0)
+    if not before:
+        return 0, 0, 0, "none"
+    before_largest = int(point_cluster_sizes(ys, xs, width).max())
+    if before <= SURFACE_OUTLIER_COUNT_LIMIT and before_largest <= SURFACE_OUTLIER_CLUSTER_LIMIT:
+        return before, before, before_largest, point_bounds(ys, xs)
+
+    outliers = set(zip(xs.tolist(), ys.tolist()))
+    influence = box_offsets(SURFACE_WINDOW_RADIUS)
+    for passes in range(1, REPAIR_MAX_PASSES + 1):
+        if not outliers:
+            break
+        xs, ys = (np.array(axis, dtype=np.int64) for axis in zip(*outliers))
+        if (
+            len(outliers) <= SURFACE_OUTLIER_COUNT_LIMIT
+            and point_cluster_sizes(ys, xs, width).max() <= SURFACE_OUTLIER_CLUSTER_LIMIT
+        ):
+            break
+        note_stage(passes=passes)
+        # Donor searches skip every selected pixel, so each tile's replacements can land in place immediately.
+        changed_by_tile: list[list[tuple[int, int]]] = []
+        for box in tile_boxes(height, width, tile):
+            y0, x0, y1, x1 = box
+            in_core = (ys >= y0) & (ys < y1) & (xs >= x0) & (xs < x1)
+            if not in_core.any():
+                continue
+            wy0, wx0, wy1, wx1 = halo_box(box, SURFACE_REPAIR_TILE_HALO, height, width)
+            window = np.array(pixels[wy0:wy1, wx0:wx1])
+            in_window = (ys >= wy0) & (ys < wy1) & (xs >= wx0) & (xs < wx1)
+            selected = np.zeros(window.shape[:2], dtype=bool)
+            selected[ys[in_window] - wy0, xs[in_window] - wx0] = True
+            core_y, core_x = ys[in_core], xs[in_core]
+            colours, found = surface_replacements(window, core_y - wy0, core_x - wx0, selected)
+            pixels[core_y[found], core_x[found]] = colours[found]
+            if found.any():
+                changed_by_tile.append(list(zip(core_x[found].tolist(), core_y[found].tolist())))
+        if not changed_by_tile:
+            break
+        # Re-test per tile once the whole pass has landed; overlapping influence is re-tested with the same result.
+        for changed in changed_by_tile:
+            check_y, check_x = influence_points(changed, influence, width, height)
+            inside = (check_x >= 5) & (check_y >= 5) & (check_x < width - 5) & (check_y < height - 5)
+            outliers.difference_update(zip(check_x.tolist(), check_y.tolist()))
+            check_y, check_x = check_y[inside], check_x[inside]
+            found = surface_outlier_points(pixels, check_y, check_x, TILED_POINT_CHUNK)
+            outliers.update(zip(check_x[found].tolist(), check_y[found].tolist()))
+
+    if not outliers:
+        return before, 0, 0, "none"
+    xs, ys = (np.array(axis, dtype=np.int64) for axis in zip(*outliers))
+    return before, len(outliers), int(point_cluster_sizes(ys, xs, width).max()), point_bounds(ys, xs)
+
+
+def scratch_path(directory: Path, name: str, shape: tuple[int, ...]) -> np.ndarray:
+    return np.lib.format.open_memmap(directory / f"{name}.npy", mode="w+", dtype=np.uint8, shape=shape)
+
+
+def extract_reference_foreground_tiled(
+    reference: Image.Image,
+    tile: int,
+    directory: Path,
+    canvas_size: int = CANVAS_SIZE,
+) -> tuple[np.ndarray, tuple[int, int, int, int]]:
+    """extract_reference_foreground one tile at a time into a memmap, with visible_bounds of the result."""
+    source = reference.convert("RGBA")
+    if source.size != (canvas_size, canvas_size):
+        source = source.resize((canvas_size, canvas_size), Image.Resampling.LANCZOS)
+    width, height = source.size
+    foreground = scratch_path(directory, "foreground", (height, width, 4))
+    rows = np.zeros(height, dtype=bool)
+    columns = np.zeros(width, dtype=bool)
+    with profile_stage("extract_reference_foreground", width * height, label="tiled"):
+        for y0, x0, y1, x1 in tile_boxes(height, width, tile):
+            pixels = reference_foreground_pixels(np.asarray(source.crop((x0, y0, x1, y1))))
+            foreground[y0:y1, x0:x1] = pixels
+            visible = pixels[..., 3] > 0
+            rows[y0:y1] |= visible.any(axis=1)
+            columns[x0:x1] |= visible.any(axis=0)
+    if not rows.any():
+        raise ValueError("source has no visible pixels")
+    row_index, column_index = np.flatnonzero(rows), np.flatnonzero(columns)
+    return foreground, (int(column_index[0]), int(row_index[0]), int(column_index[-1]) + 1, int(row_index[-1]) + 1)
+
+
+def clean_foreground_tiled(
+    foreground: np.ndarray,
+    tile: int,
+    directory: Path,
+) -> tuple[np.ndarray, tuple[int, int], tuple[int, int], tuple[int, int], tuple[int, int, int, str]]:
+    """The cleaning chain from nearest_non_red_fill to clear_transparent_rgb over disk-backed tiles.
+
+    Working memory is bounded by the tile size plus each stage's halo instead of the canvas size, and the result
+    matches the untiled chain exactly. Returns the cleaned pixels (a memmap in ``directory``) and the
+    fill, edge matte, scratch and surface statistics in the untiled stages' order.
+    """
+    height, width = foreground.shape[:2]
+    top_band = min(EDGE_MATTE_TOP_BAND, height)
+    front, back = scratch_path(directory, "front", foreground.shape), scratch_path(directory, "back", foreground.shape)
+
+    with profile_stage("nearest_non_red_fill", height * width, label="tiled"):
+        fill = tiled_nearest_non_red_fill(foreground, front, tile)
+
+    def edge_matte(window: np.ndarray, top: int) -> np.ndarray:
+        return outer_edge_matte_mask(window, max(0, top_band - top))
+
+    with profile_stage("repair_outer_edge_matte", height * width, label="tiled"):
+        edge_before = count_tiles(front, tile, 2, edge_matte)
+        map_tiles(
+            front,
+            back,
+            tile,
+            EDGE_MATTE_TILE_HALO,
+            lambda window, top: repair_outer_edge_matte_in_place(window, top_band - top),
+        )
+        edge_after = count_tiles(back, tile, 2, edge_matte)
+
+    scratch_reach = max(SCRATCH_REACH_X, SCRATCH_REACH_Y)
+    with profile_stage("repair_alpha_scratches", height * width, label="tiled"):
+        scratch_before = count_tiles(back, tile, scratch_reach, lambda window, _: alpha_scratch_mask(window[..., 3]))
+        map_tiles(
+            back,
+            front,
+            tile,
+            SCRATCH_TILE_HALO,
+            lambda window, _: repair_alpha_scratches_in_place(window),
+        )
+        scratch_after = count_tiles(front, tile, scratch_reach, lambda window, _: alpha_scratch_mask(window[..., 3]))
+
+    with profile_stage("repair_lettermark_surface_outliers", height * width, label="tiled"):
+        surface = tiled_repair_lettermark_surface_outliers(front, tile)
+
+    with profile_stage("polish_lettermark", height * width, label="tiled"):
+        map_tiles(front, back, tile, 0, lambda window, _: finish_lettermark_in_place(window))
+    back.flush()
+    return back, fill, (edge_before, edge_after), (scratch_before, scratch_after), surface
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from pathlib import Path
+from typing import Iterable
+
+from generate_logo_assets import (
+    AssetBundle,
+    AssetConfig,
+    Brand,
+    CleanReference,
+    OutputFile,
+    clean_reference,
+    default_brand,
+    write_outputs,
+)
+from logo_batch import BrandResult, load_batch_config, print_brand_results, run_brand
+from logo_png import png_cached
+from logo_stages import SCRIPT_DIR, DiskCaches, stages_in_memory
+
+WATCH_INTERVAL = 0.25  # seconds between polls when inotify is unavailable
+WATCH_SETTLE = 0.25  # a changed file must keep the same size and mtime this long before a rebuild
+WATCH_DECODE_ATTEMPTS = 4  # reads of a reference that fails to decode, WATCH_SETTLE apart, before a cycle reports it
+WATCH_DRAFT_ASSETS = ("padded-logo", "favicon")  # written first, with the fast encoder, on every watch cycle
+
+INOTIFY_EVENTS = 0x2 | 0x4 | 0x8 | 0x80 | 0x100 | 0x200  # modify, attrib, close-write, moved-to, create, delete
+
+
+def write_brand_drafts(brand: Brand, cleaned: CleanReference, caches: DiskCaches | None) -> None:
+    """Default-encoded previews of the WATCH_DRAFT_ASSETS whose optimized encoding is not cached yet."""
+    bundle = AssetBundle(cleaned, brand.palette, caches)
+    assets = {output.asset for output in brand.outputs}
+    images = {asset: bundle.image(asset) for asset in WATCH_DRAFT_ASSETS if asset in assets}
+    pending = {asset for asset, image in images.items() if not png_cached(image, caches)}
+    drafts = [OutputFile(output.path, images[output.asset]) for output in brand.outputs if output.asset in pending]
+    if drafts:
+        for line in write_outputs(drafts, caches, draft=True).lines():
+            print(line)
+
+
+def file_signature(path: Path) -> tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def open_inotify(directories: Iterable[Path]) -> int | None:
+    """A non-blocking inotify descriptor on ``directories``, or None where inotify is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if descriptor < 0:
+        return None
+    for directory in directories:
+        if libc.inotify_add_watch(descriptor, os.fsencode(directory), INOTIFY_EVENTS) < 0:
+            os.close(descriptor)
+            return None
+    return descriptor
+
+
+def wait_for_change(paths: list[Path], seen: dict[Path, tuple[int, int] | None]) -> dict[Path, tuple[int, int] | None]:
+    """Block until a watched file's size or mtime differs from ``seen`` and has settled; returns the new signatures.
+
+    Directories rather than files are watched because editors save by replacing the file. Any event only
+    triggers a signature comparison, so unrelated files in the same directories cost a wake-up, not a rebuild.
+    """
+    descriptor = open_inotify({path.parent for path in paths if path.parent.is_dir()})
+    try:
+        while True:
+            current = {path: file_signature(path) for path in paths}
+            if current != seen:
+                time.sleep(WATCH_SETTLE)
+                if {path: file_signature(path) for path in paths} == current:
+                    return current
+                continue
+            if descriptor is None:
+                time.sleep(WATCH_INTERVAL)
+                continue
+            select.select([descriptor], [], [])
+            try:
+                while os.read(descriptor, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+    finally:
+        if descriptor is not None:
+            os.close(descriptor)
+
+
+def clean_saved_reference(reference: Path, config: AssetConfig) -> CleanReference:
+    """clean_reference for a master an editor may still be writing: a failed decode is retried before it is reported.
+
+    Saving in place can pause mid-write for longer than WATCH_SETTLE, leaving a file Pillow cannot identify or
+    finds truncated.
+    """
+    for _ in range(WATCH_DECODE_ATTEMPTS - 1):
+        try:
+            return clean_reference(reference, config)
+        except OSError:  # UnidentifiedImageError and truncated-file errors are both OSErrors
+            time.sleep(WATCH_SETTLE)
+    return clean_reference(reference, config)
+
+
+def rebuild(brands: list[Brand], config: AssetConfig, cycle: int) -> None:
+    """One watch cycle: drafts of the preview assets first, then every brand in full, reusing in-memory stages."""
+    start = time.perf_counter()
+    cleaned: dict[Path, CleanReference] = {}
+    results: list[BrandResult] = []
+    for brand in brands:
+        try:
+            if brand.reference not in cleaned:
+                cleaned[brand.reference] = clean_saved_reference(brand.reference, config)
+            write_brand_drafts(brand, cleaned[brand.reference], config.caches)
+        except (Exception, SystemExit) as failure:  # a half-saved master must not stop the watcher
+            results.append(BrandResult(brand.name, f"{type(failure).__name__}: {failure}", 0.0, []))
+    draft_seconds = time.perf_counter() - start
+    failed = {result.name for result in results}
+    results += [
+        run_brand(brand, cleaned[brand.reference], False, config.caches) for brand in brands if brand.name not in failed
+    ]
+    results.sort(key=lambda result: [brand.name for brand in brands].index(result.name))
+    print_brand_results(results)
+    failures = sum(1 for result in results if result.error)
+    print(
+        f"watch cycle={cycle} brands={len(results)} ok={len(results) - failures} failed={failures} "
+        f"draftSeconds={draft_seconds:.2f} seconds={time.perf_counter() - start:.2f}"
+    )
+
+
+def script_files() -> list[Path]:
+    """The loaded modules that live in scripts/, so an edit to any of them restarts the watcher."""
+    files = [getattr(module, "__file__", None) for module in list(sys.modules.values())]
+    paths = {Path(file).resolve() for file in files if file}
+    return sorted(path for path in paths if path.parent == SCRIPT_DIR)
+
+
+def watch(batch: Path | None, web_icons: bool, config: AssetConfig) -> None:
+    """Rebuild whenever the reference masters or the batch config change; a change to these scripts restarts it."""
+    scripts = script_files()
+    built: dict[Path, tuple[int, int] | None] | None = None
+    cycle = 0
+    with stages_in_memory() as memory:
+        while True:
+            watched = scripts + ([batch] if batch is not None else [])
+            try:
+                brands = load_batch_config(batch) if batch is not None else [default_brand(web_icons)]
+            except (OSError, ValueError, KeyError, TypeError) as failure:
+                print(f"watch error=config {type(failure).__name__}: {failure}")
+                brands = []
+            watched += list(dict.fromkeys(brand.reference for brand in brands))
+            signatures = {path: file_signature(path) for path in watched}
+            if built is not None and any(signatures[script] != built[script] for script in scripts):
+                print("watch restart reason=script-changed", flush=True)
+                os.execv(sys.executable, [sys.executable, *sys.argv])
+            if brands:
+                cycle += 1
+                rebuild(brands, config, cycle)
+                memory.prune()
+            built = signatures
+            print(f"watch waiting files={len(watched)}", flush=True)
+            wait_for_change(watched, signatures)